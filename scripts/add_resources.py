@@ -0,0 +1,131 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import numpy
+import os
+import sys
+
+from lib import csv, resources
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Read a tab-separated CSV file (as in the output from minimantics)
+        from stdin and output the same file on stdout, with one extra
+        column per reference resource and an `any` column (the sum of
+        all resources), as `src/old/get_neighbours.py`. Each value is the
+        count of the (target, neighbor) pair in a resource index built
+        by `build_resource_index.py` (nonzero iff they are related).
+
+        The output can be evaluated by `eval_thesaurus.py`.""")
+parser.add_argument("-r", "--resources", nargs="+", default=None,
+        type=unicode, metavar="SPEC",
+        help="""Columns to add, as resource names, or NAME=RES1+RES2+...
+        for a column with the sum of several resources (e.g.
+        `wn_1=wn_syn+wn_hyper+wn_hypo+wn_mero+wn_sibling+wn_anto`, as
+        the old script). Default: one column per indexed resource.""")
+parser.add_argument("--target-column", default=None, type=unicode,
+        help="""Column name of the targets (default: first column).""")
+parser.add_argument("--neighbor-column", default="neighbor", type=unicode,
+        help="""Column name of the neighbors (default: neighbor).""")
+parser.add_argument("--batch-size", type=int, default=csv.DEFAULT_BATCH_SIZE,
+        help="""Number of lines looked up at once
+        (default: {}).""".format(csv.DEFAULT_BATCH_SIZE))
+parser.add_argument("index_dir",
+        help="""A resource index, written by `build_resource_index.py`.""")
+
+
+class ResourceAdder(csv.CSVHandler):
+    r"""Add resource columns to blocks of lines (through
+    `csv.parse_csv_batches`): the words of a whole block are mapped to
+    ids and looked up at once, without being decoded."""
+
+    def __init__(self, args):
+        self.args = args
+        self.index = resources.ResourceIndex(args.index_dir)
+        specs = args.resources or self.index.resources
+        self.columns_resources = [self.parse_spec(spec) for spec in specs]
+        # Resources looked up in each batch (each one counts once in `any`)
+        self.used_resources = sorted(set(r for (_, rs)
+                in self.columns_resources for r in rs))
+        self.template = b"\t%d" * (len(self.columns_resources)+1) + b"\n"
+
+    def parse_spec(self, spec):
+        r"""Return (column_name, [resources]) for a `--resources` spec."""
+        name, _, sum_spec = spec.partition("=")
+        ret = name, (sum_spec or name).split("+")
+        for resource in ret[1]:
+            if resource not in self.index.kinds:
+                parser.error("Unknown resource {!r} (indexed: {})".format(
+                        resource, " ".join(self.index.resources)))
+        return ret
+
+    def handle_comment(self, line):
+        print(line.encode('utf8'))
+
+    def handle_header(self, line, header_list):
+        target_col = self.args.target_column or header_list[0]
+        for col in (target_col, self.args.neighbor_column):
+            if col not in header_list:
+                raise Exception("Missing column: {}".format(col))
+        self.columns = [target_col, self.args.neighbor_column]
+        print(line.encode('utf8'), *([name for (name, _) in
+                self.columns_resources] + ["any"]), sep="\t")
+
+    def handle_batch(self, batch):
+        index = self.index
+        ids1 = index.word_ids(batch.raw(self.columns[0]))
+        ids2 = index.word_ids(batch.raw(self.columns[1]))
+        counts = {r: index.counts(r, ids1, ids2) for r in self.used_resources}
+        columns = [sum(counts[r] for r in rs) for (_, rs) in self.columns_resources]
+        columns.append(sum(counts.values()))
+        # Most lines share a few distinct rows of values (e.g. all zeros),
+        # whose text is formatted once and interleaved with the lines
+        matrix = numpy.column_stack(columns)
+        _, first, inverse = numpy.unique(_row_keys(matrix),
+                return_index=True, return_inverse=True)
+        suffixes = [self.template % tuple(row) for row in matrix[first].tolist()]
+        output = [None] * (2 * len(batch))
+        output[0::2] = batch.lines
+        output[1::2] = map(suffixes.__getitem__, inverse.tolist())
+        sys.stdout.write(b"".join(output))
+
+
+def _row_keys(matrix):
+    r"""Return an array with one integer per row of `matrix` (a matrix of
+    nonnegative integers), equal for equal rows."""
+    try:
+        return numpy.ravel_multi_index(matrix.T, matrix.max(axis=0) + 1)
+    except ValueError:  # Too many combinations for an int64
+        return numpy.unique(matrix, axis=0, return_inverse=True)[1]
+
+
+#####################################################
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    csv.parse_csv_batches(ResourceAdder(args), batch_size=args.batch_size)
@@ -40,17 +40,32 @@ parser = argparse.ArgumentParser(description="""
         """)
 parser.add_argument("-k", "--best-k", type=int, default=float('inf'),
         help="""Output only first K entries for each `target`.""")
-parser.add_argument("embeddings_file", type=argparse.FileType('r'),
+parser.add_argument("--batch-size", type=int, default=csv.DEFAULT_BATCH_SIZE,
+        help="""Number of lines whose cosines are calculated at once
+        (default: {}).""".format(csv.DEFAULT_BATCH_SIZE))
+parser.add_argument("--binary", action="store_true", default=None,
+        help="""The embeddings file is in binary word2vec format
+        (default: only if its name ends in `.bin`).""")
+parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+        help="""Do not read or write the `<embeddings_file>.npy` cache.
+        (By default, embeddings are parsed only once, and memory-mapped
+        from this cache afterwards).""")
+parser.add_argument("embeddings_file",
         help="""A file of embeddings: each line has 'word x1 x2 x2 ... xN'""")
 
 
 class EmbeddingsCmpAdder(csv.CSVHandler):
+    r"""Add a `w2v_cosine` column to blocks of lines (through
+    `csv.parse_csv_batches`): the cosines of a whole block are
+    calculated at once, and the lines are printed in input order."""
+    columns = ["target", "neighbor"]
+
     def __init__(self, args):
         self.args = args
         self.current_target = None
         self.current_target_count = 0
-        self.embedding_set = embeddings.EmbeddingSet()
-        self.embedding_set.add_from(args.embeddings_file)
+        self.embedding_set = embeddings.EmbeddingSet.load(args.embeddings_file,
+                binary=args.binary, use_cache=args.use_cache)
 
     def handle_comment(self, line):
         print(line.encode('utf8'))
@@ -58,27 +73,28 @@ class EmbeddingsCmpAdder(csv.CSVHandler):
     def handle_header(self, line, header_list):
         print(line.encode('utf8'), "w2v_cosine",  sep="\t")
 
-    def handle_data(self, line, data_namedtuple):
-        target = data_namedtuple.target
-        neighbor = data_namedtuple.neighbor
-        if target != self.current_target:
-            self.current_target = target
-            self.current_target_count = 0
-        self.current_target_count += 1
-        if self.current_target_count <= self.args.best_k:
-            cosine = "{0:.10f}".format(self.compare(target, neighbor))
-            print("\t".join(data_namedtuple).encode('utf8') + "\t" + cosine)
-
-    def compare(self, target, neighbor):
-        r"""Return the best path_similarity between
-        `target` and `neighbor`."""
-        try:
-            return self.embedding_set.compare(target, neighbor)
-        except KeyError:
-            return 0.0
+    def handle_batch(self, batch):
+        lines, targets, neighbors = [], [], []
+        for line, target, neighbor in zip(batch.lines,
+                batch.strings("target"), batch.strings("neighbor")):
+            if target != self.current_target:
+                self.current_target = target
+                self.current_target_count = 0
+            self.current_target_count += 1
+            if self.current_target_count <= self.args.best_k:
+                lines.append(line)
+                targets.append(target)
+                neighbors.append(neighbor)
+
+        embedding_set = self.embedding_set
+        cosines = embedding_set.cosines(embedding_set.rows(targets),
+                embedding_set.rows(neighbors))
+        sys.stdout.writelines(b"%s\t%.10f\n" % line_cosine
+                for line_cosine in zip(lines, cosines.tolist()))
 
 
 #####################################################
 
 if __name__ == "__main__":
-    csv.parse_csv(EmbeddingsCmpAdder(parser.parse_args()))
+    args = parser.parse_args()
+    csv.parse_csv_batches(EmbeddingsCmpAdder(args), batch_size=args.batch_size)
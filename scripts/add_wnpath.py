@@ -24,10 +24,11 @@ from __future__ import absolute_import
 
 import argparse
 import codecs
+import collections
+import multiprocessing
 import os
 import sys
-from nltk.corpus import wordnet as wn
-from lib import csv
+from lib import csv, wordnet
 
 FILE_ENC = "UTF-8"
 HERE = os.path.dirname(os.path.realpath(__file__))
@@ -45,18 +46,58 @@ parser = argparse.ArgumentParser(description="""
         THIS SCRIPT REQUIRES THE INPUT TO BE SORTED ON `target`.""")
 parser.add_argument("-k", "--best-k", type=int, default=float('inf'),
         help="""Output only first K entries for each `target`.""")
+parser.add_argument("--cache-size", type=int, default=wordnet.DEFAULT_CACHE_SIZE,
+        help="""Maximum number of word pairs whose `wnpath` is kept in
+        memory (default: {}).""".format(wordnet.DEFAULT_CACHE_SIZE))
+parser.add_argument("--cache-file", default=None,
+        help="""File where the `wnpath` of word pairs is stored, to be
+        reused by later runs (created if needed).""")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="""Calculate `wnpath` in this number of worker processes
+        (default: 1). Groups of targets are sent to the workers, and
+        their output is printed in input order.""")
+parser.add_argument("--hypernym-index", default=None,
+        help="""Directory with a hypernym index of the same POS tag,
+        created by `build_wordnet_index.py`. The `wnpath` is the same,
+        but it is calculated much faster from the precomputed ancestors
+        of each synset.""")
 parser.add_argument("wordnet_pos_tag", type=unicode,
         help="""The wordnet POS-tag for all `target` and `neighbor` in the input.""")
 
 
+# Minimum number of lines (whole target groups) sent to a worker at once
+CHUNK_LINES = 1000
+
+
 class WnAdder(csv.CSVHandler):
     def __init__(self, args):
         self.args = args
         self.current_target = None
         self.current_target_count = 0
+        index = None
+        if args.hypernym_index is not None:
+            index = wordnet.HypernymIndex(args.hypernym_index)
+            if index.pos != args.wordnet_pos_tag:
+                parser.error("hypernym index {} has POS tag `{}`".format(
+                        args.hypernym_index, index.pos))
+        self.wnpath = wordnet.WordPathSimilarity(args.wordnet_pos_tag,
+                cache_size=args.cache_size, cache_file=args.cache_file,
+                index=index)
+        self.pending = []  # list[(line, target, neighbor)], not submitted yet
+        self.queue = collections.deque()  # Comments and submitted lines
+        self.pool = None
+        if args.jobs > 1:
+            # Workers are forked: they share the loaded corpus and caches
+            wordnet.preload()
+            self.pool = multiprocessing.Pool(args.jobs, init_worker,
+                    (self.wnpath,))
 
     def handle_comment(self, line):
-        print(line)
+        if self.pool is None:
+            print(line)
+        else:
+            self.submit()
+            self.queue.append((line,))
 
     def handle_header(self, line, header_list):
         assert "target" in header_list, header_list
@@ -69,23 +110,65 @@ class WnAdder(csv.CSVHandler):
         if target != self.current_target:
             self.current_target = target
             self.current_target_count = 0
+            if len(self.pending) >= CHUNK_LINES:
+                self.submit()
         self.current_target_count += 1
         if self.current_target_count <= self.args.best_k:
-            wnpath = "{0:.10f}".format(self.wnpath(target, neighbor))
-            print("\t".join(data_namedtuple).encode('utf8'), wnpath, sep="\t")
-
-    def wnpath(self, target, neighbor):
-        r"""Return the best path_similarity between
-        `target` and `neighbor`."""
-        synsetsT = wn.synsets(target, self.args.wordnet_pos_tag)
-        synsetsN = wn.synsets(neighbor, self.args.wordnet_pos_tag)
-        if not synsetsT:
-            return 0  # XXX no synsets for `target`
-        if not synsetsN:
-            return 0  # XXX no synsets for `neighbor`
-        return max(wn.path_similarity(sT, sN)
-                for sT in synsetsT for sN in synsetsN) \
-                or 0  # When `wn` returns None, we just say sim==0
+            line = "\t".join(data_namedtuple).encode('utf8')
+            if self.pool is None:
+                self.print_lines([line], [self.wnpath(target, neighbor)])
+            else:
+                self.pending.append((line, target, neighbor))
+
+    def submit(self):
+        r"""Send the pending lines to a worker."""
+        if self.pending:
+            lines, targets, neighbors = zip(*self.pending)
+            self.queue.append((lines, targets, neighbors, self.pool.apply_async(
+                    calculate_wnpaths, (targets, neighbors))))
+            self.pending = []
+        while len(self.queue) > 2 * self.args.jobs:
+            self.print_oldest()
+
+    def print_oldest(self):
+        r"""Print the first item of the queue (waiting for its result)."""
+        item = self.queue.popleft()
+        if len(item) == 1:
+            print(item[0])  # A comment
+        else:
+            lines, targets, neighbors, result = item
+            scores = result.get()
+            for target, neighbor, score in zip(targets, neighbors, scores):
+                self.wnpath.remember(target, neighbor, score)
+            self.print_lines(lines, scores)
+
+    def print_lines(self, lines, scores):
+        for line, score in zip(lines, scores):
+            print(line, "{0:.10f}".format(score), sep="\t")
+
+    def end(self):
+        if self.pool is not None:
+            self.submit()
+            while self.queue:
+                self.print_oldest()
+            self.pool.close()
+            self.pool.join()
+        self.wnpath.close()
+
+
+_wnpath = None  # Set in each worker process
+
+def init_worker(wnpath):
+    global _wnpath
+    _wnpath = wnpath
+    wordnet.forget_data_files()
+    _wnpath.cache_file = None  # Only the main process writes to the cache
+
+
+def calculate_wnpaths(targets, neighbors):
+    r"""Return the `wnpath` of each (target, neighbor) pair (in a worker)."""
+    return [_wnpath(target, neighbor)
+            for (target, neighbor) in zip(targets, neighbors)]
 
 
 #####################################################
@@ -0,0 +1,73 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+
+from lib import association
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Calculate association profiles from `target context count` triples
+        (e.g. the `.u` file created by `filterRaw.sh`), as `build_profiles`.
+
+        Marginals and measures are calculated for all pairs at once. The
+        output has the same format as `build_profiles`, with pairs grouped
+        by target (ids are assigned by order of first appearance).""")
+parser.add_argument("-m", "--measures", type=lambda s: s.split(","),
+        default=association.MEASURES,
+        help="""Comma-separated list of measures to calculate and output
+        (default: all). Valid measures: {}.""".format(
+        ", ".join(association.MEASURES)))
+parser.add_argument("input_file", type=argparse.FileType("rb"),
+        help="""File with one `target context count` triple per line.""")
+
+
+#####################################################
+
+def main():
+    args = parser.parse_args()
+    for name in args.measures:
+        if name not in association.MEASURES:
+            parser.error("unknown measure: {}".format(name))
+    print("Reading input file...", file=sys.stderr)
+    counts = association.read_triples(args.input_file)
+    if counts.n_repeated:
+        print("WARNING: {} repeated pairs (kept the last count)".format(
+                counts.n_repeated), file=sys.stderr)
+    print("Calculating association scores...", file=sys.stderr)
+    measures = association.association_measures(counts,
+            args.measures)
+    association.write_profiles(sys.stdout, counts, measures)
+    print("Number of targets: {}".format(len(counts.targets)), file=sys.stderr)
+    print("Number of contexts: {}".format(len(counts.contexts)), file=sys.stderr)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
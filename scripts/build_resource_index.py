@@ -0,0 +1,102 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+
+from lib import resources
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Compile reference resources of related words (classes of words,
+        such as VerbNet or Moby, and WordNet relations) into a directory
+        of `.npy` arrays, with the same counts as
+        `src/old/get_neighbours.py`.
+
+        The index is used by `add_resources.py`, where the resources
+        of each (target, neighbor) line become binary searches over
+        integer ids, instead of set intersections and NLTK calls.""")
+parser.add_argument("-c", "--classes", action="append", default=[],
+        metavar="NAME=FILE",
+        help="""Index resource NAME from a file of classes, with lines
+        `word<TAB>class_id[<TAB>...]` (e.g. `src/verbnet-verbclasses.txt`).
+        Two words are related by the number of classes they share.
+        Can be given several times.""")
+parser.add_argument("--wordnet", type=unicode, default=None,
+        metavar="POS",
+        help="""Index the WordNet relations of the synsets of this POS-tag,
+        as resources wn_syn, wn_hyper, wn_hypo, wn_mero, wn_sibling and
+        wn_anto: between all its lemmas (and the `--words`) and the
+        lemmas of the related synsets.""")
+parser.add_argument("-w", "--words", type=argparse.FileType("r"),
+        default=None,
+        help="""File with extra words whose WordNet relations are indexed,
+        one per line (e.g. the inflected targets of a thesaurus).""")
+parser.add_argument("output_dir",
+        help="""Directory where the index is written (created if needed).""")
+
+
+#####################################################
+
+def main():
+    args = parser.parse_args()
+    index_resources = []
+    for spec in args.classes:
+        name, sep, path = spec.partition("=")
+        if not sep or not name or not path:
+            parser.error("Bad --classes (expected NAME=FILE): {!r}".format(spec))
+        index_resources.append((name, "classes",
+                resources.iter_classes(open(path, "rb"))))
+    if args.wordnet is not None:
+        from lib import wordnet
+        words = []
+        if args.words is not None:
+            words = [line.decode(FILE_ENC).strip() for line in args.words]
+            words = [w for w in words if w]
+        index_resources.extend((relation, "pairs",
+                wordnet.iter_relation(args.wordnet, relation, words))
+                for relation in wordnet.RELATIONS)
+
+    names = [name for (name, _, _) in index_resources]
+    if not names:
+        parser.error("Nothing to index (use --classes or --wordnet)")
+    for name in names:
+        if names.count(name) > 1 or any(c in name for c in "\t+="):
+            parser.error("Bad or repeated resource name: {!r}".format(name))
+
+    resources.ResourceIndex.build(args.output_dir, index_resources)
+    index = resources.ResourceIndex(args.output_dir)
+    print("Indexed {} words and {} resources ({}) in {}".format(
+            len(index.words), len(names), " ".join(names),
+            args.output_dir), file=sys.stderr)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
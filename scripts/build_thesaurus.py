@@ -0,0 +1,236 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import codecs
+import multiprocessing
+import numpy
+import os
+import shutil
+import sys
+import tempfile
+
+from lib import lsh, similarity, sparse
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Build a distributional thesaurus with the K nearest neighbors
+        of each target, from the output of `build_profiles`.
+
+        Similarities are calculated as in `calculate_similarity`, for
+        blocks of targets at a time, so memory is bounded by the block
+        size. Only pairs sharing some context are scored: candidates
+        come from a context->targets inverted index, or, with `--approx`,
+        from locality-sensitive hashing (faster, but some neighbors may be
+        missed; scores of the neighbors found are still exact).
+
+        The output is already ranked: columns `target id_target neighbor id_neighbor <score> rank`,
+        grouped by target, with neighbors by decreasing score.""")
+parser.add_argument("-a", "--association", default="cond_prob",
+        help="""Name of the association score column (default: cond_prob).""")
+parser.add_argument("-s", "--score", choices=similarity.MEASURES,
+        default="cosine",
+        help="""Similarity score used to rank neighbors (default: cosine).""")
+parser.add_argument("-k", "--best-k", type=int, default=100,
+        help="""Output only the K best neighbors of each target (default: 100).""")
+parser.add_argument("-A", "--assoc-thresh", type=float, default=None,
+        help="""Ignore contexts whose association score is below this value.""")
+parser.add_argument("-S", "--sim-thresh", type=float, default=None,
+        help="""Ignore neighbors whose similarity is below this value.""")
+parser.add_argument("-P", "--max-postings", type=int, default=None,
+        help="""Do not generate candidate neighbors from contexts shared by
+        more than this number of targets (e.g. `NNP`). Pairs sharing only
+        such hub contexts are not scored; other scores are still exact.
+        (Not with `--approx`, see `--max-bucket`).""")
+parser.add_argument("-b", "--block-size", type=int, default=None,
+        help="""Number of targets scored at once (default: adapted to the
+        number of targets).""")
+parser.add_argument("-T", "--threads", type=int, default=1,
+        help="""Run this number of worker processes (default: 1). Targets
+        are split into shards, which are processed in parallel against the
+        same (shared, read-only) profile matrix and merged in order.""")
+parser.add_argument("--approx", choices=lsh.METHODS, default=None,
+        help="""Generate candidate neighbors from LSH buckets instead of
+        shared contexts: `hyperplane` (random hyperplane signatures, for
+        cosine) or `minhash` (weighted MinHash, for wjaccard and lin).""")
+parser.add_argument("--bands", type=int, default=16,
+        help="""Number of LSH bands (default: 16). More bands find more
+        neighbors (higher recall), but generate more candidates.""")
+parser.add_argument("--band-size", type=int, default=None,
+        help="""Number of hash values per LSH band (default: {}).
+        Larger bands generate fewer, more similar candidates.""".format(
+        ", ".join("{} for {}".format(size, method) for (method, size)
+        in sorted(lsh.DEFAULT_BAND_SIZE.items()))))
+parser.add_argument("--max-bucket", type=int, default=None,
+        help="""Ignore LSH buckets with more than this number of targets.""")
+parser.add_argument("--seed", type=int, default=0,
+        help="""Seed of the LSH hash functions (default: 0).""")
+parser.add_argument("--recall-sample", type=int, default=0, metavar="N",
+        help="""With `--approx`, calculate the exact neighbors of N random
+        targets and report the recall of the approximate neighbors
+        on stderr (default: 0, no report).""")
+parser.add_argument("--tmp-dir", default=None,
+        help="""Directory where the temporary output of the shards is
+        written, in a subdirectory removed at the end (default: the
+        system temporary directory).""")
+parser.add_argument("profiles",
+        help="""File with profiles, as output by `build_profiles`
+        (or a directory created by `csv_profile_store.py`).""")
+
+
+class ThesaurusPrinter(object):
+    r"""Print ranked neighbors as output by `similarity.iter_top_k`."""
+    def __init__(self, args, vectors, target_ids):
+        self.args = args
+        self.vectors = vectors
+        self.target_ids = target_ids
+
+    def print_header(self):
+        print("target", "id_target", "neighbor", "id_neighbor",
+                self.args.score, "rank", sep="\t")
+
+    def print_neighbors(self, row, neighbors, scores, file=None):
+        names, ids = self.vectors.names, self.target_ids
+        target, id_target = names[row], ids[row]
+        for rank, (neighbor, score) in enumerate(zip(neighbors, scores), 1):
+            if self.args.sim_thresh is not None and score < self.args.sim_thresh:
+                break
+            print("{}\t{}\t{}\t{}\t{:.10f}\t{}".format(target, id_target,
+                    names[neighbor], ids[neighbor], score, rank), file=file)
+
+
+#####################################################
+
+_worker_state = None  # (args, scorer, printer), set in each worker process
+
+def init_worker(args, scorer, printer):
+    global _worker_state
+    _worker_state = (args, scorer, printer)
+
+
+def process_shard(shard):
+    r"""Calculate neighbors for the targets of a (shard_dir, shard_rows)
+    shard (in a worker) and return the name of the temporary file, in
+    `shard_dir`, with their output."""
+    args, scorer, printer = _worker_state
+    shard_dir, shard_rows = shard
+    with tempfile.NamedTemporaryFile(dir=shard_dir,
+            prefix="thesaurus-shard-", delete=False) as shard_file:
+        writer = codecs.getwriter(FILE_ENC)(shard_file)
+        for row, neighbors, scores in similarity.iter_top_k(scorer,
+                args.best_k, rows=shard_rows, block_size=args.block_size):
+            printer.print_neighbors(row, neighbors, scores, file=writer)
+    return shard_file.name
+
+
+def run_sharded(args, scorer, printer):
+    r"""Process shards of targets in a pool of `args.threads` workers
+    and copy their output to stdout, in the order of the targets."""
+    n_targets = len(scorer.vectors)
+    shards = numpy.array_split(numpy.arange(n_targets),
+            min(n_targets, 8 * args.threads) or 1)
+    # Shard files are all written in a temporary directory, which is
+    # removed at the end, even if a worker or the merge fails
+    shard_dir = tempfile.mkdtemp(dir=args.tmp_dir, prefix="thesaurus-shards-")
+    try:
+        # Workers are forked: they share the profile arrays with this process
+        pool = multiprocessing.Pool(args.threads, init_worker,
+                (args, scorer, printer))
+        sys.stdout.flush()
+        try:
+            for shard_name in pool.imap(process_shard,
+                    [(shard_dir, rows) for rows in shards]):
+                with open(shard_name, "rb") as shard_file:
+                    shutil.copyfileobj(shard_file, sys.stdout.stream)
+                os.remove(shard_name)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+
+#####################################################
+
+def approx_scorer(args, vectors):
+    r"""Return a `similarity.CandidateScorer` with LSH candidates,
+    and report its recall if `args.recall_sample` is set."""
+    if args.approx != lsh.DEFAULT_METHOD[args.score]:
+        print("WARNING: `{}` signatures do not approximate {}".format(
+                args.approx, args.score), file=sys.stderr)
+    index = lsh.build_index(vectors, args.approx, args.bands,
+            band_size=args.band_size, max_bucket=args.max_bucket,
+            seed=args.seed)
+    scorer = similarity.CandidateScorer(vectors, args.score, index)
+    if args.recall_sample:
+        random = numpy.random.RandomState(args.seed)
+        rows = numpy.sort(random.choice(len(vectors),
+                min(args.recall_sample, len(vectors)), replace=False))
+        exact = similarity.BlockScorer(vectors, args.score)
+        recall, n_targets = lsh.sample_recall(exact, scorer, args.best_k, rows)
+        print("Recall@{} of approximate neighbors on {} sampled targets: " \
+                "{:.4f}".format(args.best_k, n_targets, recall), file=sys.stderr)
+    return scorer
+
+
+def main():
+    sys.stdout = codecs.getwriter(FILE_ENC)(sys.stdout)
+    sys.stderr = codecs.getwriter(FILE_ENC)(sys.stderr)
+
+    args = parser.parse_args()
+    if args.approx is not None and args.max_postings is not None:
+        parser.error("--max-postings does not apply to --approx " \
+                "(use --max-bucket)")
+    vectors, target_ids = sparse.load_vectors(
+            args.profiles, args.association, with_ids=True)
+    if args.assoc_thresh is not None:
+        vectors = vectors.filter_entries(vectors.data >= args.assoc_thresh)
+
+    printer = ThesaurusPrinter(args, vectors, target_ids)
+    printer.print_header()
+    if args.approx is None:
+        scorer = similarity.BlockScorer(vectors, args.score,
+                max_postings=args.max_postings)
+        if scorer.index.n_hubs:
+            print("Ignoring {} hub contexts for candidate generation".format(
+                    scorer.index.n_hubs), file=sys.stderr)
+    else:
+        scorer = approx_scorer(args, vectors)
+    if args.threads > 1:
+        run_sharded(args, scorer, printer)
+    else:
+        for row, neighbors, scores in similarity.iter_top_k(
+                scorer, args.best_k, block_size=args.block_size):
+            printer.print_neighbors(row, neighbors, scores)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+
+from lib import wordnet
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Precompute the ancestors (hypernyms and instance hypernyms) of
+        every wordnet synset of a POS tag, with their distance, and write
+        them as a directory of `.npy` arrays.
+
+        The index is used by `add_wnpath.py --hypernym-index`, where
+        the path similarity of two words becomes an intersection of
+        their ancestors, instead of a graph search per pair of synsets.""")
+parser.add_argument("-w", "--words", type=argparse.FileType("r"),
+        default=None,
+        help="""File with extra words to index, one per line (e.g. the
+        inflected forms in a thesaurus). Words that are not indexed are
+        looked up through wordnet's morphology at runtime.""")
+parser.add_argument("wordnet_pos_tag", type=unicode,
+        help="""The wordnet POS-tag of the synsets to index.""")
+parser.add_argument("output_dir",
+        help="""Directory where the index is written (created if needed).""")
+
+
+#####################################################
+
+def main():
+    args = parser.parse_args()
+    words = []
+    if args.words is not None:
+        words = [line.decode(FILE_ENC).strip() for line in args.words]
+        words = [w for w in words if w]
+    wordnet.HypernymIndex.build(args.output_dir, args.wordnet_pos_tag, words)
+    index = wordnet.HypernymIndex(args.output_dir)
+    print("Indexed {} words and {} synsets (wordnet {}) in {}".format(
+            len(index.words), len(index.synsets), index.version,
+            args.output_dir), file=sys.stderr)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
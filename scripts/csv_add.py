@@ -26,13 +26,21 @@ import argparse
 import collections
 import codecs
 import math
+import numpy
 import os
 import sys
 
-from lib import csv
+from lib import csv, embeddings
 
 FILE_ENC = "UTF-8"
 HERE = os.path.dirname(os.path.realpath(__file__))
+NAN = float("nan")
+
+# Number of input entries of a target that are merged into its arrays at once
+BUFFER_ENTRIES = 4096
+
+# Numeric columns with non-numeric values (which are only warned about once)
+NON_NUMERIC_COLUMNS = set()
 
 
 parser = argparse.ArgumentParser(description="""
@@ -51,6 +59,11 @@ parser.add_argument("--normalize-after", action='store_true',
         help="""Normalize input vectors after adding them up""")
 parser.add_argument("--input-format", choices=("CSV", "word2vec"), default="CSV",
         help="""Choose the file format for input_file (default: CSV).""")
+parser.add_argument("--grouped-input", action='store_true',
+        help="""The lines of each target are contiguous in input_file
+        (e.g. sorted by target). Sums are output as soon as their targets
+        have been read (thus not in the order of the triples), and only
+        the targets of pending triples are kept in memory.""")
 parser.add_argument("target_addition_triples", type=argparse.FileType("r"),
         help="""The pairs target_a/target_b/target_result.""")
 parser.add_argument("input_file", type=argparse.FileType("r"),
@@ -74,19 +87,43 @@ class TriplesCollector(csv.CSVHandler):
 ############################################################
 
 class DataCollector(csv.CSVHandler):
-    def __init__(self, args, addition_triples):
+    r"""Collect the vectors of the targets in `addition_triples` and print
+    their sums. With `grouped_input`, each sum is printed as soon as the
+    input lines of its targets have been read (a target's lines must be
+    contiguous), and targets are released once all their sums are printed.
+    """
+    def __init__(self, args, addition_triples, grouped_input=False):
         self.args = args
         self.addition_triples = addition_triples
+        self.grouped_input = grouped_input
         self.data = collections.OrderedDict()  # Dict[TargetVector]
-        self.add_operation = lambda x, y: x+y
+        self.context_ids = {}  # Dict[context name, int]
+        self.context_names = []  # List[context name], by id
         self.list_header_names = []
         self.set_header_names = set()
+        self.printed_header = False
+
+        # `needed[t]` is the number of unprinted triples that use target `t`
+        self.needed = collections.Counter(t for triple in addition_triples
+                for t in self._targets(triple))
+        self.waiting = collections.defaultdict(list)  # Dict[target, triple indexes]
+        self.n_unread = []  # For each triple, number of targets not read yet
+        for i, triple in enumerate(addition_triples):
+            self.n_unread.append(len(self._targets(triple)))
+            for t in self._targets(triple):
+                self.waiting[t].append(i)
+        self.printed = [False] * len(addition_triples)
+        self.current_target = None
+        self.finished = set()  # Targets whose lines have all been read
 
 
     def handle_header(self, line, header_names):
         assert "target" in header_names, header_names
         assert "context" in header_names, header_names
-        more = (h for h in header_names if h not in self.set_header_names)
+        more = [h for h in header_names if h not in self.set_header_names]
+        if more and self.printed_header:
+            raise Exception("New columns after output has begun: {}" \
+                    .format(" ".join(more)))
         self.list_header_names.extend(more)
         self.set_header_names.update(more)
 
@@ -97,69 +134,255 @@ class DataCollector(csv.CSVHandler):
         name/order). They are all required to have `target` and `context`, though.
         """
         t, c = data_namedtuple.target, data_namedtuple.context
+        data_t = self.target_vector(t)
+        if data_t is not None:
+            data_t.add_entry(self.context_id(c), data_namedtuple)
+
+
+    def handle_vectors(self, words, vectors):
+        r"""Add dense `vectors` (a float matrix, with one row per word),
+        as the `value` of contexts `c0`, `c1`, etc."""
+        context_ids = numpy.array([self.context_id("c{}".format(i))
+                for i in xrange(vectors.shape[1])], dtype=numpy.int64)
+        for word, vector in zip(words, vectors):
+            data_t = self.target_vector(word)
+            if data_t is not None:
+                data_t.add_entries(context_ids, ["value"], vector[:, None])
+
+
+    def target_vector(self, t):
+        r"""Return the TargetVector where input data for target `t` is
+        added (None if `t` is not used by any triple)."""
+        if self.grouped_input and t != self.current_target:
+            self.finish_target(self.current_target)
+            self.current_target = t
         # We only keep in memory the stuff we will use, otherwise we risk
         # running out of memory (true story; has happened before...)
-        if any(t == a or t == b  for (a, b, res) in self.addition_triples):
-            data_t = self.data.setdefault(t, TargetVector(t))
-            data_t.add_entry(c, data_namedtuple)
+        if t not in self.needed:
+            return None
+        if t in self.finished:
+            raise Exception("Input is not grouped by target: {} " \
+                    "appears again".format(t))
+        data_t = self.data.get(t)
+        if data_t is None:
+            data_t = self.data[t] = TargetVector(t)
+        return data_t
+
+
+    def context_id(self, context_name):
+        r"""Return the id of `context_name` (a new one if needed)."""
+        ret = self.context_ids.get(context_name)
+        if ret is None:
+            ret = self.context_ids[context_name] = len(self.context_names)
+            self.context_names.append(context_name)
+        return ret
+
+
+    def finish_target(self, target):
+        r"""Print the triples whose targets have all been read."""
+        if target not in self.needed or target in self.finished:
+            return
+        self.finished.add(target)
+        for i in self.waiting.pop(target):
+            self.n_unread[i] -= 1
+            if self.n_unread[i] == 0:
+                self.print_triple(i)
 
 
     def print_merged(self):
         r"""Merge `target_a` and `target_b` and print them."""
-        print(*self.list_header_names, sep="\t")
-        for triple in self.addition_triples:
-            targets = [triple.target_a, triple.target_b]
-            for target in targets:
-                if target != "@NOTHING" and target not in self.data:
-                    print("WARNING: missing target", target,
-                            "for", triple.target_result, file=sys.stderr)
-            targets = [self.data[t] for t in targets if t in self.data]
-            if self.args.normalize_before:
-                for t in targets:
-                    t.do_normalize(self.list_header_names)
-            t_result = TargetVector.sum(triple.target_result, targets)
-            if self.args.normalize_after:
-                t_result.do_normalize(self.list_header_names)
-            t_result.print_csv(self.list_header_names)
+        self.finish_target(self.current_target)
+        self.print_header()
+        for i in xrange(len(self.addition_triples)):
+            if not self.printed[i]:
+                self.print_triple(i)
+
+
+    def print_header(self):
+        if not self.printed_header:
+            print(*self.list_header_names, sep="\t")
+            self.printed_header = True
+
+
+    def print_triple(self, i):
+        r"""Print the sum of the targets of triple `i` (and release the
+        targets that are not used by other triples)."""
+        self.print_header()
+        triple = self.addition_triples[i]
+        targets = [triple.target_a, triple.target_b]
+        for target in targets:
+            if target != "@NOTHING" and target not in self.data:
+                print("WARNING: missing target", target,
+                        "for", triple.target_result, file=sys.stderr)
+        targets = [self.data[t] for t in targets if t in self.data]
+        if self.args.normalize_before:
+            for t in targets:
+                t.do_normalize()
+        t_result = TargetVector.sum(triple.target_result, targets)
+        if self.args.normalize_after:
+            t_result.do_normalize()
+        t_result.print_csv(self.list_header_names, self.context_names)
+
+        self.printed[i] = True
+        for t in self._targets(triple):
+            self.needed[t] -= 1
+            if self.needed[t] == 0 and self.grouped_input:
+                self.data.pop(t, None)
+
+
+    @staticmethod
+    def _targets(triple):
+        r"""Return the set of actual targets in `triple`."""
+        return {t for t in (triple.target_a, triple.target_b) if t != "@NOTHING"}
 
 
 class TargetVector(object):
-    r"""Represents a sparse vector."""
-    def __init__(self, target_name):
+    r"""Represents a sparse vector: the sorted ids of its contexts (see
+    `DataCollector.context_id`), a 2-D float array `floats` with the
+    numeric columns `float_names` of each context (NaN when a context
+    has no value), and, for each constant column (see
+    `is_constant_field`), an object array of strings (None when missing).
+
+    Entries added with `add_entry` are buffered, and merged into the
+    arrays by blocks of BUFFER_ENTRIES.
+    """
+    def __init__(self, target_name, context_ids=None, float_names=(),
+            floats=None, strings=None):
         self.target_name = target_name
-        self._ctx2vec = collections.OrderedDict()  # Dict[context, data_dict]
-
-    def add_entry(self, context_name, data_namedtuple):
-        r"""Add (self, context_name) -> data_namedtuple mapping."""
-        if context_name in self._ctx2vec:
+        self.context_ids = context_ids if context_ids is not None \
+                else numpy.zeros(0, dtype=numpy.int64)
+        self.float_names = list(float_names)
+        self.floats = floats if floats is not None else numpy.zeros(
+                (len(self.context_ids), len(self.float_names)))
+        self.strings = strings if strings is not None \
+                else collections.OrderedDict()
+        self._buffer = []  # list[(context_id, data_namedtuple)]
+
+    def add_entry(self, context_id, data_namedtuple):
+        r"""Add (self, context_id) -> data_namedtuple mapping."""
+        self._buffer.append((context_id, data_namedtuple))
+        if len(self._buffer) >= BUFFER_ENTRIES:
+            self.flush()
+
+    def flush(self):
+        r"""Merge the buffered entries into the arrays."""
+        if not self._buffer:
+            return
+        buffer, self._buffer = self._buffer, []
+        ids = numpy.array([c for (c, data) in buffer], dtype=numpy.int64)
+        duplicate = numpy.isin(ids, self.context_ids)
+        duplicate[numpy.setdiff1d(numpy.arange(len(ids)),
+                numpy.unique(ids, return_index=True)[1])] = True
+        for i in numpy.flatnonzero(duplicate):
             print("WARNING: duplicate target-context pair:",
-                    self.target_name, context_name, file=sys.stderr)
-        self._add_into(context_name, data_namedtuple._asdict())
-
-    def _add_into(self, context_name, data_dict):
-        r"""Increment value for given context_name."""
-        vec = self._ctx2vec.setdefault(context_name,
-                {"target": self.target_name})
-        for col_key, col_value in data_dict.iteritems():
-            if col_key == "target": continue
-            if col_key not in vec:
-                vec[col_key] = col_value
-            else:
-                a, b = vec[col_key], col_value
-                if self.is_constant_field(col_key):
-                    if a != b and col_key != "id_target":
-                        print("WARNING: incompatible entries", col_key,
-                                "for context", context_name, "when adding up",
-                                self.target_name, "({} vs {})".format(a, b),
-                                file=sys.stderr)
-                else:
-                    try :
-                        vec[col_key] = a + b
-                    except Exception :
-                        print("WARNING: incompatible entries", col_key,
-                                "for context", context_name, "when adding up",
-                                self.target_name, "({} vs {})".format(a, b),
-                                file=sys.stderr)
+                    self.target_name, buffer[i][1].context, file=sys.stderr)
+
+        names = collections.OrderedDict.fromkeys(name
+                for tupleclass in collections.OrderedDict.fromkeys(
+                type(data) for (c, data) in buffer)
+                for name in tupleclass._fields
+                if name not in ("target", "context"))
+        columns = [(name, [getattr(data, name, None) for (c, data) in buffer])
+                for name in names]
+        float_names = [n for n in names if not self.is_constant_field(n)]
+        parsed = [(name, self._parse_floats(name, values))
+                for (name, values) in columns if name in float_names]
+        floats = numpy.array([column_floats for (_, (column_floats, _))
+                in parsed]).T
+        strings = collections.OrderedDict((name, _object_array(values))
+                for (name, values) in columns if self.is_constant_field(name))
+        # Non-numeric values are kept as strings (NaN in `floats`)
+        strings.update((name, texts) for (name, (_, texts)) in parsed
+                if texts is not None)
+        self._merge_into(self, [self, TargetVector(self.target_name, ids,
+                float_names, floats.reshape(len(ids), len(float_names)),
+                strings)])
+
+    def add_entries(self, context_ids, float_names, floats):
+        r"""Add the rows of `floats` (a 2-D array with the numeric columns
+        `float_names`) for the given `context_ids` at once."""
+        self.flush()
+        if numpy.isin(context_ids, self.context_ids).any() \
+                or len(numpy.unique(context_ids)) != len(context_ids):
+            print("WARNING: duplicate target-context pairs for",
+                    self.target_name, file=sys.stderr)
+        self._merge_into(self, [self, TargetVector(self.target_name,
+                context_ids, float_names, floats)])
+
+    def _parse_floats(self, col_key, values):
+        r"""Return (floats, texts) for the `values` of a numeric column,
+        where `texts` is None, or an object array with the non-numeric
+        values (None for the others), which are NaN in `floats`."""
+        try:
+            return numpy.array(values, dtype=numpy.float64), None
+        except (TypeError, ValueError):
+            floats = numpy.full(len(values), NAN)
+            texts = _object_array([None] * len(values))
+            for i, value in enumerate(values):
+                if value is not None:
+                    try:
+                        floats[i] = float(value)
+                    except ValueError:
+                        texts[i] = value
+            non_numeric = [t for t in texts if t is not None]
+            if not non_numeric:
+                return floats, None  # Only missing values
+            if col_key not in NON_NUMERIC_COLUMNS:
+                NON_NUMERIC_COLUMNS.add(col_key)
+                print("WARNING: non-numeric entries in column", col_key,
+                        "are output unchanged, e.g. when adding up",
+                        self.target_name, "({})".format(non_numeric[0]),
+                        file=sys.stderr)
+            return floats, texts
+
+    @staticmethod
+    def _merge_into(ret, vectors):
+        r"""Set the arrays of `ret` to the sum of `vectors` (a sparse merge:
+        the union of their contexts, with numeric columns added up)."""
+        ids = numpy.concatenate([v.context_ids for v in vectors])
+        context_ids, inverse = numpy.unique(ids, return_inverse=True)
+        rows = numpy.split(inverse, numpy.cumsum(
+                [len(v.context_ids) for v in vectors])[:-1])
+
+        float_names = list(collections.OrderedDict.fromkeys(
+                name for v in vectors for name in v.float_names))
+        floats = numpy.zeros((len(context_ids), len(float_names)))
+        present = numpy.zeros(floats.shape, dtype=bool)
+        for v, v_rows in zip(vectors, rows):
+            index = (v_rows[:, None],
+                    [float_names.index(name) for name in v.float_names])
+            known = ~numpy.isnan(v.floats)
+            numpy.add.at(floats, index, numpy.where(known, v.floats, 0))
+            numpy.logical_or.at(present, index, known)
+        floats[~present] = NAN
+
+        strings = collections.OrderedDict()
+        for name in collections.OrderedDict.fromkeys(
+                name for v in vectors for name in v.strings):
+            values = numpy.concatenate([v.strings[name] if name in v.strings
+                    else _object_array([None] * len(v.context_ids))
+                    for v in vectors])
+            strings[name] = ret._merge_strings(name, context_ids, inverse, values)
+
+        ret.context_ids, ret.float_names = context_ids, float_names
+        ret.floats, ret.strings = floats, strings
+
+    def _merge_strings(self, col_key, context_ids, inverse, values):
+        r"""Return an object array with the first value for each context,
+        warning about values that differ from it."""
+        ret = _object_array([None] * len(context_ids))
+        known = numpy.flatnonzero([v is not None for v in values])
+        rows = inverse[known]
+        first = numpy.unique(rows, return_index=True)[1]
+        ret[rows[first]] = values[known[first]]
+        if col_key != "id_target":
+            for i in known[values[known] != ret[rows]]:
+                print("WARNING: incompatible entries", col_key,
+                        "for context id", context_ids[inverse[i]],
+                        "when adding up", self.target_name,
+                        "({} vs {})".format(ret[inverse[i]], values[i]),
+                        file=sys.stderr)
+        return ret
 
     @staticmethod
     def is_constant_field(header_name):
@@ -170,69 +393,70 @@ class TargetVector(object):
     def sum(new_target_name, iterable):
         r"""Add up instances of TargetVector."""
         ret = TargetVector(new_target_name)
-        for tvector in iterable:
-            for context, data_dict in tvector._ctx2vec.iteritems():
-                ret._add_into(context, data_dict)
+        vectors = list(iterable)
+        for tvector in vectors:
+            tvector.flush()
+        if vectors:
+            TargetVector._merge_into(ret, vectors)
         return ret
 
-    def print_csv(self, list_header_names):
-        r"""Merge all targets for given context. Yield columns."""
-        for data_dict in self._ctx2vec.itervalues():
-            print("\t".join(unicode(x) for x in
-                self._get_cols(data_dict, list_header_names)))
-
-    def _get_cols(self, data_dict, list_header_names):
-        r"""Yield all columns for this line."""
-        for header_name in list_header_names:
-            yield data_dict.get(header_name, "?")
+    def print_csv(self, list_header_names, context_names):
+        r"""Print one line per context, with the given columns."""
+        self.flush()
+        columns = [self._get_col(header_name, context_names)
+                for header_name in list_header_names]
+        for cols in zip(*columns):
+            print("\t".join(cols))
+
+    def _get_col(self, header_name, context_names):
+        r"""Return a list with the strings of column `header_name`."""
+        if header_name == "target":
+            return [self.target_name] * len(self.context_ids)
+        if header_name == "context":
+            return [context_names[c] for c in self.context_ids]
+        if header_name in self.float_names:
+            values = self.floats[:, self.float_names.index(header_name)]
+            texts = self.strings.get(header_name,
+                    [None] * len(self.context_ids))
+            return [t if t is not None else "?" if math.isnan(v)
+                    else unicode(self._floatify(v))
+                    for (v, t) in zip(values.tolist(), texts)]
+        if header_name in self.strings:
+            return ["?" if v is None else v for v in self.strings[header_name]]
+        return ["?"] * len(self.context_ids)
 
     def _floatify(self, value):
-        r"""Return value as float, if possible."""
-        try:
-            ret = float(value)
-        except (TypeError, ValueError):
-            return value
-        else:
-            if int(ret) == ret:
-                return int(ret)
-            return ret
+        r"""Return value as int, if possible."""
+        if value.is_integer():
+            return int(value)
+        return value
 
-    def do_normalize(self, list_header_names):
+    def do_normalize(self):
         r"""Normalize entries is `self`."""
-        for header_name in list_header_names:
-            sqsumsq = math.sqrt(sum(f**2 for (c, f)
-                    in self._header2floats(header_name)))
-            if sqsumsq != 0:
-                for cvec, f in self._header2floats(header_name):
-                    cvec[header_name] = f/sqsumsq
-
-    def _header2floats(self, header_name):
-        r"""Given a header name, yields floats for each context."""
-        if not self.is_constant_field(header_name):
-            for c, cvec in self._ctx2vec.iteritems():
-                try:
-                    yield cvec, float(cvec[header_name])
-                except (TypeError, ValueError):
-                    pass
+        self.flush()
+        sqsumsq = numpy.sqrt(numpy.nansum(self.floats**2, axis=0))
+        nonzero = sqsumsq != 0
+        self.floats[:, nonzero] /= sqsumsq[nonzero]
 
 
-############################################################
+def _object_array(values):
+    r"""Return a 1-D object array with the given `values`."""
+    ret = numpy.empty(len(values), dtype=object)
+    ret[:] = values
+    return ret
 
-W2VNamedTuple = collections.namedtuple('W2VNamedTuple', 'target context value')
 
-def word2vec_parser(csv_handler, input_file):
-    r"""(Similar to a CSVParser, but reads word2vec output format)"""
-    next(input_file)  # Skip first line
+############################################################
 
+def word2vec_parser(csv_handler, input_file):
+    r"""(Similar to a CSVParser, but reads word2vec output format)
+    Embeddings are handed over as float matrices to `handle_vectors`."""
     header = ("target", "context", "value")
     csv_handler.handle_header(None, header)
 
-    for line in input_file:
-        line = line.strip()
-        target, line = line.decode('utf8').split(" ", 1)
-        for context, value in enumerate(line.split(" ")):
-            csv_handler.handle_data(None, W2VNamedTuple(
-                target, "c{}".format(context), value))
+    for words, vectors in embeddings.iter_word2vec(input_file,
+            dtype=numpy.float64):
+        csv_handler.handle_vectors(words, vectors)
     return csv_handler
 
 ############################################################
@@ -249,7 +473,7 @@ def main():
     if args.input_format == "word2vec":
         data_parser = word2vec_parser
 
-    collector = data_parser(DataCollector(args, triples),
+    collector = data_parser(DataCollector(args, triples, args.grouped_input),
             input_file=args.input_file)
     collector.print_merged()
 
@@ -26,13 +26,16 @@ import argparse
 import collections
 import codecs
 import itertools
-import math
+import multiprocessing
+import numpy
 import os
+import scipy.special
 import scipy.stats
 import sys
 import textwrap
 
 from lib import csv
+from lib import metrics
 
 
 parser = argparse.ArgumentParser(
@@ -50,14 +53,24 @@ parser = argparse.ArgumentParser(
         These measures require --gold-threshold:
         * BestF1: max(F1 of top N values for all N)  [0..+1]
         * AvgPrec: avg(prec of top k values if isrelevant(k'th))  [0..+1]
+        * RPrec: precision using top R values, R=number of relevant  [0..+1]
         * Prec@X: precision using top X values  [0..+1]
         * NDCG: normalized(sum(isrelevant(k'th) / log(k)))  [0..+1]
+        * NDCG@K: NDCG using top K values (requires --ndcg-at)  [0..+1]
 
         This information is also presented:
         * Wilcoxon: low pvalues iff files have different distributions
         * NPreds: total number of predictions
         * PredTies: values that have tied (and number of ties)
 
+        These require --bootstrap and/or --permutations (they resample
+        the gold keys; NDCG also requires --gold-threshold):
+        * BootstrapCI[M]: confidence interval of PearsonR/SpearmanRho/NDCG
+        * PairedBootstrap[M]: CI and pvalue of the difference of M
+          between two pred columns (low pvalues iff M differs)
+        * Permutation[M]: pvalue of the difference of M between two pred
+          columns, swapping their predictions for random keys
+
         TO_DOCUMENT:
         * Best[Gold->Pred]: good rank predictions (smallest differences)
         * Worst[Gold->Pred]: bad rank predictions (greatest differences)
@@ -93,15 +106,40 @@ parser.add_argument("--inverted-scales", action="store_true",
         "non-compositionality" scores),
         you MUST pre-process the gold-standard before running this script.
         """)
-parser.add_argument("--precision-at", metavar="N", type=int, default=10,
+parser.add_argument("--precision-at", metavar="N", type=int, nargs="+", default=[10],
         help="""Calculate precision at top N pred_file elements with
-        highest value (default: 10 elements).""")
+        highest value, for each N (default: 10 elements).""")
+parser.add_argument("--ndcg-at", metavar="K", type=int, nargs="+", default=[],
+        help="""Also calculate the NDCG of the top K pred_file elements
+        with highest value, for each K.""")
 
 parser.add_argument("--extremities", metavar="N", type=int, default=5,
         help="""Calculate best/worst rank extremities (default: 5 points).""")
 parser.add_argument("--extremity-gold-info-columns", nargs="*", type=unicode, default=[],
         help="""Column names of extra gold-standard info to present per extremity point.""")
 
+parser.add_argument("--stream-predictions", action="store_true",
+        help="""Read pred_file twice in blocks of lines, only keeping the
+        predictions for keys in gold_file, so that memory does not grow
+        with the size of pred_file. Keys that are not in gold_file must
+        appear only once. Wilcoxon and PredTies are not calculated.""")
+
+parser.add_argument("--bootstrap", metavar="N", type=int, default=0,
+        help="""Calculate confidence intervals (and paired tests between
+        pred columns) from N bootstrap resamples of the gold keys
+        (default: 0, no bootstrap).""")
+parser.add_argument("--permutations", metavar="N", type=int, default=0,
+        help="""Run paired permutation tests between pred columns with
+        N random permutations (default: 0, no permutation test).""")
+parser.add_argument("--confidence-level", metavar="L", type=float, default=0.95,
+        help="""Level of bootstrap confidence intervals (default: 0.95).""")
+parser.add_argument("--random-seed", metavar="S", type=int, default=0,
+        help="""Seed for resamples and permutations (default: 0).
+        Results do not depend on the number of --jobs.""")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="""Calculate blocks of resamples/permutations in this number
+        of processes (default: 1).""")
+
 parser.add_argument("--debug", action="store_true",
         help="""Print extra debug info.""")
 
@@ -120,36 +158,235 @@ sys.stderr = codecs.getwriter("utf8")(sys.stderr)
 #####################################################
 
 class NumValuesParser(csv.CSVHandler):
-    def __init__(self, id_col, colnames, inverted_scales=False):
+    r"""Read the `colnames` of a CSV file into a float matrix `values`,
+    with one row per distinct key (see `keys` and `key2index`, in order
+    of first appearance; later lines override earlier ones) and one
+    column per colname. The `extra_colnames` are kept as lists, with
+    one value per key."""
+    def __init__(self, id_col, colnames, inverted_scales=False, extra_colnames=()):
         self.id_col = id_col  # type: int
         self.colnames = colnames  # type: list[str]
+        self.extra_colnames = list(extra_colnames)  # type: list[str]
         self.inverted_scales = inverted_scales  # type: bool
-        self.result_columns = {}  # type: dict[str, dict[str, float]]
+        self.key2index = {}  # type: dict[str, int]
+        self.keys = []  # type: list[str]
+        self.rows = []  # type: list[list[float]]
+        self.extra_columns = {}  # type: dict[str, list]
+        self.values = None  # type: numpy.ndarray (after `end`)
 
     def handle_header(self, line, header_names):
         if self.id_col is None : # by default, first column
             self.id_col = header_names[0]
         if self.colnames is None : # by default, second column
             self.colnames = [ header_names[1] ]
-        for col in self.colnames + [ self.id_col ] :
+        self.columns = list(collections.OrderedDict.fromkeys(
+                self.colnames + self.extra_colnames + [ self.id_col ]))
+        for col in self.columns :
             assert col in header_names, (col, header_names)
-            self.result_columns[col] = {} #collections.OrderedDict()
+        for col in self.extra_colnames:
+            self.extra_columns[col] = []
 
     def handle_data(self, line, data_namedtuple):
         key = getattr(data_namedtuple, self.id_col)
-        for colname, value in data_namedtuple._asdict().iteritems():
-            try:
-                value = float(value)
-            except ValueError:
-                pass  # keep it as string
-            else:
-                if self.inverted_scales:
-                    value = -value
-            self.result_columns.setdefault(colname, {})
-            self.result_columns[colname][key] = value
+        row = [self.float_value(colname, getattr(data_namedtuple, colname))
+                for colname in self.colnames]
+        i = self.key2index.setdefault(key, len(self.keys))
+        if i == len(self.keys):
+            self.keys.append(key)
+            self.rows.append(row)
+            for colname, column in self.extra_columns.iteritems():
+                column.append(self.value(getattr(data_namedtuple, colname)))
+        else:
+            self.rows[i] = row
+            for colname, column in self.extra_columns.iteritems():
+                column[i] = self.value(getattr(data_namedtuple, colname))
+
+    def value(self, string):
+        r"""Return `string` as a float if possible (negated, with
+        `inverted_scales`), otherwise as a string."""
+        try:
+            value = float(string)
+        except ValueError:
+            return string  # keep it as string
+        return -value if self.inverted_scales else value
+
+    def float_value(self, colname, string):
+        value = self.value(string)
+        if not isinstance(value, float):
+            raise Exception("Non-numeric value {!r} in column `{}`".format(
+                    value, colname))
+        return value
+
+    def end(self):
+        self.values = numpy.array(self.rows, dtype=numpy.float64) \
+                .reshape(len(self.keys), len(self.colnames or ()))
+        self.rows = None
+
+    def rows_of(self, keys):
+        r"""Return an int64 array with the row of each key (-1 if absent)."""
+        key2index = self.key2index
+        return numpy.array([key2index.get(k, -1) for k in keys],
+                dtype=numpy.int64)
+
+    @property
+    def n_entries(self):
+        return len(self.keys)
+
+    def average(self):
+        r"""Return the average of each column."""
+        if not len(self.values):
+            return numpy.full(self.values.shape[1], numpy.nan)
+        return self.values.mean(axis=0)
+
+    def positions(self, col):
+        r"""Return two int64 arrays with the position (from 1) of each row
+        in descending and in ascending order of column `col` (ties are
+        broken by order of first appearance)."""
+        values = self.values[:, col]
+        return _ranks(numpy.argsort(-values, kind="mergesort")), \
+                _ranks(numpy.argsort(values, kind="mergesort"))
+
+
+class StreamedPredictions(csv.CSVHandler):
+    r"""Read the `colnames` of a (huge) prediction file with
+    `csv.parse_csv_batches`, only keeping the lines whose key is in
+    `gold` (a NumValuesParser) in `keys` and `values`, as a
+    NumValuesParser would. The other lines are only counted and summed
+    up, so that memory depends on the size of the gold standard.
+
+    The file must be parsed twice: the second time, after
+    `start_counting`, the other lines are used to find the `positions`
+    of the kept rows among all predictions. Keys that are not in the
+    gold standard are assumed to appear only once.
+    """
+    def __init__(self, id_col, colnames, gold, inverted_scales=False):
+        self.id_col = id_col  # type: str
+        self.colnames = colnames  # type: list[str]
+        self.inverted_scales = inverted_scales  # type: bool
+        self.gold = gold  # type: NumValuesParser
+        gold_keys = numpy.array([k.encode('utf8') for k in gold.keys],
+                dtype=bytes)
+        self.gold_sorter = numpy.argsort(gold_keys, kind="mergesort")
+        self.gold_sorted = gold_keys[self.gold_sorter]
+        self.n_entries = 0  # Number of data lines
+        self.n_missing = 0  # Number of data lines whose key is not in `gold`
+        self.missing_example = None  # First key not in `gold`
+        self.counting = False
+        self.n_lines = 0
+
+    def handle_header(self, line, header_names):
+        if self.counting:
+            return
+        if self.id_col is None : # by default, first column
+            self.id_col = header_names[0]
+        if self.colnames is None : # by default, second column
+            self.colnames = [ header_names[1] ]
+        self.columns = list(collections.OrderedDict.fromkeys(
+                self.colnames + [ self.id_col ]))
+        for col in self.columns :
+            assert col in header_names, (col, header_names)
+        n_gold, n_cols = len(self.gold.keys), len(self.colnames)
+        self.sums = numpy.zeros(n_cols)
+        self.gold_values = numpy.full((n_gold, n_cols), numpy.nan)
+        self.gold_positions = numpy.full(n_gold, numpy.iinfo(numpy.int64).max)
+
+    def begin(self):
+        self.n_lines = 0
+
+    def handle_batch(self, batch):
+        keys = numpy.array(batch.raw(self.id_col), dtype=bytes)
+        rows = self.gold_rows(keys)
+        values = numpy.column_stack([batch.floats(col) for col in self.colnames]) \
+                .reshape(len(batch), len(self.colnames))
+        if self.inverted_scales:
+            values = -values
+        positions = numpy.arange(self.n_lines, self.n_lines + len(batch))
+        self.n_lines += len(batch)
+        if self.counting:
+            missing = rows < 0
+            self.count_preceding(values[missing], positions[missing])
+        else:
+            self.collect(keys, rows, values, positions)
+
+    def gold_rows(self, keys):
+        r"""Return an int64 array with the gold row of each key (-1 if absent)."""
+        index = numpy.searchsorted(self.gold_sorted, keys)
+        index[index == len(self.gold_sorted)] = 0
+        found = self.gold_sorted[index] == keys if len(self.gold_sorted) \
+                else numpy.zeros(len(keys), dtype=bool)
+        return numpy.where(found, self.gold_sorter[index], -1)
+
+    def collect(self, keys, rows, values, positions):
+        r"""Keep the values of the gold keys (first pass)."""
+        self.n_entries += len(keys)
+        self.sums += values.sum(axis=0)
+        missing = numpy.flatnonzero(rows < 0)
+        self.n_missing += len(missing)
+        if len(missing) and self.missing_example is None:
+            self.missing_example = keys[missing[0]].decode('utf8', errors='replace')
+        found = numpy.flatnonzero(rows >= 0)
+        numpy.minimum.at(self.gold_positions, rows[found], positions[found])
+        # (Later lines override earlier ones)
+        last = len(found) - 1 - numpy.unique(rows[found][::-1],
+                return_index=True)[1]
+        self.gold_values[rows[found[last]]] = values[found[last]]
 
     def end(self):
-        pass
+        if self.counting:
+            return
+        found = numpy.flatnonzero(~numpy.isnan(self.gold_values[:, 0])) \
+                if self.colnames else numpy.zeros(0, dtype=numpy.int64)
+        found = found[numpy.argsort(self.gold_positions[found], kind="mergesort")]
+        self.keys = [self.gold.keys[row] for row in found.tolist()]
+        self.key2index = {k: i for (i, k) in enumerate(self.keys)}
+        self.values = self.gold_values[found]
+        self.key_positions = self.gold_positions[found]
+        self.gold_values = self.gold_positions = None
+        # Orders of the kept rows and number of other lines before them
+        self.orders = [(self._order(-col), self._order(col))
+                for col in self.values.T]
+        self.n_preceding = [(numpy.zeros(len(self.keys), dtype=numpy.int64),
+                numpy.zeros(len(self.keys), dtype=numpy.int64))
+                for col in self.colnames]
+
+    def _order(self, values):
+        return numpy.lexsort((self.key_positions, values))
+
+    def start_counting(self):
+        r"""Prepare for the second pass over the file."""
+        self.counting = True
+
+    def count_preceding(self, values, positions):
+        r"""Count the lines that come before each kept row (second pass)."""
+        for c, (orders, n_preceding) in enumerate(zip(self.orders,
+                self.n_preceding)):
+            col = self.values[:, c]
+            for sign, order, n in zip((-1, 1), orders, n_preceding):
+                n += _count_preceding(sign * col[order],
+                        self.key_positions[order], sign * values[:, c],
+                        positions)
+
+    def rows_of(self, keys):
+        r"""Return an int64 array with the row of each key (-1 if absent)."""
+        key2index = self.key2index
+        return numpy.array([key2index.get(k, -1) for k in keys],
+                dtype=numpy.int64)
+
+    def average(self):
+        r"""Return the average of each column (over all lines)."""
+        return self.sums / self.n_entries if self.n_entries \
+                else numpy.full(len(self.colnames), numpy.nan)
+
+    def positions(self, col):
+        r"""Return two int64 arrays with the position (from 1) of each row
+        among all lines, in descending and in ascending order of column
+        `col` (ties are broken by order in the file)."""
+        ret = []
+        for order, n_preceding in zip(self.orders[col], self.n_preceding[col]):
+            positions = numpy.empty(len(order), dtype=numpy.int64)
+            positions[order] = numpy.arange(1, len(order)+1) + n_preceding
+            ret.append(positions)
+        return tuple(ret)
 
 
 #####################################################
@@ -168,100 +405,228 @@ def warn_once(message, **kwargs):
 #####################################################
 
 class Main(object):
+    r"""Calculates the scores between all gold and pred columns.
+    Keys of both files are aligned once, and each score is calculated
+    for all pairs of columns at once (as matrices [gold col, pred col]),
+    before being printed pair by pair.
+
+    Ranking scores only depend on the positions of the predictions of
+    gold keys among all predictions (see `positions` in the parsers),
+    so that they can also be calculated for StreamedPredictions."""
     def __init__(self, args, parser_gold, parser_pred):
         self.args = args
         self.parser_gold = parser_gold  # type: NumValuesParser
-        self.parser_pred = parser_pred  # type: NumValuesParser
-        self.columns_gold = parser_gold.result_columns
-        self.columns_pred = parser_pred.result_columns
+        self.parser_pred = parser_pred  # type: NumValuesParser | StreamedPredictions
+        self.streamed = isinstance(parser_pred, StreamedPredictions)
+        self.gold = parser_gold.values  # type: numpy.ndarray
+        self.pred = parser_pred.values  # type: numpy.ndarray
+        # Row of each gold key in `pred` and of each pred key in `gold`
+        self.gold2pred = parser_pred.rows_of(parser_gold.keys)
+        self.pred2gold = parser_gold.rows_of(parser_pred.keys)
+        # Gold values aligned with `pred` (0.0 for keys not in gold)
+        self.pred_gold = numpy.where(self.pred2gold[:, None] >= 0,
+                self.gold[self.pred2gold], 0.0)
+        # Pred values aligned with `gold` (avg(predictions) for keys not in pred)
+        self.vec_pred = numpy.where(self.gold2pred[:, None] >= 0,
+                self.pred[self.gold2pred], parser_pred.average())
 
     def run(self):
         self.check_missing()
 
         print("## Gold: `{}`".format(self.args.gold_file.name))
         print("## Pred: `{}`".format(self.args.pred_file.name))
-        for col_gold, col_pred in itertools.product(
-                self.parser_gold.colnames, self.parser_pred.colnames):
+        correls = self.calc_correls()
+        pred_positions = [self.parser_pred.positions(p)
+                for p in xrange(self.pred.shape[1])]
+        gold_ranks = [_ranks(numpy.argsort(col, kind="mergesort"))
+                for col in self.gold.T]
+        resampled = self.calc_resampled(pred_positions)
+
+        for (g, col_gold), (p, col_pred) in itertools.product(
+                enumerate(self.parser_gold.colnames),
+                enumerate(self.parser_pred.colnames)):
             print("\n==> Scores between columns `{}` (gold) and `{}`"\
                   " (pred)".format(col_gold, col_pred))
 
-            avg_pred = sum(self.columns_pred[col_pred].itervalues()) \
-                    / len(self.columns_pred[col_pred])
-
-            vec_gold, vec_pred = [], []  # aligned based on `gold`; unsorted
-            for key_gold in self.columns_gold[col_gold].keys():
-                vec_gold.append(self.columns_gold[col_gold][key_gold])
-                vec_pred.append(self.columns_pred[col_pred] \
-                        .get(key_gold, avg_pred))
-
-            self.print_correl("PearsonR", scipy.stats.pearsonr(vec_gold, vec_pred))
-            self.print_correl("SpearmanRho", scipy.stats.spearmanr(vec_gold, vec_pred))
-            self.print_correl("KendallTau", scipy.stats.kendalltau(vec_gold, vec_pred))
+            for name, (scores, deviations) in correls:
+                self.print_correl(name, (scores[g, p], deviations[g, p]))
 
             ############################################################
 
-            vec_gold, vec_pred = [], []  # aligned & sorted based on `pred` ranking
-            ordered_gold_items = sorted(self.columns_pred[col_pred].iteritems(),
-                    key=lambda item: item[1], reverse=True)  # descending order
-            for key_pred, value_pred in ordered_gold_items:
-                vec_pred.append(value_pred)
-                vec_gold.append(self.columns_gold[col_gold].get(key_pred, 0.0))
-            self.calc_print_precision(vec_gold, vec_pred)
+            self.print_precision(g, p, pred_positions[p][0])
+            if resampled is not None:
+                self.print_bootstrap(g, p, *resampled)
 
             ############################################################
 
-            keys = list(set(self.columns_gold[col_gold]) | set(self.columns_pred[col_pred]))
-            vec_gold = [self.columns_gold[col_gold].get(k, 0.0) for k in keys]
-            vec_pred = [self.columns_pred[col_pred].get(k, 0.0) for k in keys]
-            w, pvalue = scipy.stats.wilcoxon(vec_gold, vec_pred)
-            print("Wilcoxon: W={}; pvalue={:.5g}".format(w, pvalue))
+            if self.streamed:
+                warn_once("Wilcoxon and PredTies unavailable for streamed predictions")
+            else:
+                w, pvalue = self.calc_wilcoxon(g, p)
+                print("Wilcoxon: W={}; pvalue={:.5g}".format(w, pvalue))
 
             ############################################################
 
-            print("NPreds:", len(self.columns_pred[col_pred]))
-            self.print_ties("PredTies", self.columns_pred[col_pred])
+            print("NPreds:", self.parser_pred.n_entries)
+            if not self.streamed:
+                self.print_ties("PredTies", self.pred[:, p])
 
             if self.args.extremities != 0:
-                rank_gold = self.rank(self.columns_gold[col_gold])
-                rank_pred = self.rank(self.columns_pred[col_pred])
-                pairing = [(k, rank_gold[k], rank_pred[k]) \
-                        for k in self.columns_pred[col_pred] if k in rank_gold]
-                pairing.sort(key=lambda (key, rank_a, rank_b): rank_a)
-                self.print_diffs("LowGold[Gold->Pred]", pairing[:self.args.extremities])
-                self.print_diffs("HighGold[Gold->Pred]", reversed(pairing[-self.args.extremities:]))
-                pairing.sort(key=lambda (key, rank_a, rank_b): rank_b)
-                self.print_diffs("LowPred[Gold->Pred]", pairing[:self.args.extremities])
-                self.print_diffs("HighPred[Gold->Pred]", reversed(pairing[-self.args.extremities:]))
-                pairing.sort(key=lambda (key, rank_a, rank_b): abs(rank_a-rank_b))
-                self.print_diffs("BestDiff[Gold->Pred]", pairing[:self.args.extremities])
-                self.print_diffs("WorstDiff[Gold->Pred]", reversed(pairing[-self.args.extremities:]))
-
-
-    def rank(self, key2score):
-        r"""@type key2score: dict[str, float]
-        @rtype: dict[str, int]
-        @return: a dict {context: rank_position}
-        """
-        key_rank_pairs = sorted(key2score.iteritems(), key=lambda (key, score): score)
-        return {key: rank for (rank, (key, score)) in enumerate(key_rank_pairs, 1)}
-
-    def print_diffs(self, name, pairing):
-        r"""@type pairing: list[(str, int, int)]."""
+                self.print_extremities(gold_ranks[g], pred_positions[p][1])
+
+        if resampled is not None:
+            for g, col_gold in enumerate(self.parser_gold.colnames):
+                for (a, b) in itertools.combinations(
+                        xrange(self.pred.shape[1]), 2):
+                    self.print_paired_tests(g, a, b, *resampled)
+
+
+    def calc_resampled(self, pred_positions):
+        r"""Return (observed, bootstrap, permutation), where each one is
+        a dict {metric: array} (see Resampling), or None if neither
+        --bootstrap nor --permutations were given."""
+        if self.args.bootstrap <= 0 and self.args.permutations <= 0:
+            return None
+        positions = numpy.column_stack([numpy.where(self.gold2pred >= 0,
+                desc[self.gold2pred], 0) for (desc, asc) in pred_positions])
+        resampling = Resampling(self.gold, self.vec_pred, positions,
+                self.args.gold_threshold, self.args.random_seed)
+        pool = None
+        if self.args.jobs > 1:
+            # Workers are forked: they share the aligned vectors
+            pool = multiprocessing.Pool(self.args.jobs,
+                    init_resampling_worker, (resampling,))
+        try:
+            bootstrap = resampling.run(
+                    "bootstrap_block", self.args.bootstrap, pool)
+            permutation = resampling.run(
+                    "permutation_block", self.args.permutations, pool)
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        if pool is not None:
+            pool.close()
+            pool.join()
+        return resampling.observed(), bootstrap, permutation
+
+
+    def print_bootstrap(self, g, p, observed, bootstrap, permutation):
+        r"""Print the bootstrap confidence intervals for gold column `g`
+        and pred column `p`."""
+        if self.args.bootstrap <= 0:
+            return
+        for metric, values in sorted(bootstrap.items(), key=_metric_order):
+            if not numpy.isnan(observed[metric][g, p]):
+                low, high = self.confidence_interval(values[:, g, p])
+                print("BootstrapCI[{name}]: [{low:.5f}, {high:.5f}]" \
+                        "  (level={level})".format(name=metric, low=low,
+                        high=high, level=self.args.confidence_level))
+
+
+    def print_paired_tests(self, g, a, b, observed, bootstrap, permutation):
+        r"""Print the paired tests between pred columns `a` and `b` on
+        gold column `g`."""
+        print("\n==> Paired tests between columns `{}` and `{}` (pred)" \
+                " on column `{}` (gold)".format(self.parser_pred.colnames[a],
+                self.parser_pred.colnames[b], self.parser_gold.colnames[g]))
+        for metric, values in sorted(observed.items(), key=_metric_order):
+            diff = values[g, a] - values[g, b]
+            if numpy.isnan(diff):
+                continue
+            if self.args.bootstrap > 0:
+                diffs = bootstrap[metric][:, g, a] - bootstrap[metric][:, g, b]
+                diffs = diffs[~numpy.isnan(diffs)]
+                low, high = self.confidence_interval(diffs)
+                pvalue = min(1.0, 2 * min((diffs <= 0).mean(), (diffs >= 0).mean()))
+                print("PairedBootstrap[{name}]: diff={diff:.5f}  " \
+                        "CI=[{low:.5f}, {high:.5f}]  pvalue={pvalue:.5g}".format(
+                        name=metric, diff=diff, low=low, high=high, pvalue=pvalue))
+            if self.args.permutations > 0:
+                pair = Resampling.pair_index(a, b, self.pred.shape[1])
+                diffs = permutation[metric][:, g, pair]
+                # Tolerance: identical swaps must count as extreme
+                n_extreme = (numpy.abs(diffs) >= abs(diff) - 1e-12).sum()
+                pvalue = (n_extreme + 1) / (len(diffs) + 1)
+                print("Permutation[{name}]: diff={diff:.5f}  pvalue={pvalue:.5g}" \
+                        .format(name=metric, diff=diff, pvalue=pvalue))
+
+
+    def confidence_interval(self, values):
+        r"""Return the (low, high) percentiles of `values` around their
+        median, for --confidence-level (ignoring NaN)."""
+        level = self.args.confidence_level
+        low, high = numpy.nanpercentile(values,
+                [50 * (1-level), 50 * (1+level)])
+        return low, high
+
+
+    def calc_correls(self):
+        r"""Return [(name, (scores, deviations))] for each correlation."""
+        n_cols = (self.gold.shape[1], self.pred.shape[1])
+        vec_gold, vec_pred = self.gold, self.vec_pred  # aligned; unsorted
+        kendall = numpy.zeros((2,) + n_cols)
+        for g, p in itertools.product(*map(xrange, n_cols)):
+            kendall[:, g, p] = scipy.stats.kendalltau(
+                    vec_gold[:, g], vec_pred[:, p])
+        return [("PearsonR", pearson(vec_gold, vec_pred)),
+                ("SpearmanRho", spearman(vec_gold, vec_pred)),
+                ("KendallTau", kendall)]
+
+
+    def calc_wilcoxon(self, g, p):
+        r"""Return the Wilcoxon (W, pvalue) over all keys (with 0.0 for
+        keys missing in one of the files)."""
+        pred_only = self.pred2gold < 0
+        vec_gold = numpy.concatenate((self.gold[:, g],
+                numpy.zeros(pred_only.sum())))
+        vec_pred = numpy.concatenate((numpy.where(self.gold2pred >= 0,
+                self.pred[self.gold2pred, p], 0.0), self.pred[pred_only, p]))
+        return scipy.stats.wilcoxon(vec_gold, vec_pred)
+
+
+    def print_extremities(self, rank_gold, rank_pred):
+        r"""Print the keys with the lowest/highest ranks and rank
+        differences (ranks in ascending order of values, ties broken by
+        order in the file)."""
+        in_gold = numpy.flatnonzero(self.pred2gold >= 0)
+        keys = in_gold  # pred rows of the pairing
+        rank_a, rank_b = rank_gold[self.pred2gold[in_gold]], rank_pred[in_gold]
+        N = self.args.extremities
+        order = numpy.argsort(rank_a, kind="mergesort")
+        self.print_diffs("LowGold[Gold->Pred]", keys, rank_a, rank_b, order[:N])
+        self.print_diffs("HighGold[Gold->Pred]", keys, rank_a, rank_b, order[-N:][::-1])
+        order = numpy.argsort(rank_b, kind="mergesort")
+        self.print_diffs("LowPred[Gold->Pred]", keys, rank_a, rank_b, order[:N])
+        self.print_diffs("HighPred[Gold->Pred]", keys, rank_a, rank_b, order[-N:][::-1])
+        order = numpy.lexsort((rank_b, numpy.abs(rank_a - rank_b)))
+        self.print_diffs("BestDiff[Gold->Pred]", keys, rank_a, rank_b, order[:N])
+        self.print_diffs("WorstDiff[Gold->Pred]", keys, rank_a, rank_b, order[-N:][::-1])
+
+    def print_diffs(self, name, keys, rank_a, rank_b, indexes):
+        r"""Print (key, gold rank, pred rank) for the given `indexes`."""
         diffs = " ".join("{key}[{gold}->{pred}]{ginfo}".format(
-                key=key, gold=rank_a, pred=rank_b, ginfo=self.extra_ginfo(key))
-                for (key, rank_a, rank_b) in pairing)
+                key=self.parser_pred.keys[key], gold=a, pred=b,
+                ginfo=self.extra_ginfo(self.parser_pred.keys[key]))
+                for (key, a, b) in zip(keys[indexes].tolist(),
+                rank_a[indexes].tolist(), rank_b[indexes].tolist()))
         print("{name}{ginfo}: {diffs}".format(name=name, diffs=diffs,
             ginfo="".join("[{}]".format(col) for col in self.args.extremity_gold_info_columns)))
 
     def extra_ginfo(self, key):
-        return "".join("[{}]".format(self.columns_gold[col][key]) \
+        i = self.parser_gold.key2index[key]
+        return "".join("[{}]".format(self.parser_gold.extra_columns[col][i]) \
                 for col in self.args.extremity_gold_info_columns)
 
 
-    def print_ties(self, name, key2score):
-        count = collections.Counter(key2score.itervalues())
-        ties = " ".join("{}(x{})".format(val, n) \
-                for (val, n) in count.most_common() if n > 1)
+    def print_ties(self, name, scores):
+        r"""Print the values of `scores` that appear more than once, by
+        decreasing count (ties by first appearance)."""
+        values, first, count = numpy.unique(scores,
+                return_index=True, return_counts=True)
+        order = numpy.lexsort((first, -count))
+        ties = " ".join("{}(x{})".format(val, n) for (val, n)
+                in zip(values[order].tolist(), count[order].tolist()) if n > 1)
         print("{name}: {ties}".format(name=name, ties=ties or "NoTies"))
 
 
@@ -271,118 +636,413 @@ class Main(object):
             name=name, score=correl_score, stddev=correl_stddev))
 
 
-    def calc_print_precision(self, vec_gold, vec_pred):
-        r"""Calculate and print threshold-based measures
-        (Both vectors must be aligned, with vec_pred
-        sorted by descending order).
+    def print_precision(self, g, p, positions):
+        r"""Calculate and print threshold-based measures for gold
+        column `g` and pred column `p`, given the `positions` (from 1)
+        of the pred rows in descending order of pred values.
         """
         if self.args.gold_threshold is None:
             warn_once("--gold-threshold not specified; skipping some measures")
             return  # Skip these measures
 
-        total_positives = sum(1 for value in vec_gold \
-                if value >= self.args.gold_threshold)
+        relevant = self.pred_gold[:, g] >= self.args.gold_threshold
+        positions = numpy.sort(positions[relevant])  # of the true positives
+        total_positives = len(positions)
 
         if total_positives == 0:
             warn_once("Bug in gold-threshold (too high, got no positive predictions)")
             print("Gold-threshold-too-high")
             return
 
-        self.precs, self.f1s = self.calc_precs_f1s(
-                vec_gold, vec_pred, total_positives)
-
-        if self.args.debug:
+        if self.args.debug and not self.streamed:
+            order = numpy.argsort(self.parser_pred.positions(p)[0])
+            all_precs, _, all_f1s = metrics.curves(
+                    relevant[order], total_positives)
             print("DEBUG:PredList:", " ".join(
-                    "{:.2f}".format(p) for p in vec_pred))
+                    "{:.2f}".format(p) for p in self.pred[order, p]))
             print("DEBUG:GoldList:", " ".join(
-                    "{:.2f}".format(p) for p in vec_gold))
+                    "{:.2f}".format(p) for p in self.pred_gold[order, g]))
             print("DEBUG:PrecisList:", " ".join(
-                    "{:.2f}".format(p) for p in self.precs[1:]))
+                    "{:.2f}".format(p) for p in all_precs))
             print("DEBUG:F1List:", " ".join(
-                    "{:.2f}".format(p) for p in self.f1s[1:]))
+                    "{:.2f}".format(p) for p in all_f1s))
 
         # Output: max(F1 for all possible top subvectors of length N)
-        n_best_f1 = max(xrange(len(self.f1s)), key=lambda N: self.f1s[N])
+        # (All predictions are assumed to be positive)
+        f1, N, prec = metrics.best_f1(positions)
         print("BestF1: {score:.5f}  (@{N}, where prec={prec})".format(
-            score=self.f1s[n_best_f1], N=n_best_f1, prec=self.precs[n_best_f1]))
+            score=f1, N=N, prec=prec))
 
         # Output: average precision among all possible top subvectors
-        avg_prec = sum(self.precs[k] for (k, value_gold) in enumerate(vec_gold, 1) \
-                if value_gold >= self.args.gold_threshold) / total_positives
-        print("AvgPrec: {score:.5f}".format(score=avg_prec))
+        print("AvgPrec: {score:.5f}".format(
+                score=metrics.average_precision(positions)))
 
-        try:
-            # Output: Precision using top subvector of length X
-            print("Prec@{X}: {score:.5f}".format(X=self.args.precision_at,
-                score=self.precs[self.args.precision_at]))
-        except IndexError:
-            warn_once("Prec@{X} unavailable; pred vector has {len} entries",
-                    X=self.args.precision_at, len=len(self.precs))
+        # Output: precision using top subvector of length len(relevant)
+        print("RPrec: {score:.5f}".format(score=metrics.r_precision(positions)))
+
+        # Output: Precision using top subvector of length X
+        for X, score in self.calc_precs_at(positions, self.args.precision_at):
+            print("Prec@{X}: {score:.5f}".format(X=X, score=score))
 
         # Output: Normalized DCG
-        dcg = self.calc_dcg([int(value >= self.args.gold_threshold) \
-                for value in vec_gold])  # relevance in {0, 1}
-        idcg = self.calc_dcg([1]*total_positives)
         print("NDCG: {ndcg:.5f}  (DCG={dcg:.5f})".format(
-                dcg=dcg, ndcg=dcg/idcg))
+                dcg=metrics.dcg(positions), ndcg=metrics.ndcg(positions)))
+        if self.args.ndcg_at:
+            for K, score in zip(self.args.ndcg_at, metrics.ndcg_at(
+                    positions, self.args.ndcg_at).tolist()):
+                print("NDCG@{K}: {score:.5f}".format(K=K, score=score))
+
+
+    def calc_precs_at(self, positions, cutoffs):
+        r"""Return [(X, prec@X)] for each X in `cutoffs`, given the sorted
+        `positions` of the true positives (X indexes the list
+        [-inf, prec@1, ..., prec@NPreds]; others are skipped)."""
+        n_entries = self.parser_pred.n_entries
+        valid = []
+        for X in cutoffs:
+            if -(n_entries+1) <= X <= n_entries:
+                valid.append(X)
+            else:
+                warn_once("Prec@{X} unavailable; pred vector has {len} entries",
+                        X=X, len=n_entries+1)
+        k = numpy.array(valid, dtype=numpy.int64) % (n_entries + 1)
+        precs = numpy.where(k == 0, float("-inf"), metrics.precision_at(positions, k))
+        return zip(valid, precs.tolist())
 
 
-    def calc_dcg(self, relevances):
-        r"""Calculate the DCG as:
-        => rel_0 + \sum_{i=1}^{len(rel)-1} rel_i / log2(i+1)
-        """
-        indexes = xrange(1, len(relevances))
-        return (relevances[0] if relevances else 0) \
-                + sum(relevances[i] / math.log(i+1, 2) for i in indexes)
+    def check_missing(self):
+        r"""Complain about missing gold/value keys."""
+        keys_gold, keys_pred = self.parser_gold.keys, self.parser_pred.keys
+        missing_in_pred = numpy.flatnonzero(self.gold2pred < 0)
+        if self.streamed:
+            n_missing_in_gold = self.parser_pred.n_missing
+            missing_example = self.parser_pred.missing_example
+        else:
+            missing_in_gold = numpy.flatnonzero(self.pred2gold < 0)
+            n_missing_in_gold = len(missing_in_gold)
+            if n_missing_in_gold:
+                missing_example = keys_pred[missing_in_gold[0]]
+
+        if n_missing_in_gold:
+            warn("{n} keys (e.g. `{key}`) not found in gold file; " \
+                    "will use 0.0", n=n_missing_in_gold, key=missing_example)
 
+        if len(missing_in_pred):
+            warn("{n} keys (e.g. `{key}`) not found in prediction file; " \
+                    "will use avg(predictions)", n=len(missing_in_pred),
+                    key=keys_gold[missing_in_pred[0]])
 
-    def calc_precs_f1s(self, vec_gold, vec_pred, total_positives):
-        r"""Return two lists of float (precs@k and F1@k)
-        for all k in 1+len(zip(vec_gold, vec_pred)).
-        """
-        precs, f1s = [float('-inf')], [float('-inf')]
 
-        n_true_positives = 0
-        # (All predictions are assumed to be positive)
-        for n_pred_positives, (value_gold, value_pred) \
-                in enumerate(zip(vec_gold, vec_pred), 1):
-            if value_gold >= self.args.gold_threshold:
-                n_true_positives += 1
-            precision = n_true_positives / n_pred_positives
-            recall = n_true_positives / total_positives
-            precs.append(precision)
-            if precision == 0 or recall == 0:
-                f1s.append(float("-inf"))
-            else:
-                f1s.append(2 / ((1/precision) + (1/recall)))
-        return precs, f1s
+#####################################################
 
+class Resampling(object):
+    r"""Bootstrap resamples and permutations of the gold keys.
+
+    All vectors are aligned on the gold keys: `gold` [key, gold col],
+    `pred` [key, pred col] and the `positions` [key, pred col] of the
+    keys in descending order of predictions (0 for keys that are not
+    predicted). Metrics are PearsonR, SpearmanRho and (with a
+    `threshold`) NDCG, and they are calculated for a whole block of
+    resamples at once:
+
+    * Bootstrap resamples are drawn as an index matrix [resample, key],
+      which is turned into the number of copies of each key in each
+      resample, so that metrics are weighted sums over the keys.
+    * Permutations swap the predictions of random keys between two pred
+      columns (as z-scores for PearsonR, ranks for SpearmanRho and
+      gains for NDCG, so that all columns have the same scale).
+
+    Blocks are reproducible given the `seed` and their index.
+    """
+    def __init__(self, gold, pred, positions, threshold=None, seed=0):
+        self.gold = gold  # type: numpy.ndarray
+        self.pred = pred  # type: numpy.ndarray
+        self.seed = seed
+        self.n_keys = len(gold)
+        self.metrics = ["PearsonR", "SpearmanRho"]
+        if threshold is not None:
+            self.metrics.append("NDCG")
+            self.positions = positions
+            # Predicted keys of each pred col, by increasing position
+            self.position_orders = [numpy.flatnonzero(col > 0)[numpy.argsort(
+                    col[col > 0], kind="mergesort")] for col in positions.T]
+            # Gain of each key [key, gold col, pred col] in the DCG
+            self.relevant = (gold >= threshold) & (positions[:, :1] > 0)
+            self.gains = numpy.where(self.relevant[:, :, None],
+                    metrics.dcg_gains(positions)[:, None, :], 0.0)
+            # Ideal DCG of the first N positions, for all N
+            self.ideal_dcgs = numpy.concatenate(([0.0], numpy.cumsum(
+                    metrics.dcg_gains(numpy.arange(1, self.n_keys+1)))))
+        self.pairs = list(itertools.combinations(xrange(pred.shape[1]), 2))
+        # Ties of each column, for the ranks of the resampled keys
+        self.gold_ties = [_ties(col) for col in gold.T]
+        self.pred_ties = [_ties(col) for col in pred.T]
+        # Scores swapped by the permutations, as (gold, pred) for each metric
+        rank = lambda m: numpy.apply_along_axis(scipy.stats.rankdata, 0, m) \
+                if len(m) else m
+        self.permuted_scores = {"PearsonR": (gold, _zscores(pred)),
+                "SpearmanRho": (rank(gold), rank(pred))}
+
+    @staticmethod
+    def pair_index(a, b, n_cols):
+        r"""Return the index of the pair of columns (a, b) in `pairs`."""
+        return list(itertools.combinations(xrange(n_cols), 2)).index((a, b))
+
+    def run(self, method, n_samples, pool=None):
+        r"""Return {metric: array[sample, ...]} for `n_samples` samples,
+        calculated in blocks by `method` (in `pool`, if given)."""
+        block_size = max(1, RESAMPLING_BLOCK_CELLS // max(self.n_keys, 1))
+        tasks = [(method, index, min(block_size, n_samples - begin))
+                for (index, begin) in enumerate(xrange(0, n_samples, block_size))]
+        if pool is not None:
+            blocks = pool.map(resampling_block, tasks)
+        else:
+            blocks = [getattr(self, method)(i, n) for (_, i, n) in tasks]
+        return {metric: numpy.concatenate([block[metric] for block in blocks])
+                for metric in self.metrics} if blocks else {}
+
+    def observed(self):
+        r"""Return {metric: array[gold col, pred col]} on all gold keys."""
+        weights = numpy.ones((1, self.n_keys))
+        return {metric: values[0] for (metric, values)
+                in self.weighted_metrics(weights).items()}
+
+    def bootstrap_block(self, index, size):
+        r"""Return {metric: array[resample, gold col, pred col]} for a
+        block of `size` bootstrap resamples."""
+        random = numpy.random.RandomState([self.seed, 0, index])
+        resamples = random.randint(0, self.n_keys, (size, self.n_keys))
+        offsets = numpy.arange(size)[:, None] * self.n_keys
+        weights = numpy.bincount((resamples + offsets).ravel(),
+                minlength=size * self.n_keys).reshape(size, self.n_keys)
+        return self.weighted_metrics(weights.astype(numpy.float64))
+
+    def weighted_metrics(self, weights):
+        r"""Return {metric: array[resample, gold col, pred col]}, where
+        `weights` [resample, key] is the number of copies of each key."""
+        gold_ranks = numpy.stack([_resample_ranks(weights, ties)
+                for ties in self.gold_ties], axis=2)
+        pred_ranks = numpy.stack([_resample_ranks(weights, ties)
+                for ties in self.pred_ties], axis=2)
+        ret = {"PearsonR": _weighted_pearson(weights, self.gold, self.pred),
+                "SpearmanRho": _weighted_pearson(weights, gold_ranks, pred_ranks)}
+        if "NDCG" in self.metrics:
+            ret["NDCG"] = self.weighted_ndcgs(weights)
+        return ret
+
+    def weighted_ndcgs(self, weights):
+        r"""Return the NDCG [resample, gold col, pred col] of the rankings
+        where each key appears `weights` [resample, key] times: copy j
+        (from 0) of a key at position p is re-ranked at position p + j +
+        the extra copies (weight - 1) of the keys ranked before it, so
+        that predictions outside of the gold keys keep their place."""
+        n_relevant = weights.dot(self.relevant).astype(numpy.int64)
+        dcgs = numpy.zeros((len(weights),) + self.gains.shape[1:])
+        for col, order in enumerate(self.position_orders):
+            copies = numpy.take(weights, order, axis=1)
+            extra = copies - 1
+            firsts = self.positions[order, col] + numpy.cumsum(extra, axis=1) - extra
+            gains = numpy.zeros_like(copies)
+            for j in xrange(int(copies.max()) if copies.size else 0):
+                gains += numpy.where(j < copies, metrics.dcg_gains(firsts + j), 0.0)
+            dcgs[:, :, col] = gains.dot(self.relevant[order])
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return dcgs / self.ideal_dcgs[n_relevant][:, :, None]
+
+    def permutation_block(self, index, size):
+        r"""Return {metric: array[permutation, gold col, pair]} with the
+        difference of the metric between the columns of each pair in
+        `pairs`, for a block of `size` random permutations."""
+        random = numpy.random.RandomState([self.seed, 1, index])
+        swapped = random.randint(0, 2, (size, self.n_keys)).astype(bool)
+        n_gold = self.gold.shape[1]
+        ret = {metric: numpy.zeros((size, n_gold, len(self.pairs)))
+                for metric in self.metrics}
+        weights = numpy.ones((size, self.n_keys))
+
+        for i, (a, b) in enumerate(self.pairs):
+            for metric, (gold, pred) in self.permuted_scores.items():
+                pred_a = numpy.where(swapped, pred[:, b], pred[:, a])
+                pred_b = numpy.where(swapped, pred[:, a], pred[:, b])
+                ret[metric][:, :, i] = \
+                        _weighted_pearson(weights, gold, pred_a[:, :, None])[:, :, 0] \
+                        - _weighted_pearson(weights, gold, pred_b[:, :, None])[:, :, 0]
+            if "NDCG" in self.metrics:
+                gains_a, gains_b = self.gains[:, :, a], self.gains[:, :, b]
+                dcg_diffs = numpy.where(swapped[:, :, None],
+                        gains_b - gains_a, gains_a - gains_b).sum(axis=1)
+                ideal = self.ideal_dcgs[self.relevant.sum(axis=0)]
+                with numpy.errstate(divide="ignore", invalid="ignore"):
+                    ret["NDCG"][:, :, i] = dcg_diffs / ideal
+        return ret
+
+
+# Number of (sample, key) cells of each block of resamples
+RESAMPLING_BLOCK_CELLS = 2**20
+
+_resampling = None  # Set in each worker process
+
+def init_resampling_worker(resampling):
+    global _resampling
+    _resampling = resampling
+
+
+def resampling_block(task):
+    method, index, size = task
+    return getattr(_resampling, method)(index, size)
+
+
+def _metric_order(item):
+    return ["PearsonR", "SpearmanRho", "NDCG"].index(item[0])
+
+
+def _ties(values):
+    r"""Return (order, starts, groups), where `order` sorts the `values`,
+    `starts` are the indexes in `order` where each distinct value starts
+    and `groups` is the index of the distinct value of each element."""
+    order = numpy.argsort(values, kind="mergesort")
+    sorted_values = values[order]
+    new_value = numpy.concatenate(([True], sorted_values[1:] != sorted_values[:-1]))
+    groups = numpy.empty(len(values), dtype=numpy.int64)
+    groups[order] = numpy.cumsum(new_value) - 1
+    return order, numpy.flatnonzero(new_value), groups
+
+
+def _resample_ranks(weights, ties):
+    r"""Return the rank [resample, key] of each key in each resample,
+    given `weights` [resample, key] (the number of copies of each key)
+    and the `ties` of the values (see `_ties`). Ranks are from 1, with
+    the average rank for tied values (as `scipy.stats.rankdata` on the
+    resampled values)."""
+    order, starts, groups = ties
+    if not len(order):
+        return weights
+    counts = numpy.add.reduceat(numpy.take(weights, order, axis=1),
+            starts, axis=1)
+    before = numpy.cumsum(counts, axis=1) - counts
+    return numpy.take(before + (counts + 1) / 2, groups, axis=1)
+
+
+def _weighted_pearson(weights, a, b):
+    r"""Return the Pearson correlation [resample, a col, b col] between
+    the columns of `a` and `b`, where `weights` [resample, key] is the
+    number of copies of each key. Both `a` and `b` are either the same
+    for all resamples ([key, col]) or not ([resample, key, col])."""
+    total = weights.sum(axis=1)[:, None]
+
+    def weighted_sum(m):
+        if m.ndim == 2:
+            return weights.dot(m)
+        return numpy.einsum("rk,rkc->rc", weights, m)
+
+    if a.ndim == 2:  # Centered only for numerical stability
+        a = a - a.mean(axis=0)
+    if b.ndim == 2:
+        b = b - b.mean(axis=0)
+    if a.ndim == 2 and b.ndim == 2:
+        sum_ab = weights.dot((a[:, :, None] * b[:, None, :]).reshape(
+                len(a), -1)).reshape(len(weights), a.shape[1], b.shape[1])
+    else:
+        sum_ab = numpy.matmul((weights[:, :, None] * a).transpose(0, 2, 1), b)
+    sum_a, sum_b = weighted_sum(a), weighted_sum(b)
+    cov = sum_ab - sum_a[:, :, None] * sum_b[:, None, :] / total[:, :, None]
+    var_a = weighted_sum(a**2) - sum_a**2 / total
+    var_b = weighted_sum(b**2) - sum_b**2 / total
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.clip(cov / numpy.sqrt(
+                var_a[:, :, None] * var_b[:, None, :]), -1.0, 1.0)
+
+
+def _zscores(m):
+    r"""Return the columns of `m` centered and scaled to unit variance."""
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return (m - m.mean(axis=0)) / m.std(axis=0)
 
-    def check_missing(self):
-        r"""Complain about missing gold/value keys."""
-        sample_col_gold = self.columns_gold[self.parser_gold.colnames[0]]
-        sample_col_pred = self.columns_pred[self.parser_pred.colnames[0]]
-        missing_in_pred = [kG for kG in sample_col_gold if kG not in sample_col_pred]
-        missing_in_gold = [kP for kP in sample_col_pred if kP not in sample_col_gold]
 
-        if missing_in_gold:
-            warn("{n} keys (e.g. `{key}`) not found in gold file; " \
-                    "will use 0.0", n=len(missing_in_gold), key=missing_in_gold[0])
+#####################################################
 
-        if missing_in_pred:
-            warn("{n} keys (e.g. `{key}`) not found in prediction file; " \
-                    "will use avg(predictions)", n=len(missing_in_pred), key=missing_in_pred[0])
+def pearson(a, b):
+    r"""Return (r, pvalue) matrices with the Pearson correlation between
+    each column of `a` and each column of `b` (as `scipy.stats.pearsonr`)."""
+    a = a - a.mean(axis=0)
+    b = b - b.mean(axis=0)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        r = a.T.dot(b) / numpy.sqrt(numpy.outer(
+                (a**2).sum(axis=0), (b**2).sum(axis=0)))
+        r = numpy.clip(r, -1.0, 1.0)
+        df = len(a) - 2
+        t_squared = r**2 * (df / ((1.0 - r) * (1.0 + r)))
+        pvalue = scipy.special.betainc(0.5*df, 0.5,
+                numpy.clip(df / (df + t_squared), 0.0, 1.0))
+    pvalue[numpy.abs(r) == 1.0] = 0.0
+    return r, pvalue
+
+
+def spearman(a, b):
+    r"""Return (rho, pvalue) matrices with the Spearman correlation between
+    each column of `a` and each column of `b` (as `scipy.stats.spearmanr`)."""
+    rank = lambda m: numpy.apply_along_axis(scipy.stats.rankdata, 0, m) \
+            if len(m) else m
+    rho = pearson(rank(a), rank(b))[0]
+    df = len(a) - 2
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        t = rho * numpy.sqrt(df / ((rho+1.0)*(1.0-rho)))
+        pvalue = 2 * scipy.stats.t.sf(numpy.abs(t), df)
+    return rho, pvalue
+
+
+def _count_preceding(sorted_values, sorted_positions, values, positions):
+    r"""Return, for each of the (value, position) pairs sorted in
+    `sorted_values` and `sorted_positions`, how many of the pairs in
+    `values` and `positions` come before it in that order."""
+    index = numpy.searchsorted(sorted_values, values, "left")
+    tied = numpy.searchsorted(sorted_values, values, "right") > index
+    # Ties are broken by position, with integer keys (index of the first
+    # equal sorted value, position+1), where untied values have position 0
+    scale = max(sorted_positions.max() if len(sorted_positions) else 0,
+            positions.max() if len(positions) else 0) + 2
+    sorted_keys = numpy.searchsorted(sorted_values, sorted_values, "left") \
+            * scale + sorted_positions + 1
+    index = numpy.searchsorted(sorted_keys,
+            index * scale + numpy.where(tied, positions + 1, 0), "left")
+    return numpy.cumsum(numpy.bincount(index,
+            minlength=len(sorted_values)+1))[:len(sorted_values)]
+
+
+def _ranks(order):
+    r"""Return the rank (from 1) of each element, given their `order`."""
+    ret = numpy.empty(len(order), dtype=numpy.int64)
+    ret[order] = numpy.arange(1, len(order)+1)
+    return ret
 
 
 #####################################################
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    if args.stream_predictions and args.gold_threshold is not None \
+            and args.gold_threshold <= 0:
+        parser.error("--stream-predictions requires --gold-threshold > 0 " \
+                "(keys not in gold_file have value 0.0)")
     parser_gold = NumValuesParser(id_col=args.gold_id_column,
-           colnames=args.gold_value_columns)
-    parser_pred = NumValuesParser(id_col=args.pred_id_column,
-           colnames=args.pred_value_columns,
-           inverted_scales=args.inverted_scales)
+           colnames=args.gold_value_columns,
+           extra_colnames=args.extremity_gold_info_columns)
     csv.parse_csv(parser_gold, input_file=args.gold_file)
-    csv.parse_csv(parser_pred, input_file=args.pred_file)
+    if args.stream_predictions:
+        parser_pred = StreamedPredictions(id_col=args.pred_id_column,
+               colnames=args.pred_value_columns, gold=parser_gold,
+               inverted_scales=args.inverted_scales)
+        csv.parse_csv_batches(parser_pred, input_file=args.pred_file)
+        try:
+            args.pred_file.seek(0)
+        except IOError:
+            parser.error("--stream-predictions requires pred_file to be " \
+                    "a regular file (it is read twice)")
+        parser_pred.start_counting()
+        csv.parse_csv_batches(parser_pred, input_file=args.pred_file)
+    else:
+        parser_pred = NumValuesParser(id_col=args.pred_id_column,
+               colnames=args.pred_value_columns,
+               inverted_scales=args.inverted_scales)
+        csv.parse_csv(parser_pred, input_file=args.pred_file)
     Main(args, parser_gold, parser_pred).run()
@@ -50,9 +50,12 @@ parser.add_argument("input_file", type=argparse.FileType("r"),
 ############################################################
 
 class DataCollector(csv.CSVHandler):
+    decode_columns = False  # Lines are re-emitted as they were read
+
     def __init__(self, args, valid_values):
         self.args = args
         self.valid_values = valid_values
+        self.columns = [args.column_name]
 
 
     def handle_header(self, line, header_names):
@@ -62,21 +65,21 @@ class DataCollector(csv.CSVHandler):
         print(line)
 
 
-    def handle_data(self, line, data_namedtuple):
-        r"""Add data_namedtuple to `self.data`. Note that multiple namedtuple
-        classes may have been produced (with different arity and argument
-        name/order). They are all required to have `target` and `context`, though.
+    def handle_data(self, byteline, data_namedtuple):
+        r"""Print `byteline` if its value in `column_name` is valid.
+        The value is compared as undecoded bytes, so lines that are
+        filtered out are never decoded at all.
         """
-        value = getattr(data_namedtuple, self.args.column_name)
+        value, = data_namedtuple
         if value in self.valid_values:
-            print("\t".join(data_namedtuple))
+            print(byteline)
 
 
 ############################################################
 
 def main():
     args = parser.parse_args()
-    valid_values = args.values.read().decode('utf8').strip().split("\n")
+    valid_values = set(args.values.read().strip().split(b"\n"))
 
     data_parser = csv.parse_csv
     collector = data_parser(DataCollector(args, valid_values),
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import os
+import sys
+
+from lib import csv, profiles
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Convert the output of `build_profiles` into a binary profile store.
+
+        The store is a directory of memory-mappable arrays (see
+        `lib/profiles.py`), which scripts can open in milliseconds
+        instead of re-parsing the CSV file.""")
+parser.add_argument("-c", "--columns", nargs="*", default=None,
+        help="""Score columns to keep in the store (default: all columns).""")
+parser.add_argument("input_file", type=argparse.FileType("r"),
+        help="""A CSV file with profiles, as output by `build_profiles`.""")
+parser.add_argument("store_dir",
+        help="""Directory where the profile store will be written.""")
+
+
+#####################################################
+
+def main():
+    args = parser.parse_args()
+    csv.parse_csv_batches(profiles.ProfileStoreWriter(
+            args.store_dir, score_columns=args.columns),
+            input_file=args.input_file)
+    store = profiles.ProfileStore(args.store_dir)
+    print("Wrote {} targets, {} contexts and {} pairs to {}".format(
+            len(store), len(store.contexts), len(store.context_index),
+            args.store_dir), file=sys.stderr)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
@@ -52,6 +52,7 @@ class StatsPrinter(csv.CSVHandler):
         self.current_discriminant = None
         self.stats = None
         self.global_stats = statistics.Statistics()
+        self.columns = self.args.discriminate_by + [self.args.column_name]
         fields = self.args.discriminate_by \
                 + ["NLines", "ArithAvg", "SampleStdDev"]
         print(*fields, sep="\t")
@@ -0,0 +1,347 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import codecs
+import collections
+import math
+import multiprocessing
+import numpy
+import os
+import sys
+
+from lib import csv
+from lib import metrics
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+DEFAULT_MEASURES = ["refs", "energy@100", "U@100", "Rprec", "P@10", "P@100", "MAP"]
+
+# Number of targets evaluated in each block (the unit of parallel work)
+TARGETS_PER_BLOCK = 1000
+
+
+parser = argparse.ArgumentParser(description="""
+        Evaluate a ranked thesaurus against reference resources, target
+        by target, as `src/old/eval_measures.py`. The input has one line
+        per (target, neighbor), with a `rank` column and one column per
+        resource, whose value is nonzero iff the neighbor is related to
+        the target in that resource (e.g. as output by
+        `src/old/get_neighbours.py`). Lines with rank 0 (the target
+        itself) are ignored.
+
+        For each target and resource, the measures are calculated on the
+        ranks of the related neighbors (targets without related neighbor
+        in any resource are skipped). The output has one line per target,
+        in input order, with columns `<resource>-<measure>`. Macro
+        averages (over targets) and micro averages (over all related
+        neighbors) are printed to stderr.
+
+        Measures:
+        * refs: number of related neighbors
+        * energy@K: tanh-smoothed energy of the ranks, at threshold K  [0..1]
+        * U@K: proportion of related neighbors ranked after K  [0..1]
+        * Rprec: precision of the top R neighbors, R=refs  [0..1]
+        * P@K: precision of the top K neighbors  [0..1]
+        * MAP: average precision  [0..1]
+        """)
+parser.add_argument("-m", "--measures", nargs="+", default=DEFAULT_MEASURES,
+        help="""Measures to calculate, in this order (default: {}).""" \
+        .format(" ".join(DEFAULT_MEASURES)))
+parser.add_argument("--target-column", default=None, type=unicode,
+        help="""Column name of the targets (default: first column).
+        Lines of each target must be contiguous.""")
+parser.add_argument("--rank-column", default="rank", type=unicode,
+        help="""Column name of the ranks of neighbors (default: rank).""")
+parser.add_argument("-r", "--resource-columns", nargs="+", default=None,
+        type=unicode,
+        help="""Column names of the resources (default: all columns
+        after the rank column).""")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="""Evaluate blocks of targets in this number of processes
+        (default: 1). Output is still in input order.""")
+parser.add_argument("thesaurus_file", type=argparse.FileType('r'),
+        nargs="?", default=sys.stdin,
+        help="""The thesaurus to evaluate (default: stdin).""")
+
+
+#####################################################
+
+class Measure(collections.namedtuple("Measure", "name kind k")):
+    r"""A measure name, such as "P@10" (kind "P@", k=10)."""
+    KINDS = ("refs", "energy@", "U@", "Rprec", "P@", "MAP")
+
+    @staticmethod
+    def parse(name):
+        kind, k = name, None
+        if "@" in name:
+            kind, k = name[:name.index("@")+1], name[name.index("@")+1:]
+        if kind not in Measure.KINDS or (k is not None and not k.isdigit()):
+            raise ValueError("Unknown measure: {!r}".format(name))
+        return Measure(name, kind, None if k is None else int(k))
+
+
+def evaluate_block(block_measures):
+    r"""Return (output, evaluation) for a block of (target, [positions
+    for each resource]), where `output` has the lines for the targets
+    and `evaluation` is an array [target, resource, (values,
+    numerators, denominators), measure].
+
+    All rankings of the block are concatenated, and each measure is
+    calculated with sums over the positions of each ranking. Its value
+    is numerator/denominator (as in `src/old/eval_measures.py`), and
+    its micro average is sum(numerators) / sum(denominators)."""
+    block, measures = block_measures
+    rankings = [positions for (_, resource_positions) in block
+            for positions in resource_positions]
+    lengths = numpy.array([len(p) for p in rankings], dtype=numpy.int64)
+    ids = numpy.repeat(numpy.arange(len(rankings)), lengths)
+    positions = numpy.concatenate(rankings).astype(numpy.float64)
+    # Index (from 1) of each position in its ranking
+    indexes = numpy.arange(1, len(positions)+1) - numpy.repeat(
+            numpy.cumsum(lengths) - lengths, lengths)
+    sums = lambda values: numpy.bincount(ids, weights=values,
+            minlength=len(rankings))
+
+    evaluation = numpy.zeros((len(rankings), 3, len(measures)))
+    for i, m in enumerate(measures):
+        if m.kind == "refs":
+            evaluation[:, 1:, i] = numpy.column_stack((lengths, numpy.ones_like(lengths)))
+        elif m.kind == "energy@":
+            # (The tanh of the ranks of the best ranking, as in
+            # `metrics.energy_at`, starts at rank 0)
+            norm_factor = math.atanh(0.95) / m.k
+            smooth_min = numpy.concatenate(([0.0], numpy.cumsum(numpy.tanh(
+                    numpy.arange(lengths.max()) * norm_factor))))[lengths]
+            evaluation[:, 1, i] = sums(numpy.tanh(positions * norm_factor)) - smooth_min
+            evaluation[:, 2, i] = lengths - smooth_min
+        elif m.kind == "U@":
+            evaluation[:, 1, i] = sums(positions > m.k)
+            evaluation[:, 2, i] = lengths
+        elif m.kind == "Rprec":
+            evaluation[:, 1, i] = sums(positions <= lengths[ids])
+            evaluation[:, 2, i] = lengths
+        elif m.kind == "P@":
+            evaluation[:, 1, i] = sums(positions <= m.k)
+            evaluation[:, 2, i] = m.k
+        elif m.kind == "MAP":
+            evaluation[:, 1, i] = sums(indexes / positions)
+            evaluation[:, 2, i] = lengths
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        evaluation[:, 0] = evaluation[:, 1] / evaluation[:, 2]
+    # MAP of rankings without related neighbors is 0.0
+    is_map = numpy.array([m.kind == "MAP" for m in measures], dtype=bool)
+    evaluation[:, 0, is_map] = numpy.nan_to_num(evaluation[:, 0, is_map])
+
+    evaluation = evaluation.reshape((len(block), -1, 3, len(measures)))
+    output = "".join("{}\t{}\n".format(target, "\t".join(
+            _format(m, value) for values in target_values[:, 0]
+            for (m, value) in zip(measures, values.tolist())))
+            for ((target, _), target_values) in zip(block, evaluation))
+    return output, evaluation
+
+
+def _format(measure, value):
+    return "{:d}".format(int(value)) if measure.kind == "refs" \
+            else "{:.6f}".format(value)
+
+
+#####################################################
+
+class RankedThesaurus(csv.CSVHandler):
+    r"""Collect the sorted ranks of the neighbors of each target that are
+    related in each resource, and pass them to `handle_block` in blocks
+    of (target, [positions for each resource]). The input must be
+    grouped by target (this is only checked for related neighbors)."""
+    def __init__(self, target_col, rank_col, resource_cols, handle_block):
+        self.target_col = target_col
+        self.rank_col = rank_col
+        self.resource_cols = resource_cols
+        self.handle_block = handle_block
+        self.current_target = None
+        self.current = []  # Blocks of (ranks, related) of current target
+        self.finished = set()
+        self.block = []
+
+    def handle_header(self, line, header_names):
+        if self.target_col is None:
+            self.target_col = header_names[0]
+        if self.rank_col not in header_names:
+            raise Exception("Missing rank column: {}".format(self.rank_col))
+        if self.resource_cols is None:
+            self.resource_cols = list(header_names[
+                    header_names.index(self.rank_col)+1:])
+        self.columns = [self.target_col, self.rank_col] + self.resource_cols
+
+    def handle_batch(self, batch):
+        # Only lines with some related neighbor are kept (and decoded)
+        related = numpy.column_stack([_nonzero(batch.raw(col))
+                for col in self.resource_cols])
+        rows = numpy.flatnonzero(related.any(axis=1)).tolist()
+        raw_ranks = batch.raw(self.rank_col)
+        ranks = numpy.array([int(raw_ranks[i]) for i in rows], dtype=numpy.int64)
+        related = related[rows] & (ranks != 0)[:, None]
+        raw_targets = batch.raw(self.target_col)
+        targets = [raw_targets[i] for i in rows]
+        starts = [i for i in xrange(len(targets))
+                if i == 0 or targets[i] != targets[i-1]]
+        targets = {i: targets[i].decode(FILE_ENC, errors="replace")
+                for i in starts}
+        for begin, end in zip(starts, starts[1:] + [len(rows)]):
+            if targets[begin] != self.current_target:
+                self.finish_target()
+                self.current_target = targets[begin]
+                if self.current_target in self.finished:
+                    raise Exception("Input is not grouped by target: {} " \
+                            "appears again".format(self.current_target))
+            self.current.append((ranks[begin:end], related[begin:end]))
+
+    def finish_target(self):
+        r"""Add the current target to the block (if it has related neighbors)."""
+        if self.current_target is None:
+            return
+        self.finished.add(self.current_target)
+        ranks = numpy.concatenate([r for (r, _) in self.current])
+        related = numpy.concatenate([rel for (_, rel) in self.current])
+        self.current = []
+        if related.any():
+            self.block.append((self.current_target, [
+                    metrics.sorted_positions(ranks[related[:, i]])
+                    for i in xrange(related.shape[1])]))
+            if len(self.block) >= TARGETS_PER_BLOCK:
+                self.flush()
+
+    def flush(self):
+        if self.block:
+            self.handle_block(self.block)
+            self.block = []
+
+    def end(self):
+        self.finish_target()
+        self.flush()
+
+
+def _nonzero(raw_values):
+    r"""Return a bool array telling which raw values are nonzero numbers
+    (only values other than "0" are parsed)."""
+    ret = numpy.array([value != b"0" for value in raw_values], dtype=bool)
+    for i in numpy.flatnonzero(ret).tolist():
+        ret[i] = float(raw_values[i]) != 0
+    return ret
+
+
+class Main(object):
+    r"""Evaluates blocks of targets (in a pool of processes, with
+    --jobs), prints their measures in input order and accumulates
+    the macro/micro averages."""
+    def __init__(self, args):
+        self.args = args
+        self.measures = [Measure.parse(name) for name in args.measures]
+        self.pool = None
+        self.pending = collections.deque()  # AsyncResults, in input order
+        self.sums = None  # [resource, (values, numerators, denominators), measure]
+        self.counts = None  # [resource, measure] (number of non-NaN values)
+
+    def run(self):
+        if self.args.jobs > 1:
+            self.pool = multiprocessing.Pool(self.args.jobs)
+        try:
+            self.thesaurus = RankedThesaurus(self.args.target_column,
+                    self.args.rank_column, self.args.resource_columns,
+                    self.handle_block)
+            csv.parse_csv_batches(self.thesaurus, self.args.thesaurus_file)
+            self.print_ready(0)
+        except:
+            if self.pool is not None:
+                self.pool.terminate()
+            raise
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        self.print_averages()
+
+    def handle_block(self, block):
+        if self.sums is None:
+            self.print_header()
+        if self.pool is None:
+            self.print_block(evaluate_block((block, self.measures)))
+        else:
+            self.pending.append(self.pool.apply_async(
+                    evaluate_block, ((block, self.measures),)))
+            self.print_ready(2 * self.args.jobs)
+
+    def print_ready(self, max_pending):
+        r"""Print the evaluated blocks, waiting for the first ones
+        while more than `max_pending` are pending."""
+        while self.pending and (self.pending[0].ready()
+                or len(self.pending) > max_pending):
+            self.print_block(self.pending.popleft().get())
+
+    def print_header(self):
+        n_resources = len(self.thesaurus.resource_cols)
+        self.sums = numpy.zeros((n_resources, 3, len(self.measures)))
+        self.counts = numpy.zeros((n_resources, len(self.measures)))
+        print(self.thesaurus.target_col, "\t".join(self.names()), sep="\t")
+
+    def names(self):
+        return ["{}-{}".format(resource, m.name) for resource
+                in self.thesaurus.resource_cols for m in self.measures]
+
+    def print_block(self, output_evaluation):
+        output, evaluation = output_evaluation
+        sys.stdout.write(output)
+        known = ~numpy.isnan(evaluation)
+        self.sums += numpy.where(known, evaluation, 0.0).sum(axis=0)
+        self.counts += known[:, :, 0].sum(axis=0)
+
+    def print_averages(self):
+        if self.sums is None:
+            print("WARNING: No target with related neighbors", file=sys.stderr)
+            return
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            macro = (self.sums[:, 0] / self.counts).ravel()
+            micro = (self.sums[:, 1] / self.sums[:, 2]).ravel()
+        for name, average in zip(self.names(), macro.tolist()):
+            print("Average {}: {}".format(name, average), file=sys.stderr)
+        for name, average in zip(self.names(), micro.tolist()):
+            print("MicroAverage {}: {}".format(name, average), file=sys.stderr)
+
+
+#####################################################
+
+def main():
+    sys.stdout = codecs.getwriter(FILE_ENC)(sys.stdout)
+    sys.stderr = codecs.getwriter(FILE_ENC)(sys.stderr)
+    args = parser.parse_args()
+    for name in args.measures:
+        try:
+            Measure.parse(name)
+        except ValueError as e:
+            parser.error(e)
+    Main(args).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from lib import counting
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Filter and count raw `target context` pairs, as `filterRaw.sh`,
+        in a single pass over the input (no sorting of the raw pairs).
+
+        Keeps targets and contexts seen more than THRESH_WORDS times and
+        longer than 1 character, and pairs of those seen at least
+        THRESH_PAIRS times. The output is the same as `filterRaw.sh`:
+        `target context count` lines, sorted as with `LC_ALL=C sort`, in
+        `<input_file>.s.filter.t<T>.c<T>.tc<P>.u`.""")
+parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="""Count this number of chunks of the input file in parallel
+        (default: 1).""")
+parser.add_argument("--max-pairs", type=int, default=counting.DEFAULT_MAX_PAIRS,
+        help="""Maximum number of distinct pairs kept in memory (per job)
+        before spilling counts to disk (default: {}).""".format(
+        counting.DEFAULT_MAX_PAIRS))
+parser.add_argument("--partitions", type=int, default=counting.DEFAULT_PARTITIONS,
+        help="""Number of disk partitions for spilled pairs (default: {}).
+        Each partition must fit in memory when it is summed up.""".format(
+        counting.DEFAULT_PARTITIONS))
+parser.add_argument("--tmp-dir", default=None,
+        help="""Directory where spilled counts are written, in a
+        subdirectory removed at the end (default: the system temporary
+        directory).""")
+parser.add_argument("-o", "--output", default=None,
+        help="""Output file (default: same name as `filterRaw.sh`).""")
+parser.add_argument("input_file",
+        help="""File with raw `target context` pairs, one per line.""")
+parser.add_argument("thresh_words", type=int,
+        help="""Threshold for targets and contexts (typically 50-100).""")
+parser.add_argument("thresh_pairs", type=int,
+        help="""Threshold for pairs (typically 2-5).""")
+
+
+#####################################################
+
+def count_chunk(chunk):
+    args, tmp_dir, (begin, end) = chunk
+    return counting.count_file(args.input_file, begin, end,
+            n_partitions=args.partitions, max_pairs=args.max_pairs,
+            tmp_dir=tmp_dir, spill=args.jobs > 1)
+
+
+def main():
+    args = parser.parse_args()
+    output = args.output or "{}.s.filter.t{t}.c{t}.tc{p}.u".format(
+            args.input_file, t=args.thresh_words, p=args.thresh_pairs)
+
+    print("Counting targets, contexts and pairs in {}".format(
+            args.input_file), file=sys.stderr)
+    # Spilled pairs are all written in a temporary directory, which is
+    # removed at the end, even if a worker or the merge fails
+    tmp_dir = tempfile.mkdtemp(dir=args.tmp_dir, prefix="filter-raw-")
+    try:
+        if args.jobs > 1:
+            chunks = [(args, tmp_dir, offsets) for offsets in
+                    counting.chunk_offsets(args.input_file, args.jobs)]
+            pool = multiprocessing.Pool(args.jobs)
+            try:
+                chunks = pool.map(count_chunk, chunks)
+            except:
+                pool.terminate()
+                raise
+            pool.close()
+            pool.join()
+        else:
+            chunks = [count_chunk((args, tmp_dir, (0, None)))]
+
+        targets, contexts = counting.merge_counts(chunks)
+        targets = counting.frequent_words(targets, args.thresh_words)
+        contexts = counting.frequent_words(contexts, args.thresh_words)
+        print("Keeping {} targets and {} contexts".format(
+                len(targets), len(contexts)), file=sys.stderr)
+
+        n_pairs = 0
+        with open(output, "wb") as output_file:
+            for pair, count in counting.filtered_pairs(chunks, targets,
+                    contexts, args.thresh_pairs, tmp_dir=tmp_dir):
+                output_file.write(b"%s %d\n" % (pair, count))
+                n_pairs += 1
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print("Wrote {} pairs to {}".format(n_pairs, output), file=sys.stderr)
+    print("In order to build the association profiles for the targets, " \
+            "you may run:", file=sys.stderr)
+    print("  ./build_profiles {} > {}.profiles".format(
+            output, args.input_file), file=sys.stderr)
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Association measures between targets and contexts, calculated
+for all pairs at once, with the same definitions as `build_profiles`.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import numpy
+import sys
+
+from . import csv, sparse
+
+# Maximum length of a word, in bytes (longer words are ignored)
+MAX_LENGTH = 50
+
+COUNT_COLUMNS = ("f_tc", "f_t", "f_c")
+MEASURES = ("cond_prob", "pmi", "npmi", "lmi", "tscore", "zscore", "dice",
+        "chisquare", "loglike", "affinity", "entropy_target", "entropy_context")
+HEADER = ("target", "id_target", "context", "id_context") \
+        + COUNT_COLUMNS + MEASURES
+
+
+class PairCounts(object):
+    r"""Counts of (target, context) pairs and their marginals.
+
+    Attributes:
+    -- targets, contexts: Lists of (byte) strings, by order of first
+    appearance, which is also their `id_target`/`id_context`.
+    -- pairs: A `sparse.SparseVectors` with the count of each pair
+    (one row per target; the last count wins for repeated pairs).
+    -- f_t, f_c, n: Marginal counts of targets and contexts, and
+    total count (repeated pairs are counted every time).
+    -- rows, columns, f_tc: Target index, context index and
+    count of each pair, in the order of `pairs`.
+    """
+    def __init__(self, targets, contexts, rows, columns, counts):
+        self.targets, self.contexts = targets, contexts
+        self.f_t = numpy.bincount(rows, counts, minlength=len(targets))
+        self.f_c = numpy.bincount(columns, counts, minlength=len(contexts))
+        self.n = counts.sum()
+        self.pairs = sparse.SparseVectors.from_triples(
+                targets, rows, columns, counts)
+        self.n_repeated = len(rows) - len(self.pairs.data)
+        self.rows = numpy.repeat(numpy.arange(len(targets)), self.pairs.lengths)
+        self.columns = self.pairs.indices
+        self.f_tc = self.pairs.data
+
+    def __len__(self):
+        return len(self.f_tc)
+
+
+def read_triples(input_file, max_length=MAX_LENGTH,
+        batch_size=csv.DEFAULT_BATCH_SIZE):
+    r"""Return a PairCounts with the `target context count` triples
+    (separated by whitespace) of `input_file`, such as the `.u` file
+    created by `filterRaw.sh`. Triples with a word longer than
+    `max_length` bytes are ignored."""
+    targets, contexts = {}, {}
+    chunks = []  # list[(rows, columns, counts)]
+    n_ignored = 0
+    lines = True
+    while lines:
+        lines = input_file.readlines(batch_size * 32)
+        triples = [fields for fields in (line.split() for line in lines)
+                if len(fields) == 3]
+        kept = [t for t in triples
+                if len(t[0]) <= max_length and len(t[1]) <= max_length]
+        n_ignored += len(triples) - len(kept)
+        if kept:
+            words_t, words_c, counts = zip(*kept)
+            chunks.append((sparse._indexes(words_t, targets),
+                    sparse._indexes(words_c, contexts),
+                    numpy.array(counts).astype(numpy.float64)))
+    if n_ignored:
+        print("WARNING: Ignored {} triples with words longer than {} " \
+                "characters".format(n_ignored, max_length), file=sys.stderr)
+    if chunks:
+        rows, columns, counts = [numpy.concatenate(c) for c in zip(*chunks)]
+    else:
+        rows = columns = numpy.empty(0, dtype=numpy.int64)
+        counts = numpy.empty(0)
+    return PairCounts(_by_index(targets), _by_index(contexts),
+            rows, columns, counts)
+
+
+def _by_index(str2index):
+    ret = [None] * len(str2index)
+    for s, i in str2index.iteritems():
+        ret[i] = s
+    return ret
+
+
+############################################################
+
+def association_measures(counts, measures=MEASURES):
+    r"""Return an OrderedDict with the array of each of the `measures`
+    (in the order of MEASURES) for all pairs in `counts` (a PairCounts).
+    Only the requested measures (and what they depend on) are calculated.
+    """
+    for name in measures:
+        assert name in MEASURES, name
+    cw1w2, n = counts.f_tc, counts.n
+    cw1, cw2 = counts.f_t[counts.rows], counts.f_c[counts.columns]
+    ret = collections.OrderedDict()
+    cache = {}
+
+    def get(name, calculate):
+        if name not in cache:
+            cache[name] = calculate()
+        return cache[name]
+
+    ew1w2 = lambda: get("ew1w2", lambda: cw1 * cw2 / n)
+    pmi = lambda: get("pmi", lambda: numpy.log(cw1w2) - numpy.log(ew1w2()))
+
+    def contingency():
+        # Observed counts are truncated to int, as in `build_profiles`
+        observed = (cw1w2, numpy.trunc(cw1 - cw1w2), numpy.trunc(cw2 - cw1w2),
+                numpy.trunc(n - cw1 - cw2 + cw1w2))
+        expected = (ew1w2(), cw1 * (n-cw2) / n, (n-cw1) * cw2 / n,
+                (n-cw1) * (n-cw2) / n)
+        return zip(observed, expected)
+
+    def chisquare():
+        return sum((o - e)**2 / e for (o, e) in contingency())
+
+    def loglike():
+        # `build_profiles` sums its PRODLOG macros without parentheses,
+        # so its value is the first non-zero term: this keeps it identical
+        ret = numpy.zeros(len(cw1w2))
+        done = numpy.zeros(len(cw1w2), dtype=bool)
+        for o, e in contingency():
+            use = ~done & (o != 0)
+            ret[use] = (o * numpy.log(o / e))[use]
+            done |= use
+        return 2.0 * ret
+
+    def entropies(index, marginals):
+        p = cw1w2 / marginals[index]
+        return -numpy.bincount(index, p * numpy.log(p),
+                minlength=len(marginals))[index]
+
+    calculations = {
+        "cond_prob": lambda: cw1w2 / cw1,
+        "pmi": pmi,
+        "npmi": lambda: pmi() / (numpy.log(n) - numpy.log(cw1w2)),
+        "lmi": lambda: cw1w2 * pmi(),
+        "tscore": lambda: (cw1w2 - ew1w2()) / numpy.sqrt(cw1w2),
+        "zscore": lambda: (cw1w2 - ew1w2()) / numpy.sqrt(ew1w2()),
+        "dice": lambda: 2.0 * cw1w2 / (cw1 + cw2),
+        "chisquare": chisquare,
+        "loglike": loglike,
+        "affinity": lambda: 0.5 * (cw1w2 / cw1 + cw1w2 / cw2),
+        "entropy_target": lambda: entropies(counts.rows, counts.f_t),
+        "entropy_context": lambda: entropies(counts.columns, counts.f_c),
+    }
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        for name in MEASURES:
+            if name in measures:
+                ret[name] = calculations[name]()
+    return ret
+
+
+def write_profiles(output, counts, measures, batch_size=csv.DEFAULT_BATCH_SIZE):
+    r"""Write the pairs in `counts` as output by `build_profiles`, with
+    the given `measures` (an OrderedDict, see `association_measures`).
+    Pairs are grouped by target, in the order of their ids."""
+    print(*(HEADER[:len(HEADER)-len(MEASURES)] + tuple(measures)),
+            sep="\t", file=output)
+    line_format = b"\t".join([b"%s", b"%d", b"%s", b"%d", b"%.2f", b"%.2f",
+            b"%.2f"] + [b"%f"] * len(measures)) + b"\n"
+    f_t, f_c = counts.f_t[counts.rows], counts.f_c[counts.columns]
+    for begin in xrange(0, len(counts), batch_size):
+        batch = slice(begin, begin + batch_size)
+        rows, columns = counts.rows[batch].tolist(), counts.columns[batch].tolist()
+        columns_data = [[counts.targets[r] for r in rows], rows,
+                [counts.contexts[c] for c in columns], columns,
+                counts.f_tc[batch].tolist(), f_t[batch].tolist(),
+                f_c[batch].tolist()]
+        columns_data.extend(m[batch].tolist() for m in measures.itervalues())
+        output.writelines(line_format % line for line in zip(*columns_data))
@@ -0,0 +1,210 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Counting of raw `target context` pairs, as done by `filterRaw.sh`.
+
+Targets, contexts and pairs are counted in hash tables. When there are
+too many distinct pairs in memory, their counts are spilled to disk, in
+partitions by hash of the pair, so that each partition can be summed
+up later on its own. Pairs are bytes `target + b" " + context`, which
+is also the line that `filterRaw.sh` sorts and counts with `uniq -c`.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import heapq
+import os
+import tempfile
+import zlib
+
+# Maximum number of distinct pairs in memory before spilling to disk
+DEFAULT_MAX_PAIRS = 20000000
+DEFAULT_PARTITIONS = 64
+
+
+class ChunkCounts(object):
+    r"""Counts of targets, contexts and pairs in (a chunk of) a raw file.
+
+    Attributes:
+    -- targets, contexts: Dict[bytes, int].
+    -- pairs: Dict[bytes, int] with the pairs not spilled yet.
+    -- partitions: List of lists of spill file names (one per partition).
+    """
+    def __init__(self, n_partitions, tmp_dir=None):
+        self.targets = collections.defaultdict(int)
+        self.contexts = collections.defaultdict(int)
+        self.pairs = collections.defaultdict(int)
+        self.n_partitions = n_partitions
+        self.tmp_dir = tmp_dir
+        self.partitions = [[] for _ in xrange(n_partitions)]
+
+    @property
+    def spilled(self):
+        return any(self.partitions)
+
+    def count_lines(self, lines, max_pairs=DEFAULT_MAX_PAIRS):
+        r"""Count the pairs in the given raw `lines` (bytes)."""
+        targets, contexts, pairs = self.targets, self.contexts, self.pairs
+        for line in lines:
+            fields = line.split(None, 2)
+            if len(fields) < 2:
+                if fields:
+                    targets[fields[0]] += 1
+                continue
+            targets[fields[0]] += 1
+            contexts[fields[1]] += 1
+            pairs[fields[0] + b" " + fields[1]] += 1
+            if len(pairs) > max_pairs:
+                self.spill()
+
+    def spill(self):
+        r"""Append the pairs in memory to one new file per partition."""
+        files = [tempfile.NamedTemporaryFile(dir=self.tmp_dir,
+                prefix="pairs-", delete=False) for _ in self.partitions]
+        for pair, count in self.pairs.iteritems():
+            files[partition(pair, self.n_partitions)].write(
+                    b"%s\t%d\n" % (pair, count))
+        for spill_files, f in zip(self.partitions, files):
+            f.close()
+            spill_files.append(f.name)
+        self.pairs.clear()
+
+
+def partition(pair, n_partitions):
+    r"""Return the partition of `pair` (the same in all processes)."""
+    return (zlib.crc32(pair) & 0xffffffff) % n_partitions
+
+
+def count_file(path, begin=0, end=None, n_partitions=DEFAULT_PARTITIONS,
+        max_pairs=DEFAULT_MAX_PAIRS, tmp_dir=None, spill=False):
+    r"""Return ChunkCounts for the lines of `path` starting between byte
+    offsets `begin` and `end` (see `chunk_offsets`). If `spill`, all pairs
+    are spilled to disk at the end (e.g. to merge them with other chunks).
+    """
+    counts = ChunkCounts(n_partitions, tmp_dir)
+    with open(path, "rb") as input_file:
+        input_file.seek(begin)
+        counts.count_lines(_lines_until(input_file, begin, end), max_pairs)
+    if spill or counts.spilled:
+        counts.spill()
+    return counts
+
+
+def _lines_until(input_file, position, end):
+    for line in input_file:
+        if end is not None and position >= end:
+            break
+        position += len(line)
+        yield line
+
+
+def chunk_offsets(path, n_chunks):
+    r"""Return (begin, end) byte offsets splitting `path` into `n_chunks`
+    chunks, aligned on line boundaries."""
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, "rb") as input_file:
+        for i in xrange(1, n_chunks):
+            input_file.seek(max(size * i // n_chunks, offsets[-1]))
+            if input_file.tell() > 0:
+                input_file.seek(-1, os.SEEK_CUR)
+                input_file.readline()  # Skip to the beginning of next line
+            offsets.append(input_file.tell())
+    offsets.append(size)
+    return [(b, e) for (b, e) in zip(offsets, offsets[1:]) if b < e]
+
+
+############################################################
+
+def merge_counts(chunks):
+    r"""Return (targets, contexts) summed over all ChunkCounts."""
+    targets, contexts = collections.defaultdict(int), \
+            collections.defaultdict(int)
+    for chunk in chunks:
+        for counts, chunk_counts in ((targets, chunk.targets),
+                (contexts, chunk.contexts)):
+            for word, count in chunk_counts.iteritems():
+                counts[word] += count
+    return targets, contexts
+
+
+def frequent_words(counts, threshold):
+    r"""Return the set of words seen more than `threshold` times and
+    longer than 1 character (as in `filterRaw.sh`)."""
+    return set(w for (w, n) in counts.iteritems() if n > threshold
+            and len(w.decode("utf8", "replace")) > 1)
+
+
+def filtered_pairs(chunks, targets, contexts, threshold, tmp_dir=None):
+    r"""Yield (pair, count) for all pairs counted in `chunks` whose
+    target is in `targets`, context in `contexts` and count is at least
+    `threshold`, sorted by pair bytes (as `LC_ALL=C sort`)."""
+    keep = lambda pair, count: count >= threshold \
+            and _in_vocabulary(pair, targets, contexts)
+    if not any(chunk.spilled for chunk in chunks):
+        pairs = chunks[0].pairs if len(chunks) == 1 else merge_pairs(
+                chunk.pairs for chunk in chunks)
+        for pair in sorted(p for (p, n) in pairs.iteritems() if keep(p, n)):
+            yield pair, pairs[pair]
+        return
+
+    # Sum up each partition and write its filtered pairs as a sorted run
+    runs = []
+    for partition_files in zip(*(chunk.partitions for chunk in chunks)):
+        pairs = merge_pairs(_iter_spill(name)
+                for files in partition_files for name in files)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, prefix="run-",
+                delete=False) as run_file:
+            for pair in sorted(p for (p, n) in pairs.iteritems() if keep(p, n)):
+                run_file.write(b"%s\t%d\n" % (pair, pairs[pair]))
+        runs.append(run_file.name)
+        for name in (name for files in partition_files for name in files):
+            os.remove(name)
+    try:
+        for pair, count in heapq.merge(*[_iter_spill(run) for run in runs]):
+            yield pair, count
+    finally:
+        for run in runs:
+            os.remove(run)
+
+
+def merge_pairs(iterables):
+    r"""Return a dict with the sum of the counts of each pair."""
+    ret = collections.defaultdict(int)
+    for pairs in iterables:
+        for pair, count in (pairs.iteritems() if isinstance(pairs, dict)
+                else pairs):
+            ret[pair] += count
+    return ret
+
+
+def _in_vocabulary(pair, targets, contexts):
+    target, context = pair.split(b" ", 1)
+    return target in targets and context in contexts
+
+
+def _iter_spill(name):
+    with open(name, "rb") as spill_file:
+        for line in spill_file:
+            pair, count = line.rstrip(b"\n").rsplit(b"\t", 1)
+            yield pair, int(count)
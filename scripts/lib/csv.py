@@ -23,12 +23,19 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 
 import collections
+import numpy
 import sys
 
+DEFAULT_BATCH_SIZE = 65536
+
 
 def parse_csv(handler, input_file=None, yield_comments=False, yield_header=False):
     r"""Iterate through each line from a CSV input file (or stdin).
     Callbacks are called on `handler`.
+
+    If `handler.columns` is set after `handle_header`, only those
+    columns are split out and decoded (see `Projection`), and
+    `handle_data` receives the undecoded byte line.
     
     Arguments:
     -- yield_comments: If True, yield comments and empty lines as well.
@@ -38,16 +45,21 @@ def parse_csv(handler, input_file=None, yield_comments=False, yield_header=False
         input_file = sys.stdin
 
     tupleclass = None
+    projection = None
     handler.begin()
     linenum = None
     try:
         for linenum, byteline in enumerate(input_file):
             byteline = byteline[:-1]
-            line = byteline.decode('utf8', errors='replace')
             if not byteline or byteline.startswith(b"#"):
-                handler.handle_comment(line)
+                handler.handle_comment(byteline.decode('utf8', errors='replace'))
                 continue
 
+            if projection is not None:
+                handler.handle_data(byteline, projection(byteline))
+                continue
+
+            line = byteline.decode('utf8', errors='replace')
             bytedata = byteline.split(b"\t")
             data = tuple(d.decode('utf8', errors='replace') for d in bytedata)
 
@@ -55,6 +67,9 @@ def parse_csv(handler, input_file=None, yield_comments=False, yield_header=False
                 tupleclass = collections.namedtuple(
                         "DataTuple", data, rename=True)
                 handler.handle_header(line, tupleclass._fields)
+                if handler.columns is not None:
+                    projection = Projection(tupleclass._fields,
+                            handler.columns, handler.decode_columns)
             else:
                 if len(tupleclass._fields) != len(data):
                     print("BAD input: expected {} entries, " \
@@ -72,9 +87,158 @@ def parse_csv(handler, input_file=None, yield_comments=False, yield_header=False
     return handler
 
 
+def parse_csv_batches(handler, input_file=None, batch_size=DEFAULT_BATCH_SIZE):
+    r"""Iterate through blocks of lines from a CSV input file (or stdin).
+    Same as `parse_csv`, but data lines are grouped into `ColumnBatch`
+    instances and passed to `handler.handle_batch`. Fields are only
+    split/decoded when the handler asks for a column, so handlers
+    that need one or two columns never pay for the rest.
+
+    If `handler.columns` is set after `handle_header`, lines are only
+    split up to the last of those columns.
+
+    Comments flush the pending batch before `handler.handle_comment`
+    is called, so the relative order of comments and data is kept.
+
+    Arguments:
+    -- batch_size: Maximum number of data lines per batch.
+    """
+    if input_file is None:
+        input_file = sys.stdin
+
+    header = None
+    maxsplit = -1
+    strings = {}  # Dict[bytes, unicode], shared by all batches
+    pending = []
+    first_linenum = None
+    handler.begin()
+    linenum = None
+    try:
+        for linenum, byteline in enumerate(input_file):
+            byteline = byteline[:-1]
+            if not byteline or byteline.startswith(b"#"):
+                if pending:
+                    handler.handle_batch(ColumnBatch(
+                            header, pending, strings, maxsplit))
+                    pending = []
+                handler.handle_comment(byteline.decode('utf8', errors='replace'))
+                continue
+
+            if header is None:
+                line = byteline.decode('utf8', errors='replace')
+                header = collections.namedtuple("DataTuple",
+                        line.split("\t"), rename=True)._fields
+                handler.handle_header(line, header)
+                if handler.columns:
+                    maxsplit = max(header.index(c) for c in handler.columns) + 1
+            else:
+                if not pending:
+                    first_linenum = linenum
+                pending.append(byteline)
+                if len(pending) >= batch_size:
+                    handler.handle_batch(ColumnBatch(
+                            header, pending, strings, maxsplit))
+                    pending = []
+        if pending:
+            handler.handle_batch(ColumnBatch(header, pending, strings, maxsplit))
+
+    except Exception as e:
+        print("ERROR when processing lines {}-{}" \
+                .format((first_linenum or 0)+1, (linenum or 0)+1), file=sys.stderr)
+        raise
+    handler.end()
+    return handler
+
+
+class ColumnBatch(object):
+    r"""A block of data lines from `parse_csv_batches`, seen as columns.
+    Lines are split on the first column access; the result is cached."""
+    def __init__(self, header, lines, strings, maxsplit=-1):
+        self.header = header  # type: tuple[str]
+        self.lines = lines  # type: list[bytes] (raw lines, without "\n")
+        self._strings = strings  # type: dict[bytes, unicode]
+        self._maxsplit = maxsplit  # type: int (-1: split all columns)
+        self._fields = None  # type: list[list[bytes]]
+
+    def __len__(self):
+        return len(self.lines)
+
+    def raw(self, column_name):
+        r"""Return the undecoded values of `column_name` as a list of bytes."""
+        index = self.header.index(column_name)
+        if 0 <= self._maxsplit <= index:
+            self._maxsplit, self._fields = -1, None  # Undeclared column
+        if self._fields is None:
+            _check_n_fields(self.header, self.lines)
+            self._fields = [l.split(b"\t", self._maxsplit) for l in self.lines]
+        return [data[index] for data in self._fields]
+
+    def strings(self, column_name):
+        r"""Return the values of `column_name` as a list of unicode strings.
+        Equal values are decoded once and share the same object."""
+        strings = self._strings
+        ret = []
+        for value in self.raw(column_name):
+            s = strings.get(value)
+            if s is None:
+                s = strings[value] = value.decode('utf8', errors='replace')
+            ret.append(s)
+        return ret
+
+    def floats(self, column_name):
+        r"""Return the values of `column_name` as a float64 numpy array."""
+        return numpy.array(self.raw(column_name)).astype(numpy.float64)
+
+
+class Projection(object):
+    r"""Callable that extracts a few named columns from a raw data line.
+    The line is only split up to the last of these columns, and the
+    remaining fields are never decoded.
+
+    Arguments:
+    -- header: Tuple with the names of all columns.
+    -- columns: Names of the columns that should be extracted.
+    -- decode: If False, values are kept as undecoded bytes.
+    """
+    def __init__(self, header, columns, decode=True):
+        self.header = header
+        self.indexes = [header.index(c) for c in columns]
+        self.maxsplit = max(self.indexes) + 1 if self.indexes else 0
+        self.tupleclass = collections.namedtuple(
+                "DataTuple", columns, rename=True)
+        self.decode = decode
+
+    def __call__(self, byteline):
+        r"""Return a namedtuple with the chosen columns of `byteline`."""
+        _check_n_fields(self.header, [byteline])
+        bytedata = byteline.split(b"\t", self.maxsplit)
+        if self.decode:
+            return self.tupleclass._make(bytedata[i].decode(
+                    'utf8', errors='replace') for i in self.indexes)
+        return self.tupleclass._make(bytedata[i] for i in self.indexes)
+
+
+def _check_n_fields(header, bytelines):
+    r"""Raise an exception if some line does not have one field per column."""
+    n_tabs = len(header) - 1
+    for byteline in bytelines:
+        if byteline.count(b"\t") != n_tabs:
+            print("BAD input: expected {} entries, " \
+                    "but got {!r}".format(
+                    len(header), byteline.split(b"\t")), file=sys.stderr)
+            raise Exception("Bad CSV")
+
+
 class CSVHandler(object):
     r"""Provides callback methods for `parse_csv`.
-    You should subclass it and override the desired methods."""
+    You should subclass it and override the desired methods.
+
+    Handlers that only read a few columns should list their names
+    in `columns` (at the latest in `handle_header`), so that the
+    other columns are not decoded. With `decode_columns = False`,
+    even these columns are handed over as undecoded bytes."""
+    columns = None  # type: list[str] (None: all columns)
+    decode_columns = True
 
     def handle_comment(self, line):
         r"""Called once per comment/empty line."""
@@ -88,6 +252,10 @@ class CSVHandler(object):
         r"""Called once for each line of data."""
         raise NotImplementedError
 
+    def handle_batch(self, batch):
+        r"""Called once for each `ColumnBatch` (see `parse_csv_batches`)."""
+        raise NotImplementedError
+
     def begin(self):
         r"""Called before parsing."""
         pass  # Default: just begin quietly
@@ -15,42 +15,271 @@
 #    GNU General Public License for more details.
 #
 #    You should have received a copy of the GNU General Public License
-#    along with this program.  If not, see <http://www.gnu.org/licenses/>. 
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 from __future__ import absolute_import
 
-import math
+import numpy
+import os
+import sys
+
+from . import profiles
+
+# Number of embeddings parsed into each block of rows
+CHUNK_ROWS = 10000
+
+# Default number of (query, word) cosines calculated at once
+DEFAULT_BLOCK_CELLS = 2**24
 
 
 class EmbeddingSet(object):
-    r"""Instances represent a mapping from words to their embeddings."""
-    def __init__(self):
-        self.word2embedding = {}
-
-    def add_from(self, fileobj):
-        for linenum, line in enumerate(fileobj):
-            if linenum != 0:  # Ignore first line
-                try:
-                    data = line.decode('utf8', errors="replace").rstrip().split(" ")
-                except Exception as e:
-                    raise Exception("Bad line {}: raised {}: {}".format(
-                            linenum+1, type(e).__name__, e))
-                self.word2embedding[data[0]] = [_to_float(x, linenum, colnum) for
-                        (colnum, x) in enumerate(data[1:])]
+    r"""Instances represent a mapping from words to their embeddings.
+
+    Embeddings are the rows of a float32 `matrix`, normalized to unit
+    length (their original norms are in `norms`), so that the cosine of
+    two words is the dot product of their rows.
+
+    Arguments:
+    -- words: Sequence of words (a list or a `profiles.StringTable`).
+    -- matrix: float32[len(words), dimension] normalized embeddings.
+    -- norms: float32[len(words)] original norms.
+    """
+    def __init__(self, words=(), matrix=None, norms=None):
+        self.words = words
+        self.matrix = matrix if matrix is not None \
+                else numpy.zeros((0, 0), dtype=numpy.float32)
+        self.norms = norms if norms is not None \
+                else numpy.zeros(0, dtype=numpy.float32)
+        self._word2row = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.word2row
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    @property
+    def word2row(self):
+        r"""Dict word -> row (built on first use)."""
+        if self._word2row is None:
+            self._word2row = {w: i for (i, w) in enumerate(self.words)}
+        return self._word2row
+
+    def row(self, word):
+        r"""Return the row of `word` (raise KeyError if absent)."""
+        return self.word2row[word]
+
+    def vector(self, word):
+        r"""Return the original (unnormalized) embedding of `word`."""
+        i = self.row(word)
+        return self.matrix[i] * self.norms[i]
+
+    def add_from(self, fileobj, binary=False):
+        r"""Add the embeddings in a word2vec file (text or binary).
+        Blocks are normalized as they are parsed, and all of them are
+        concatenated to the matrix at once."""
+        self._append([_normalize(words, vectors)
+                for (words, vectors) in iter_word2vec(fileobj, binary)])
+
+    def add_vectors(self, words, vectors):
+        r"""Add the embeddings in the rows of `vectors` for `words`.
+        (A word that is added again keeps its last embedding)."""
+        self._append([_normalize(words, vectors)])
+
+    def _append(self, blocks):
+        r"""Append a list of (words, normalized, norms) blocks."""
+        if not blocks:
+            return
+        words, matrices, norms = zip(*blocks)
+        if len(self.words):
+            words = (self.words,) + words
+            matrices = (self.matrix,) + matrices
+            norms = (self.norms,) + norms
+        self.words = [w for block_words in words for w in block_words]
+        self.matrix = numpy.concatenate(matrices)
+        self.norms = numpy.concatenate(norms)
+        self._word2row = None
+
+    def rows(self, words):
+        r"""Return an int64 array with the row of each word (-1 if absent)."""
+        word2row = self.word2row
+        return numpy.array([word2row.get(w, -1) for w in words],
+                dtype=numpy.int64)
 
     def compare(self, word1, word2, type="cosine"):
         r"""Return a cosine comparison of embeddings for the two words."""
-        e1 = self.word2embedding[word1]
-        e2 = self.word2embedding[word2]
-
         assert type=="cosine", "only cosine is supported"
-        dot_p = sum(a*b for (a,b) in zip(e1,e2))
-        e1_norm = math.sqrt(sum(v**2 for v in e1))
-        e2_norm = math.sqrt(sum(v**2 for v in e2))
-        return dot_p / (e1_norm * e2_norm)
+        rows = [self.row(word1)], [self.row(word2)]
+        return float(self.cosines(*rows)[0])
+
+    def cosines(self, rows_a, rows_b):
+        r"""Return a float64 array with the cosines between the embeddings
+        in rows `rows_a[i]` and `rows_b[i]` (0.0 if one of them is -1)."""
+        rows_a = numpy.asarray(rows_a, dtype=numpy.int64)
+        rows_b = numpy.asarray(rows_b, dtype=numpy.int64)
+        known = (rows_a >= 0) & (rows_b >= 0)
+        ret = numpy.zeros(len(rows_a))
+        ret[known] = numpy.einsum("ij,ij->i", self.matrix[rows_a[known]],
+                self.matrix[rows_b[known]], dtype=numpy.float64)
+        return ret
+
+    def most_similar(self, words, k=10, block_size=None):
+        r"""Return a list with the `k` nearest neighbors of each of the
+        `words`, as lists of (neighbor, cosine) by decreasing cosine.
+        (Raise KeyError if some word is absent)."""
+        rows = [self.row(w) for w in words]
+        if block_size is None:
+            block_size = max(1, DEFAULT_BLOCK_CELLS // max(len(self), 1))
+        ret = []
+        for begin in xrange(0, len(rows), block_size):
+            neighbors, cosines = self.nearest_rows(
+                    rows[begin:begin+block_size], k)
+            ret.extend([(self.words[n], c) for (n, c) in zip(
+                    row_neighbors, row_cosines)] for (row_neighbors, row_cosines)
+                    in zip(neighbors.tolist(), cosines.tolist()))
+        return ret
+
+    def nearest_rows(self, rows, k):
+        r"""Return (neighbors, cosines), two [len(rows), k] arrays with
+        the `k` rows closest to each of the given `rows` (excluding
+        itself), by decreasing cosine, then by increasing row. (When
+        several rows tie with the k-th cosine, which of them are kept
+        is arbitrary). Candidates for the whole block come from one
+        matrix product."""
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        k = max(0, min(k, len(self) - 1))
+        cosines = numpy.dot(self.matrix[rows], self.matrix.T)
+        cosines[numpy.arange(len(rows)), rows] = -numpy.inf
+        if k:
+            best = numpy.argpartition(-cosines, k-1, axis=1)[:, :k]
+        else:
+            best = numpy.zeros((len(rows), 0), dtype=numpy.int64)
+        # Cosines of the best rows are recalculated in float64, as in
+        # `cosines`, so that they do not depend on the block size (one
+        # neighbor at a time, to avoid a [len(rows), k, dimension] copy)
+        queries = self.matrix[rows]
+        best_cosines = numpy.empty(best.shape)
+        for i in xrange(k):
+            best_cosines[:, i] = numpy.einsum("ij,ij->i", queries,
+                    self.matrix[best[:, i]], dtype=numpy.float64)
+        order = numpy.lexsort((best, -best_cosines), axis=1)
+        ranked = numpy.arange(len(rows))[:, None], order
+        return best[ranked], best_cosines[ranked]
+
+    def save(self, path):
+        r"""Write this set as a directory of `.npy` arrays (see `load`)."""
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        numpy.save(os.path.join(path, "matrix.npy"), self.matrix)
+        numpy.save(os.path.join(path, "norms.npy"), self.norms)
+        profiles.StringTable.write(path, "words", self.words)
+
+    @staticmethod
+    def load(path, binary=None, use_cache=True):
+        r"""Return an EmbeddingSet with the embeddings in `path`.
+
+        `path` is a word2vec file (binary if `binary`, or by default if
+        it ends in `.bin`) or a directory written by `save`. With
+        `use_cache`, word2vec files are saved in a `<path>.npy` sidecar
+        directory, which is memory-mapped instead of parsing `path`
+        again (as long as it is more recent than `path`).
+        """
+        if os.path.isdir(path):
+            return EmbeddingSet(profiles.StringTable(path, "words"),
+                    profiles.load_array(path, "matrix"), profiles.load_array(path, "norms"))
+
+        cache_path = path + ".npy"
+        if use_cache and os.path.isdir(cache_path) and \
+                os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            return EmbeddingSet.load(cache_path)
+
+        if binary is None:
+            binary = path.endswith(".bin")
+        ret = EmbeddingSet()
+        with open(path, "rb") as fileobj:
+            ret.add_from(fileobj, binary)
+        if use_cache:
+            try:
+                ret.save(cache_path)
+            except (IOError, OSError) as e:
+                print("WARNING: Could not write embeddings cache {}: {}" \
+                        .format(cache_path, e), file=sys.stderr)
+        return ret
+
+
+############################################################
+
+def iter_word2vec(fileobj, binary=False, chunk_rows=CHUNK_ROWS,
+        dtype=numpy.float32):
+    r"""Yield (words, vectors) blocks of at most `chunk_rows` embeddings
+    from a word2vec file, where `vectors` is a `dtype` matrix (values
+    of text files are parsed as `dtype`, binary files have float32)."""
+    lines = _iter_binary(fileobj) if binary else _iter_text(fileobj, dtype)
+    words, vectors = [], []
+    for word, vector in lines:
+        words.append(word)
+        vectors.append(vector)
+        if len(words) == chunk_rows:
+            yield words, numpy.array(vectors, dtype=dtype)
+            words, vectors = [], []
+    if words:
+        yield words, numpy.array(vectors, dtype=dtype)
+
+
+def _normalize(words, vectors):
+    r"""Return (words, normalized, norms) for the rows of `vectors`."""
+    vectors = numpy.asarray(vectors, dtype=numpy.float32)
+    norms = numpy.sqrt(numpy.einsum("ij,ij->i", vectors, vectors))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        normalized = numpy.nan_to_num(vectors / norms[:, None])
+    return words, normalized, norms
+
+
+def _iter_text(fileobj, dtype=numpy.float32):
+    for linenum, line in enumerate(fileobj):
+        if linenum != 0:  # Ignore first line
+            try:
+                data = line.decode('utf8', errors="replace").rstrip().split(" ")
+            except Exception as e:
+                raise Exception("Bad line {}: raised {}: {}".format(
+                        linenum+1, type(e).__name__, e))
+            try:
+                vector = numpy.array(data[1:], dtype=dtype)
+            except ValueError:
+                vector = [_to_float(x, linenum, colnum) for
+                        (colnum, x) in enumerate(data[1:])]
+            yield data[0], vector
+
+
+def _iter_binary(fileobj, read_size=2**20):
+    r"""Iterate through (word, vector) in the binary word2vec format:
+    a header line `n_words dimension`, then each word, a space and
+    `dimension` float32 values (optionally followed by a newline)."""
+    n_words, dimension = [int(x) for x in fileobj.readline().split()]
+    vector_size = 4 * dimension
+    buffer, offset = b"", 0
+    for i in xrange(n_words):
+        while True:
+            space = buffer.find(b" ", offset)
+            if space >= 0 and len(buffer) >= space + 1 + vector_size:
+                break
+            data = fileobj.read(read_size)
+            if not data:
+                raise Exception("Truncated word2vec file: expected {} " \
+                        "words, got {}".format(n_words, i))
+            buffer, offset = buffer[offset:] + data, 0
+        word = buffer[offset:space].lstrip(b"\n")
+        vector = numpy.frombuffer(buffer, dtype="<f4", count=dimension,
+                offset=space+1)
+        offset = space + 1 + vector_size
+        yield word.decode('utf8', errors="replace"), vector
 
 
 def _to_float(strvalue, linenum, colnum):
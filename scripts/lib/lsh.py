@@ -0,0 +1,172 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Locality-sensitive hashing of `sparse.SparseVectors`, used to
+generate candidate neighbors without looking at all pairs.
+
+Each target gets `n_bands` signatures of `band_size` hash values. Two
+targets are candidates iff they have the same signature in some band.
+Candidates are then re-scored exactly (see `similarity.CandidateScorer`),
+so approximation only affects recall, never the scores themselves.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy
+
+from . import similarity
+
+# Families of hash functions, and the measure each one approximates
+METHODS = ("hyperplane", "minhash")
+DEFAULT_METHOD = {"cosine": "hyperplane", "lin": "minhash",
+        "wjaccard": "minhash"}
+DEFAULT_BAND_SIZE = {"hyperplane": 12, "minhash": 3}
+
+# Multipliers used to combine hash values into a band key (mod 2**64)
+_MIX_1 = numpy.uint64(0x9E3779B97F4A7C15)
+_MIX_2 = numpy.uint64(0xC2B2AE3D27D4EB4F)
+
+
+class LSHIndex(object):
+    r"""Buckets of targets with equal band keys.
+
+    Arguments:
+    -- keys: int64[n_bands, n_rows] band keys of each target.
+    -- indexed: bool[n_rows], False for targets without a signature
+    (e.g. empty profiles), which are never candidates.
+    -- max_bucket: Ignore buckets with more than this number of targets.
+    """
+    def __init__(self, keys, indexed, max_bucket=None):
+        self.keys = keys
+        self.indexed = indexed
+        self.max_bucket = max_bucket
+        self.orders = [numpy.flatnonzero(indexed)[numpy.argsort(
+                band_keys[indexed], kind="mergesort")] for band_keys in keys]
+        self.sorted_keys = [band_keys[order]
+                for (band_keys, order) in zip(keys, self.orders)]
+
+    def __len__(self):
+        return len(self.indexed)
+
+    def candidates(self, rows):
+        r"""Return (positions, neighbors): the pairs (rows[i], neighbor)
+        that share some bucket, sorted by `i` and `neighbor`
+        (each target is not a candidate for itself)."""
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        n_rows = len(self)
+        pair_keys = [numpy.empty(0, dtype=numpy.int64)]
+        for band_keys, sorted_keys, order in zip(
+                self.keys, self.sorted_keys, self.orders):
+            row_keys = band_keys[rows]
+            begins = numpy.searchsorted(sorted_keys, row_keys, "left")
+            sizes = numpy.searchsorted(sorted_keys, row_keys, "right") - begins
+            sizes[~self.indexed[rows]] = 0
+            if self.max_bucket is not None:
+                sizes[sizes > self.max_bucket] = 0
+            starts = numpy.cumsum(sizes) - sizes
+            members = order[numpy.arange(sizes.sum())
+                    + numpy.repeat(begins - starts, sizes)]
+            positions = numpy.repeat(numpy.arange(len(rows)), sizes)
+            pair_keys.append(positions * n_rows + members)
+        pair_keys = numpy.unique(numpy.concatenate(pair_keys))
+        positions, neighbors = pair_keys // max(n_rows, 1), pair_keys % max(n_rows, 1)
+        not_self = rows[positions] != neighbors
+        return positions[not_self], neighbors[not_self]
+
+
+def hyperplane_index(vectors, n_bands, band_size, max_bucket=None, seed=0):
+    r"""Return an LSHIndex for cosine: each hash value is the side of a
+    random hyperplane (a Gaussian vector over contexts) on which the
+    target lies. Targets with a null vector are not indexed."""
+    assert band_size < 63, band_size
+    matrix = similarity._csr_matrix(vectors, vectors.data)
+    powers = numpy.left_shift(1, numpy.arange(band_size, dtype=numpy.int64))
+    keys = numpy.empty((n_bands, len(vectors)), dtype=numpy.int64)
+    for band in xrange(n_bands):
+        random = numpy.random.RandomState((seed, band))
+        planes = random.standard_normal(
+                (vectors.n_columns, band_size)).astype(numpy.float32)
+        keys[band] = (matrix * planes > 0).dot(powers)
+    return LSHIndex(keys, vectors.norms > 0, max_bucket)
+
+
+def minhash_index(vectors, n_bands, band_size, max_bucket=None, seed=0):
+    r"""Return an LSHIndex for weighted Jaccard: each hash value is a
+    consistent weighted sample of the target profile (Ioffe's ICWS), so
+    two targets get the same value with a probability equal to the
+    weighted Jaccard of their (positive) values. Targets with no positive
+    value are not indexed."""
+    positive = vectors.data > 0
+    log_weights = numpy.log(numpy.where(positive, vectors.data, 1.0))
+    entry_rows = numpy.repeat(numpy.arange(len(vectors)), vectors.lengths)
+    indexed = numpy.bincount(entry_rows[positive], minlength=len(vectors)) > 0
+    row_begins = vectors.indptr[:-1][indexed]
+    contexts = vectors.indices.astype(numpy.int64)
+
+    keys = numpy.zeros((n_bands, len(vectors)), dtype=numpy.uint64)
+    with numpy.errstate(over="ignore"):
+        for band in xrange(n_bands):
+            for i in xrange(band_size):
+                random = numpy.random.RandomState((seed, band, i))
+                r = random.gamma(2.0, 1.0, vectors.n_columns)[contexts]
+                log_c = numpy.log(random.gamma(2.0, 1.0, vectors.n_columns))[contexts]
+                beta = random.uniform(0, 1, vectors.n_columns)[contexts]
+                t = numpy.floor(log_weights / r + beta)
+                log_a = numpy.where(positive, log_c - r * (t - beta + 1), numpy.inf)
+                best = _argmin_by_row(log_a, entry_rows, row_begins)
+                sample = (contexts[best].astype(numpy.uint64) * _MIX_1) \
+                        ^ t[best].astype(numpy.int64).astype(numpy.uint64)
+                keys[band, indexed] = keys[band, indexed] * _MIX_2 + sample
+    return LSHIndex(keys.view(numpy.int64), indexed, max_bucket)
+
+
+def _argmin_by_row(values, entry_rows, row_begins):
+    r"""Return the entry index of the minimum of `values` in each
+    (non-empty) row starting at `row_begins` (first one on ties)."""
+    order = numpy.lexsort((values, entry_rows))
+    return order[numpy.searchsorted(entry_rows[order], entry_rows[row_begins])]
+
+
+def build_index(vectors, method, n_bands, band_size=None, max_bucket=None,
+        seed=0):
+    r"""Return an LSHIndex built with `method` (one of METHODS)."""
+    assert method in METHODS, method
+    if band_size is None:
+        band_size = DEFAULT_BAND_SIZE[method]
+    build = hyperplane_index if method == "hyperplane" else minhash_index
+    return build(vectors, n_bands, band_size, max_bucket=max_bucket, seed=seed)
+
+
+############################################################
+
+def sample_recall(exact_scorer, approx_scorer, k, rows):
+    r"""Return (recall, n_targets): the average fraction of the exact
+    K best neighbors of each target in `rows` that are also found by
+    `approx_scorer` (targets without exact neighbors are ignored)."""
+    exact_neighbors, _ = similarity.top_k(len(rows),
+            *exact_scorer.scores(rows), k=k)
+    approx_neighbors, _ = similarity.top_k(len(rows),
+            *approx_scorer.scores(rows), k=k)
+    recalls = [len(numpy.intersect1d(exact, approx)) / len(exact)
+            for (exact, approx) in zip(exact_neighbors, approx_neighbors)
+            if len(exact)]
+    return (numpy.mean(recalls) if recalls else float("nan")), len(recalls)
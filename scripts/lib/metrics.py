@@ -0,0 +1,195 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Ranking measures (precision, recall, F1, AvgPrec, R-precision, DCG).
+
+A ranking is described by the sorted `positions` (from 1) of its
+relevant predictions, e.g. [1, 3, 4] when the 1st, 3rd and 4th
+predictions are relevant. Measures "@k" accept a list of cutoffs and
+are all calculated at once, with cumulative sums and binary searches
+over `positions`. Unless given, `n_relevant` (the number of relevant
+items, predicted or not) is `len(positions)`.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import math
+import numpy
+
+
+def relevant_positions(relevant):
+    r"""Return the sorted positions (from 1) of the True values in
+    `relevant`, a sequence of bool in ranking order."""
+    return numpy.flatnonzero(relevant) + 1
+
+
+def sorted_positions(positions):
+    r"""Return `positions` as a sorted int64 array."""
+    return numpy.sort(numpy.asarray(positions, dtype=numpy.int64))
+
+
+def n_relevant_at(positions, cutoffs):
+    r"""Return the number of relevant predictions among the top k,
+    for each k in `cutoffs`."""
+    return numpy.searchsorted(positions, cutoffs, "right")
+
+
+def precision_at(positions, cutoffs):
+    r"""Return the precision of the top k predictions, for each k in
+    `cutoffs` (NaN for k=0)."""
+    cutoffs = numpy.asarray(cutoffs, dtype=numpy.float64)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return numpy.where(cutoffs == 0, numpy.nan,
+                n_relevant_at(positions, cutoffs) / cutoffs)
+
+
+def recall_at(positions, cutoffs, n_relevant=None):
+    r"""Return the recall of the top k predictions, for each k in `cutoffs`."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return n_relevant_at(positions, cutoffs) / n_relevant
+
+
+def r_precision(positions, n_relevant=None):
+    r"""Return the precision of the top R predictions, where R is
+    the number of relevant items (NaN if there are none)."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    return float(precision_at(positions, [n_relevant])[0])
+
+
+def precisions(positions):
+    r"""Return the precision at the position of each relevant prediction."""
+    return numpy.arange(1, len(positions)+1) / positions
+
+
+def average_precision(positions, n_relevant=None):
+    r"""Return the average of the precisions at the position of each
+    relevant item (0.0 for those that are not predicted, and for
+    rankings without relevant items)."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    if n_relevant == 0:
+        return 0.0
+    return math.fsum(precisions(positions).tolist()) / n_relevant
+
+
+def f1s(positions, n_relevant=None):
+    r"""Return the F1 of the top k predictions, where k is the position
+    of each relevant prediction."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    recalls = numpy.arange(1, len(positions)+1) / n_relevant
+    return 2 / ((1/precisions(positions)) + (1/recalls))
+
+
+def best_f1(positions, n_relevant=None):
+    r"""Return (F1, k, precision) for the top k predictions with the best
+    F1 (the first one in case of ties). F1 only increases at relevant
+    predictions, so that k is the position of a relevant prediction.
+    Return (NaN, 0, NaN) for rankings without relevant predictions."""
+    if not len(positions):
+        return float("nan"), 0, float("nan")
+    scores = f1s(positions, n_relevant)
+    best = int(numpy.argmax(scores))
+    return float(scores[best]), int(positions[best]), \
+            float(precisions(positions)[best])
+
+
+def curves(relevant, n_relevant=None):
+    r"""Return (precisions, recalls, f1s), three arrays with the
+    measures of the top k predictions, for all k from 1 to
+    len(relevant), where `relevant` is a sequence of bool in ranking
+    order (F1 is -inf while there is no relevant prediction)."""
+    relevant = numpy.asarray(relevant, dtype=bool)
+    n_relevant = relevant.sum() if n_relevant is None else n_relevant
+    n_true_positives = numpy.cumsum(relevant)
+    precision = n_true_positives / numpy.arange(1, len(relevant)+1)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        recall = n_true_positives / n_relevant
+        f1 = numpy.where(n_true_positives == 0, float("-inf"),
+                2 / ((1/precision) + (1/recall)))
+    return precision, recall, f1
+
+
+def dcg_gains(positions):
+    r"""Return the gain of a relevant prediction at each of the
+    `positions` in the DCG: 1 at position 1, 1/log2(k) at position
+    k > 1 (and 0 at position 0, i.e. not predicted)."""
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    with numpy.errstate(divide="ignore"):
+        return numpy.where(positions == 1, 1.0, numpy.where(positions > 1,
+                math.log(2) / numpy.log(positions), 0.0))
+
+
+def dcg(positions):
+    r"""Return the DCG of a ranking (with relevance in {0, 1})."""
+    return math.fsum(dcg_gains(positions).tolist())
+
+
+def ndcg(positions, n_relevant=None):
+    r"""Return the (DCG / ideal DCG) of a ranking (NaN without relevant items)."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    return dcg(positions) / dcg(numpy.arange(1, n_relevant+1)) \
+            if n_relevant else float("nan")
+
+
+def ndcg_at(positions, cutoffs, n_relevant=None):
+    r"""Return the NDCG of the top k predictions, for each k in `cutoffs`
+    (the ideal DCG@k has min(k, n_relevant) relevant predictions)."""
+    n_relevant = len(positions) if n_relevant is None else n_relevant
+    cutoffs = numpy.asarray(cutoffs, dtype=numpy.int64)
+    dcgs = numpy.concatenate(([0.0], numpy.cumsum(dcg_gains(positions))))
+    ideal_dcgs = numpy.concatenate(([0.0], numpy.cumsum(
+            dcg_gains(numpy.arange(1, n_relevant+1)))))
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return dcgs[n_relevant_at(positions, cutoffs)] \
+                / ideal_dcgs[numpy.minimum(cutoffs, n_relevant)]
+
+
+def energy_sums(positions, threshold):
+    r"""Return (sum_ranks, smooth, smooth_min, n_useless) for the
+    energy of a ranking at `threshold` (see `energy_at`)."""
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    useless = positions > threshold
+    sum_ranks = math.fsum(numpy.where(useless, threshold + 1, positions).tolist())
+    norm_factor = math.atanh(0.95) / threshold
+    smooth = math.fsum(numpy.tanh(positions * norm_factor).tolist())
+    smooth_min = math.fsum(numpy.tanh(
+            numpy.arange(len(positions)) * norm_factor).tolist())
+    return sum_ranks, smooth, smooth_min, int(useless.sum())
+
+
+def energy_at(positions, threshold):
+    r"""Return (energy, smooth_energy, useless) of a ranking at
+    `threshold` (typically 100 or 500), as in `src/old/eval_measures.py`:
+    * energy: avg rank, where ranks above threshold count as
+      threshold+1, normalized by the best avg rank  [1..+inf) (good: 1)
+    * smooth_energy: same, with tanh-smoothed ranks (0.95 at
+      threshold), so that 15->150 weighs more than 500->1000  [0..1]
+    * useless: proportion of ranks above threshold  [0..1]
+    Return NaN for rankings without relevant predictions.
+    """
+    n = len(positions)
+    if n == 0:
+        return float("nan"), float("nan"), float("nan")
+    sum_ranks, smooth, smooth_min, n_useless = energy_sums(positions, threshold)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        smooth_energy = numpy.float64(smooth - smooth_min) / (n - smooth_min)
+    return 2 * sum_ranks / (n * (n+1)), float(smooth_energy), n_useless / n
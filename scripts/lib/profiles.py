@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Binary store for the output of `build_profiles`.
+
+A store is a directory with one `.npy` file per array, laid out as a
+CSR matrix with one row per target (contexts sorted inside each row):
+-- indptr.npy: int64[n_targets+1], row boundaries in the arrays below.
+-- context_index.npy: int32[nnz], row in the context string table.
+-- <column>.npy: float64[nnz], one per score column (f_tc, pmi...).
+-- id_target.npy, id_context.npy: int32, original ids per string.
+-- targets.*, contexts.*: string tables (utf8 blob + int64 offsets).
+-- header.txt: names of the stored columns, in input order.
+
+Arrays are memory-mapped when the store is opened, so opening is
+almost free and pages are shared between concurrent processes.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import io
+import numpy
+import os
+
+from . import csv
+
+STRING_COLUMNS = ("target", "context")
+ID_COLUMNS = ("id_target", "id_context")
+
+
+class ProfileStore(object):
+    r"""Read-only, memory-mapped view of a profile store."""
+    def __init__(self, path):
+        self.path = path
+        with io.open(os.path.join(path, "header.txt"), encoding="utf8") as f:
+            self.header = tuple(f.read().split("\n"))
+        self.targets = StringTable(path, "targets")
+        self.contexts = StringTable(path, "contexts")
+        self.indptr = load_array(path, "indptr")
+        self.context_index = load_array(path, "context_index")
+        self.id_target = load_array(path, "id_target")
+        self.id_context = load_array(path, "id_context")
+        self.score_columns = tuple(h for h in self.header
+                if h not in STRING_COLUMNS and h not in ID_COLUMNS)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.targets)
+
+    def column(self, column_name):
+        r"""Return the float64 array of `column_name` (one entry per pair)."""
+        if column_name not in self._columns:
+            if column_name not in self.score_columns:
+                raise KeyError("Column not in profile store: {}" \
+                        .format(column_name))
+            self._columns[column_name] = load_array(self.path, column_name)
+        return self._columns[column_name]
+
+    def profile(self, target, column_name):
+        r"""Return (context_index, values) arrays for the given target."""
+        i = self.targets.index(target)
+        begin, end = self.indptr[i], self.indptr[i+1]
+        return (self.context_index[begin:end],
+                self.column(column_name)[begin:end])
+
+
+class StringTable(object):
+    r"""Memory-mapped list of unicode strings.
+    The reverse mapping (string -> position) is built on first use."""
+    def __init__(self, path, name):
+        self.blob = load_array(path, name + "_blob")
+        self.offsets = load_array(path, name + "_offsets")
+        self._index = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        begin, end = self.offsets[i], self.offsets[i+1]
+        return self.blob[begin:end].tobytes().decode('utf8')
+
+    def __iter__(self):
+        return (self[i] for i in xrange(len(self)))
+
+    def index(self, string):
+        r"""Return the position of `string` (raise KeyError if absent)."""
+        if self._index is None:
+            self._index = {s: i for (i, s) in enumerate(self)}
+        return self._index[string]
+
+    @staticmethod
+    def write(path, name, strings):
+        r"""Write a list of unicode strings as table `name` under `path`."""
+        encoded = [s.encode('utf8') for s in strings]
+        offsets = numpy.zeros(len(encoded)+1, dtype=numpy.int64)
+        numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = numpy.array(bytearray(b"".join(encoded)), dtype=numpy.uint8)
+        numpy.save(os.path.join(path, name + "_blob.npy"), blob)
+        numpy.save(os.path.join(path, name + "_offsets.npy"), offsets)
+
+
+def load_array(path, name):
+    r"""Return the array `<path>/<name>.npy`, memory-mapped (read-only)."""
+    return numpy.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+
+
+############################################################
+
+class ProfileStoreWriter(csv.CSVHandler):
+    r"""Collect a `build_profiles` CSV (through `csv.parse_csv_batches`)
+    and write it as a profile store in `end`.
+
+    Arguments:
+    -- path: Directory where the store is written (created if needed).
+    -- score_columns: Names of the score columns to keep (default: all).
+    """
+    def __init__(self, path, score_columns=None):
+        self.path = path
+        self.score_columns = score_columns
+        self.header = None
+        self.target2index, self.context2index = {}, {}
+        self.id_target, self.id_context = [], []
+        self.chunks = {}  # Dict[column_name, list[numpy.ndarray]]
+
+    def handle_header(self, line, header_names):
+        for col in STRING_COLUMNS + ID_COLUMNS:
+            assert col in header_names, (col, header_names)
+        if self.score_columns is None:
+            self.score_columns = [h for h in header_names
+                    if h not in STRING_COLUMNS and h not in ID_COLUMNS]
+        for col in self.score_columns:
+            assert col in header_names, (col, header_names)
+        self.header = [h for h in header_names if h in STRING_COLUMNS
+                or h in ID_COLUMNS or h in self.score_columns]
+        self.columns = self.header
+
+    def handle_batch(self, batch):
+        self._add_chunk("target_index", self._indexes(batch,
+                "target", "id_target", self.target2index, self.id_target))
+        self._add_chunk("context_index", self._indexes(batch,
+                "context", "id_context", self.context2index, self.id_context))
+        for col in self.score_columns:
+            self._add_chunk(col, batch.floats(col))
+
+    def _indexes(self, batch, str_column, id_column, str2index, ids):
+        r"""Return an int32 array with the string table index of each line."""
+        ret = numpy.empty(len(batch), dtype=numpy.int32)
+        for i, (s, id_s) in enumerate(zip(batch.strings(str_column),
+                batch.raw(id_column))):
+            index = str2index.get(s)
+            if index is None:
+                index = str2index[s] = len(ids)
+                ids.append(int(id_s))
+            ret[i] = index
+        return ret
+
+    def _add_chunk(self, name, array):
+        self.chunks.setdefault(name, []).append(array)
+
+    def end(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        t_index = self._concatenate("target_index", numpy.int32)
+        c_index = self._concatenate("context_index", numpy.int32)
+        order = numpy.lexsort((c_index, t_index))
+        indptr = numpy.zeros(len(self.id_target)+1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(t_index, minlength=len(self.id_target)),
+                out=indptr[1:])
+
+        self._save("indptr", indptr)
+        self._save("context_index", c_index[order])
+        self._save("id_target", numpy.array(self.id_target, dtype=numpy.int32))
+        self._save("id_context", numpy.array(self.id_context, dtype=numpy.int32))
+        for col in self.score_columns:
+            self._save(col, self._concatenate(col, numpy.float64)[order])
+        StringTable.write(self.path, "targets", _by_index(self.target2index))
+        StringTable.write(self.path, "contexts", _by_index(self.context2index))
+        with io.open(os.path.join(self.path, "header.txt"), "w",
+                encoding="utf8") as f:
+            f.write("\n".join(self.header))
+
+    def _concatenate(self, name, dtype):
+        return numpy.concatenate(self.chunks.pop(name, [])
+                or [numpy.empty(0, dtype=dtype)])
+
+    def _save(self, name, array):
+        numpy.save(os.path.join(self.path, name + ".npy"), array)
+
+
+def _by_index(str2index):
+    r"""Return the keys of `str2index`, sorted by their value."""
+    ret = [None] * len(str2index)
+    for s, i in str2index.iteritems():
+        ret[i] = s
+    return ret
@@ -0,0 +1,192 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Reference resources of related words (VerbNet, Moby, WordNet...).
+
+A resource gives a count to each pair of words (word1, word2), which is
+nonzero iff word2 is related to word1, as in `src/old/get_neighbours.py`.
+A `ResourceIndex` stores several resources over the same word ids, as
+a directory of `.npy` files:
+-- words.*: string table (see `profiles.StringTable`).
+-- info.txt: one line `resource<TAB>name<TAB>kind` per resource.
+Resources of kind `classes` (e.g. VerbNet classes) count the classes
+that both words belong to:
+-- <name>.word_indptr.npy, <name>.word_classes.npy: classes of each word.
+-- <name>.members.npy: sorted keys `class * len(words) + word`.
+Resources of kind `pairs` (e.g. WordNet relations) list their pairs:
+-- <name>.pairs.npy: sorted keys `word1 * len(words) + word2`.
+-- <name>.counts.npy: count of each pair.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import io
+import itertools
+import numpy
+import os
+
+from . import profiles
+
+# Arrays of each kind of resource
+KIND_ARRAYS = {
+    "classes": ("word_indptr", "word_classes", "members"),
+    "pairs": ("pairs", "counts"),
+}
+
+
+class ResourceIndex(object):
+    r"""Read-only, memory-mapped view of a resource index (see the module
+    docstring), created by `ResourceIndex.build`.
+
+    Lookups are vectorized: words are mapped to integer ids once
+    (`word_ids`), and the counts of whole arrays of pairs of ids are
+    binary searches in the sorted keys (`counts`).
+    """
+    def __init__(self, path):
+        self.kinds = collections.OrderedDict()
+        with io.open(os.path.join(path, "info.txt"), encoding="utf8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == "resource":
+                    self.kinds[fields[1]] = fields[2]
+        self.words = profiles.StringTable(path, "words")
+        self.arrays = {(name, array): profiles.load_array(
+                path, name + "." + array)
+                for (name, kind) in self.kinds.iteritems()
+                for array in KIND_ARRAYS[kind]}
+        self._word_ids = None
+
+    @property
+    def resources(self):
+        r"""Names of the resources, in index order."""
+        return list(self.kinds)
+
+    def word_ids(self, raw_words):
+        r"""Return an int64 array with the id of each UTF-8 encoded word
+        in `raw_words` (-1 if absent). Words are not decoded, so that
+        undecoded CSV columns can be looked up directly."""
+        if self._word_ids is None:
+            blob = self.words.blob.tobytes()
+            offsets = self.words.offsets.tolist()
+            self._word_ids = {blob[begin:end]: i for (i, (begin, end))
+                    in enumerate(zip(offsets, offsets[1:]))}
+        get = self._word_ids.get
+        return numpy.array([get(w, -1) for w in raw_words], dtype=numpy.int64)
+
+    def counts(self, name, ids1, ids2):
+        r"""Return an int64 array with the count of each pair of word
+        ids (ids1[i], ids2[i]) in resource `name` (0 if an id is -1)."""
+        ids1 = numpy.asarray(ids1, dtype=numpy.int64)
+        ids2 = numpy.asarray(ids2, dtype=numpy.int64)
+        ret = numpy.zeros(len(ids1), dtype=numpy.int64)
+        known = numpy.flatnonzero((ids1 >= 0) & (ids2 >= 0))
+        ids1, ids2 = ids1[known], ids2[known]
+        n_words = len(self.words)
+
+        if self.kinds[name] == "pairs":
+            rows = _search(self.arrays[name, "pairs"], ids1 * n_words + ids2)
+            ret[known[rows >= 0]] = self.arrays[name, "counts"][rows[rows >= 0]]
+        else:
+            # Each class of word1 is looked up as a (class, word2) member
+            indptr = self.arrays[name, "word_indptr"]
+            begins, lengths = indptr[ids1], indptr[ids1+1] - indptr[ids1]
+            owners = numpy.repeat(numpy.arange(len(ids1)), lengths)
+            offsets = numpy.arange(lengths.sum()) + numpy.repeat(
+                    begins - (numpy.cumsum(lengths) - lengths), lengths)
+            classes = self.arrays[name, "word_classes"][offsets]
+            found = _search(self.arrays[name, "members"],
+                    classes * n_words + ids2[owners]) >= 0
+            ret[known] = numpy.bincount(owners, weights=found,
+                    minlength=len(ids1))
+        return ret
+
+    @staticmethod
+    def build(path, resources):
+        r"""Write the index of `resources` under `path`, a list of
+        (name, kind, items) where `items` iterates through (word, class)
+        pairs for kind `classes` and (word1, word2) pairs for kind `pairs`
+        (the count of a pair is its number of occurrences in `items`)."""
+        word2id = {}
+        word_id = lambda word: word2id.setdefault(word, len(word2id))
+        id_pairs = []
+        for name, kind, items in resources:
+            if kind not in KIND_ARRAYS:
+                raise ValueError("Unknown kind of resource: {!r}".format(kind))
+            class2id = {}
+            second_id = word_id if kind == "pairs" else \
+                    lambda cls: class2id.setdefault(cls, len(class2id))
+            id_pairs.append(numpy.fromiter(itertools.chain.from_iterable(
+                    (word_id(a), second_id(b)) for (a, b) in items),
+                    dtype=numpy.int64).reshape(-1, 2))
+
+        # Words are sorted, and temporary ids are renumbered accordingly
+        words = sorted(word2id)
+        new_ids = numpy.zeros(len(words), dtype=numpy.int64)
+        new_ids[[word2id[w] for w in words]] = numpy.arange(len(words))
+        n_words = len(words)
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        save = lambda name, array: numpy.save(
+                os.path.join(path, name + ".npy"), array)
+        profiles.StringTable.write(path, "words", words)
+        for (name, kind, _), pairs in zip(resources, id_pairs):
+            firsts = new_ids[pairs[:, 0]]
+            if kind == "pairs":
+                keys, counts = numpy.unique(firsts * n_words
+                        + new_ids[pairs[:, 1]], return_counts=True)
+                save(name + ".pairs", keys)
+                save(name + ".counts", counts.astype(numpy.int32))
+            else:
+                n_classes = int(pairs[:, 1].max()) + 1 if len(pairs) else 1
+                memberships = numpy.unique(firsts * n_classes + pairs[:, 1])
+                members = memberships // n_classes, memberships % n_classes
+                indptr = numpy.zeros(n_words+1, dtype=numpy.int64)
+                numpy.cumsum(numpy.bincount(members[0], minlength=n_words),
+                        out=indptr[1:])
+                save(name + ".word_indptr", indptr)
+                save(name + ".word_classes", members[1])
+                save(name + ".members", numpy.sort(
+                        members[1] * n_words + members[0]))
+        with io.open(os.path.join(path, "info.txt"), "w", encoding="utf8") as f:
+            for name, kind, _ in resources:
+                f.write("resource\t{}\t{}\n".format(name, kind))
+
+
+def _search(sorted_keys, keys):
+    r"""Return the position of each of the `keys` in `sorted_keys` (-1
+    if absent)."""
+    if not len(sorted_keys):
+        return numpy.full(len(keys), -1, dtype=numpy.int64)
+    rows = numpy.minimum(numpy.searchsorted(sorted_keys, keys),
+            len(sorted_keys) - 1)
+    return numpy.where(sorted_keys[rows] == keys, rows, -1)
+
+
+def iter_classes(fileobj):
+    r"""Yield (word, class) for each line `word<TAB>class[<TAB>...]` of
+    a file of classes (e.g. `src/verbnet-verbclasses.txt`)."""
+    for line in fileobj:
+        fields = line.decode("utf8").strip().split("\t")
+        if len(fields) >= 2 and fields[0]:
+            yield fields[0], fields[1]
@@ -0,0 +1,218 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy
+import scipy.sparse
+
+# Similarity scores, with the same definitions as in `calculate_similarity`
+MEASURES = ("cosine", "lin", "wjaccard")
+
+# Default number of (target, neighbor) cells scored at once
+DEFAULT_BLOCK_CELLS = 2**22
+
+
+class InvertedIndex(object):
+    r"""Context -> targets postings of a `sparse.SparseVectors`, used to
+    generate candidate neighbors: two targets are candidates iff they
+    share at least one context. Contexts with more than `max_postings`
+    targets (hubs such as `NNP`) are left out of the index.
+    """
+    def __init__(self, vectors, max_postings=None):
+        n_postings = numpy.bincount(vectors.indices, minlength=vectors.n_columns)
+        self.is_hub = numpy.zeros(vectors.n_columns, dtype=bool)
+        if max_postings is not None:
+            self.is_hub = n_postings > max_postings
+        self.vectors = vectors.filter_entries(~self.is_hub[vectors.indices])
+        self.pattern = _csr_matrix(self.vectors, numpy.ones(len(self.vectors.data)))
+        self.postings = self.pattern.T.tocsr()
+
+    @property
+    def n_hubs(self):
+        return int(self.is_hub.sum())
+
+    def candidates(self, rows):
+        r"""Return (positions, neighbors): the pairs (rows[i], neighbor)
+        that share a non-hub context, sorted by `i` and `neighbor`
+        (each target is not a candidate for itself)."""
+        candidates = _sorted_coo(self.pattern[rows] * self.postings)
+        positions = candidates.row.astype(numpy.int64)
+        neighbors = candidates.col.astype(numpy.int64)
+        not_self = rows[positions] != neighbors
+        return positions[not_self], neighbors[not_self]
+
+
+class BlockScorer(object):
+    r"""Calculate similarities between blocks of targets and their
+    candidate neighbors (see `InvertedIndex`).
+
+    The contribution of non-hub contexts comes from sparse matrix
+    products, read at the candidate pairs; the contribution of hub
+    contexts (if any) is added by a sparse intersection of the hub
+    entries of both targets, so that scores are always exact.
+
+    Arguments:
+    -- vectors: A `sparse.SparseVectors` instance (one row per target).
+    -- measure: One of `MEASURES`.
+    -- max_postings: See `InvertedIndex`.
+    """
+    def __init__(self, vectors, measure, max_postings=None):
+        assert measure in MEASURES, measure
+        self.vectors = vectors
+        self.measure = measure
+        self.index = InvertedIndex(vectors, max_postings)
+        self.hubs = vectors.filter_entries(self.index.is_hub[vectors.indices])
+        nonhub = self.index.vectors
+        self.matrix = _csr_matrix(nonhub, nonhub.data)
+        self.matrix_t = self.matrix.T.tocsr()
+
+    def scores(self, rows):
+        r"""Return (positions, neighbors, scores) for all candidate pairs
+        (rows[positions[j]], neighbors[j]), sorted by position and neighbor.
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        positions, neighbors = self.index.candidates(rows)
+        keys = positions * len(self.vectors) + neighbors
+        block = self.matrix[rows]
+        if self.measure == "cosine":
+            stats = _values_at(block * self.matrix_t, keys, len(self.vectors))
+        else:
+            sumsum = block * self.index.postings \
+                    + self.index.pattern[rows] * self.matrix_t
+            stats = _values_at(sumsum, keys, len(self.vectors))
+
+        if len(self.hubs.data):
+            hub_positions, values_a, values_b = self.hubs.intersect(
+                    rows[positions], neighbors)
+            hub_values = values_a * values_b if self.measure == "cosine" \
+                    else values_a + values_b
+            stats += numpy.bincount(hub_positions, hub_values,
+                    minlength=len(positions))
+
+        return positions, neighbors, similarities(
+                self.vectors, self.measure, stats, rows[positions], neighbors)
+
+
+class CandidateScorer(object):
+    r"""Calculate exact similarities between blocks of targets and the
+    candidate neighbors proposed by `candidates` (an object with a method
+    `candidates(rows)`, such as `lsh.LSHIndex`).
+    Each candidate pair is scored by a sparse intersection of its rows,
+    so the cost depends on the number of candidates, not of targets.
+    """
+    def __init__(self, vectors, measure, candidates):
+        assert measure in MEASURES, measure
+        self.vectors = vectors
+        self.measure = measure
+        self.candidates = candidates
+
+    def scores(self, rows):
+        r"""Same as `BlockScorer.scores`."""
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        positions, neighbors = self.candidates.candidates(rows)
+        rows_a = rows[positions]
+        pair_positions, values_a, values_b = self.vectors.intersect(
+                rows_a, neighbors)
+        values = values_a * values_b if self.measure == "cosine" \
+                else values_a + values_b
+        stats = numpy.bincount(pair_positions, values, minlength=len(positions))
+        # As in `BlockScorer`, only pairs sharing some context are scored
+        shared = numpy.bincount(pair_positions, minlength=len(positions)) > 0
+        positions, neighbors, rows_a = \
+                positions[shared], neighbors[shared], rows_a[shared]
+        return positions, neighbors, similarities(
+                self.vectors, self.measure, stats[shared], rows_a, neighbors)
+
+
+def similarities(vectors, measure, stats, rows_a, rows_b):
+    r"""Return the `measure` between rows `rows_a[i]` and `rows_b[i]`, given
+    their dot products (cosine) or the sums of their values on shared
+    contexts (lin, wjaccard) in `stats`."""
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        if measure == "cosine":
+            return stats / (vectors.norms[rows_a] * vectors.norms[rows_b])
+        sum12 = vectors.sums[rows_a] + vectors.sums[rows_b]
+        if measure == "lin":
+            return stats / sum12
+        return (stats/2) / (sum12 - stats/2)  # wjaccard
+
+
+def _csr_matrix(vectors, data):
+    return scipy.sparse.csr_matrix((data, vectors.indices, vectors.indptr),
+            shape=(len(vectors), vectors.n_columns))
+
+
+def _sorted_coo(matrix):
+    r"""Return `matrix` in COO format, sorted by row and column."""
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    return matrix.tocoo()
+
+
+def _values_at(matrix, keys, n_cols):
+    r"""Return the values of sparse `matrix` at the given sorted
+    `keys` (row * n_cols + col), with 0.0 for absent entries."""
+    coo = _sorted_coo(matrix)
+    if not coo.nnz:
+        return numpy.zeros(len(keys))
+    matrix_keys = coo.row.astype(numpy.int64) * n_cols + coo.col
+    index = numpy.minimum(numpy.searchsorted(matrix_keys, keys), coo.nnz-1)
+    return numpy.where(matrix_keys[index] == keys, coo.data[index], 0.0)
+
+
+def top_k(n_rows, positions, neighbors, scores, k):
+    r"""Return (neighbors, neighbor_scores) for each of the `n_rows` block
+    positions: lists of arrays with the `k` highest finite scores,
+    by decreasing score (ties by increasing neighbor).
+    """
+    finite = numpy.isfinite(scores)
+    positions, neighbors, scores = \
+            positions[finite], neighbors[finite], scores[finite]
+    order = numpy.lexsort((neighbors, -scores, positions))
+    positions, neighbors, scores = \
+            positions[order], neighbors[order], scores[order]
+    starts = numpy.searchsorted(positions, numpy.arange(n_rows))
+    keep = numpy.arange(len(positions)) - starts[positions] < k
+    positions, neighbors, scores = \
+            positions[keep], neighbors[keep], scores[keep]
+    bounds = numpy.searchsorted(positions, numpy.arange(1, n_rows))
+    return numpy.split(neighbors, bounds), numpy.split(scores, bounds)
+
+
+def iter_top_k(scorer, k, rows=None, block_size=None):
+    r"""Yield (row, neighbors, neighbor_scores) for each target row,
+    scoring `block_size` rows at a time (default: DEFAULT_BLOCK_CELLS
+    cells per block). Memory is bounded by the block, not by the
+    number of pairs.
+    """
+    n_targets = len(scorer.vectors)
+    if rows is None:
+        rows = numpy.arange(n_targets)
+    if block_size is None:
+        block_size = max(1, DEFAULT_BLOCK_CELLS // max(n_targets, 1))
+    for begin in xrange(0, len(rows), block_size):
+        block_rows = rows[begin:begin+block_size]
+        neighbors, scores = top_k(len(block_rows),
+                *scorer.scores(block_rows), k=k)
+        for row, row_neighbors, row_scores in zip(block_rows, neighbors, scores):
+            yield row, row_neighbors, row_scores
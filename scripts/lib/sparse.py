@@ -0,0 +1,228 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import numpy
+import os
+import sys
+
+from . import csv, profiles
+
+
+class SparseVectors(object):
+    r"""Set of named sparse vectors (one per target), in CSR layout.
+    Column indexes are sorted and unique inside each row.
+
+    Arguments:
+    -- names: Sequence of row names (a list or a `profiles.StringTable`).
+    -- indptr: int64[n_rows+1] row boundaries in `indices` and `data`.
+    -- indices: int array with the column (context) of each entry.
+    -- data: float64 array with the value of each entry.
+    """
+    def __init__(self, names, indptr, indices, data, n_columns=None):
+        self.names = names
+        self.indptr = numpy.asarray(indptr, dtype=numpy.int64)
+        self.indices = indices
+        self.data = data
+        if n_columns is None:
+            n_columns = int(indices.max()) + 1 if len(indices) else 0
+        self.n_columns = n_columns
+        self._name2row = None
+
+        entry_rows = numpy.repeat(numpy.arange(len(self)), self.lengths)
+        self.sums = numpy.bincount(entry_rows, data, minlength=len(self))
+        self.norms = numpy.sqrt(numpy.bincount(
+                entry_rows, data*data, minlength=len(self)))
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def lengths(self):
+        r"""Number of entries in each row."""
+        return numpy.diff(self.indptr)
+
+    def row(self, name):
+        r"""Return the row index of `name` (raise KeyError if absent)."""
+        if self._name2row is None:
+            self._name2row = {n: i for (i, n) in enumerate(self.names)}
+        return self._name2row[name]
+
+    def __contains__(self, name):
+        try:
+            self.row(name)
+        except KeyError:
+            return False
+        return True
+
+    @staticmethod
+    def from_triples(names, rows, columns, values):
+        r"""Return a SparseVectors from parallel arrays of entries.
+        When a (row, column) entry appears more than once, the last one wins.
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        columns = numpy.asarray(columns, dtype=numpy.int64)
+        order = numpy.lexsort((columns, rows))  # stable: keeps input order
+        rows, columns = rows[order], columns[order]
+        is_last = numpy.ones(len(rows), dtype=bool)
+        is_last[:-1] = (rows[1:] != rows[:-1]) | (columns[1:] != columns[:-1])
+        rows, columns = rows[is_last], columns[is_last]
+        indptr = numpy.zeros(len(names)+1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=len(names)), out=indptr[1:])
+        return SparseVectors(names, indptr, columns.astype(numpy.int32),
+                numpy.asarray(values, dtype=numpy.float64)[order][is_last])
+
+    @staticmethod
+    def from_store(store, column_name):
+        r"""Return a SparseVectors with `column_name` of a `profiles.ProfileStore`."""
+        return SparseVectors(store.targets, store.indptr, store.context_index,
+                store.column(column_name), n_columns=len(store.contexts))
+
+    def filter_entries(self, keep):
+        r"""Return a SparseVectors with the entries where `keep` is True."""
+        entry_rows = numpy.repeat(numpy.arange(len(self)), self.lengths)
+        indptr = numpy.zeros(len(self)+1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(entry_rows[keep], minlength=len(self)),
+                out=indptr[1:])
+        return SparseVectors(self.names, indptr, self.indices[keep],
+                self.data[keep], n_columns=self.n_columns)
+
+    def gather(self, rows):
+        r"""Return (keys, values) for all entries in the given `rows`.
+        Keys are `i * n_columns + column`, where `i` is the position in
+        `rows`, so that they are sorted and unique for each position.
+        """
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        begins = self.indptr[rows]
+        lengths = self.indptr[rows+1] - begins
+        row_starts = numpy.cumsum(lengths) - lengths
+        positions = numpy.arange(lengths.sum()) \
+                + numpy.repeat(begins - row_starts, lengths)
+        keys = numpy.repeat(numpy.arange(len(rows)), lengths) * self.n_columns \
+                + self.indices[positions]
+        return keys, self.data[positions]
+
+    def intersect(self, rows_a, rows_b):
+        r"""Return (positions, values_a, values_b) for each column shared by
+        rows `rows_a[i]` and `rows_b[i]`, where `positions` holds the `i`.
+        (Computed as a sparse intersection, for all pairs at once.)"""
+        keys_a, values_a = self.gather(rows_a)
+        keys_b, values_b = self.gather(rows_b)
+        common, index_a, index_b = numpy.intersect1d(
+                keys_a, keys_b, assume_unique=True, return_indices=True)
+        return (common // max(self.n_columns, 1),
+                values_a[index_a], values_b[index_b])
+
+    def dots(self, rows_a, rows_b):
+        r"""Return the dot products of rows `rows_a[i]` and `rows_b[i]`."""
+        positions, values_a, values_b = self.intersect(rows_a, rows_b)
+        return numpy.bincount(positions, values_a * values_b,
+                minlength=len(rows_a))
+
+    def cosines(self, rows_a, rows_b):
+        r"""Return the cosines between rows `rows_a[i]` and `rows_b[i]`."""
+        rows_a = numpy.asarray(rows_a, dtype=numpy.int64)
+        rows_b = numpy.asarray(rows_b, dtype=numpy.int64)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return self.dots(rows_a, rows_b) \
+                    / (self.norms[rows_a] * self.norms[rows_b])
+
+
+############################################################
+
+class SparseVectorsCollector(csv.CSVHandler):
+    r"""Collect one column of a `target`/`context` CSV file as SparseVectors
+    (through `csv.parse_csv_batches`). The result is in `self.vectors`.
+    If `id_column` is given, the (first) id of each target row is kept
+    in `self.target_ids`."""
+    def __init__(self, column_name, target_column="target",
+            context_column="context", id_column=None):
+        self.columns = [target_column, context_column, column_name]
+        self.id_column = id_column
+        if id_column is not None:
+            self.columns.append(id_column)
+        self.targets, self.contexts = {}, {}
+        self.target_ids = []
+        self.chunks = []  # list[(rows, columns, values)]
+        self.vectors = None
+
+    def handle_header(self, line, header_names):
+        for col in self.columns:
+            assert col in header_names, (col, header_names)
+
+    def handle_batch(self, batch):
+        target_col, context_col, value_col = self.columns[:3]
+        rows = _indexes(batch.strings(target_col), self.targets)
+        if self.id_column is not None:
+            for row, id_target in zip(rows, batch.raw(self.id_column)):
+                if row == len(self.target_ids):  # First line of a new target
+                    self.target_ids.append(int(id_target))
+        self.chunks.append((rows,
+                _indexes(batch.strings(context_col), self.contexts),
+                batch.floats(value_col)))
+
+    def end(self):
+        names = [None] * len(self.targets)
+        for name, i in self.targets.iteritems():
+            names[i] = name
+        if self.chunks:
+            rows, columns, values = [numpy.concatenate(c)
+                    for c in zip(*self.chunks)]
+        else:
+            rows = columns = values = numpy.empty(0)
+        n_entries = len(rows)
+        self.vectors = SparseVectors.from_triples(names, rows, columns, values)
+        if len(self.vectors.indices) != n_entries:
+            print("WARNING: {} duplicate target-context pairs (kept the " \
+                    "last one)".format(n_entries - len(self.vectors.indices)),
+                    file=sys.stderr)
+        self.chunks = None
+
+
+def _indexes(strings, str2index):
+    r"""Return an int64 array with the index of each string in `str2index`
+    (new strings are added at the end)."""
+    ret = numpy.empty(len(strings), dtype=numpy.int64)
+    for i, s in enumerate(strings):
+        index = str2index.get(s)
+        if index is None:
+            index = str2index[s] = len(str2index)
+        ret[i] = index
+    return ret
+
+
+def load_vectors(path, column_name, with_ids=False):
+    r"""Return (vectors, target_ids) with `column_name` of a profiles CSV
+    file or of a profile store directory (see `profiles.ProfileStore`).
+    The `target_ids` (`id_target` of each row) are None unless `with_ids`.
+    """
+    if os.path.isdir(path):
+        store = profiles.ProfileStore(path)
+        return (SparseVectors.from_store(store, column_name),
+                store.id_target if with_ids else None)
+    with open(path) as input_file:
+        collector = csv.parse_csv_batches(SparseVectorsCollector(column_name,
+                id_column="id_target" if with_ids else None),
+                input_file=input_file)
+    return (collector.vectors,
+            numpy.array(collector.target_ids) if with_ids else None)
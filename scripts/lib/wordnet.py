@@ -0,0 +1,373 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""WordNet similarities between words, with caches.
+
+A `HypernymIndex` stores, for each synset of a POS, its ancestors
+(hypernyms and instance hypernyms, transitively, and itself) with their
+shortest distance, as CSR arrays in a directory of `.npy` files:
+-- words.*, synsets.*: string tables (see `profiles.StringTable`).
+-- word_indptr.npy, word_synsets.npy: synsets of each word.
+-- ancestor_indptr.npy, ancestors.npy, ancestor_depths.npy: ancestors
+of each synset and their distance to it.
+-- max_depths.npy: distance to the farthest ancestor of each synset.
+-- needs_root.npy: whether NLTK simulates a root for each synset.
+-- info.txt: `pos` and WordNet `version`.
+With it, NLTK's `path_similarity` is an intersection of ancestors.
+
+`iter_relation` lists the pairs of words related by WordNet (synonyms,
+hypernyms...), e.g. for a `resources.ResourceIndex`.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import collections
+import io
+import itertools
+import numpy
+import os
+
+from nltk.corpus import wordnet as wn
+
+from . import profiles
+
+# Default maximum number of word pairs in the in-memory cache
+DEFAULT_CACHE_SIZE = 1000000
+
+
+class LRUCache(object):
+    r"""Dict-like cache that keeps the `max_size` most recently used keys."""
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self.max_size = max_size
+        self.data = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            return default
+        self.data[key] = value  # Move to the most recent end
+        return value
+
+    def __setitem__(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+
+class WordPathSimilarity(object):
+    r"""Highest wordnet `path_similarity` between all synsets of two words
+    of POS `pos` (that is, we disambiguate by picking the closest possible
+    pair), or 0 if there is no path.
+
+    Synsets of each word are looked up once. Scores are kept in an LRU
+    cache of `cache_size` pairs, and, if `cache_file` is given, in a file
+    of `pos word1 word2 score` lines, which is extended with new pairs,
+    so that it can be reused across runs. At startup, its last
+    `cache_size` pairs are read into the LRU cache, so that memory is
+    bounded (pairs that are evicted and recalculated are appended to
+    the file again; the last line of a pair wins).
+    """
+    def __init__(self, pos, cache_size=DEFAULT_CACHE_SIZE, cache_file=None,
+            index=None):
+        self.pos = pos
+        self.index = index  # type: HypernymIndex (or None, use NLTK)
+        self.synsets = {}  # Dict[word, list[Synset]]
+        self.pairs = LRUCache(cache_size)
+        self.cache_file = None
+        if cache_file is not None:
+            if os.path.exists(cache_file):
+                for key, score in iter_cache(cache_file, pos):
+                    self.pairs[key] = score
+            self.cache_file = io.open(cache_file, "a", encoding="utf8")
+
+    def __call__(self, word1, word2):
+        key = _key(word1, word2)
+        score = self.pairs.get(key)
+        if score is None:
+            score = self.calculate(word1, word2)
+            self.remember(word1, word2, score)
+        return score
+
+    def remember(self, word1, word2, score):
+        r"""Add the `score` of a pair (e.g. calculated in another
+        process) to the caches. It is only written to the cache file
+        if it is not in the LRU cache already."""
+        key = _key(word1, word2)
+        cached = self.pairs.get(key) is not None
+        self.pairs[key] = score
+        if self.cache_file is not None and not cached:
+            self.cache_file.write("{}\t{}\t{}\t{!r}\n".format(
+                    self.pos, key[0], key[1], score))
+
+    def calculate(self, word1, word2):
+        r"""Return the score, without looking it up in the caches."""
+        if self.index is not None:
+            return self.index.path_similarity(word1, word2)
+        synsets1 = self.word_synsets(word1)
+        synsets2 = self.word_synsets(word2)
+        if not synsets1 or not synsets2:
+            return 0  # XXX no synsets for one of the words
+        return max(wn.path_similarity(s1, s2)
+                for s1 in synsets1 for s2 in synsets2) \
+                or 0  # When `wn` returns None, we just say sim==0
+
+    def word_synsets(self, word):
+        synsets = self.synsets.get(word)
+        if synsets is None:
+            synsets = self.synsets[word] = wn.synsets(word, self.pos)
+        return synsets
+
+    def close(self):
+        if self.cache_file is not None:
+            self.cache_file.close()
+            self.cache_file = None
+
+
+############################################################
+
+WordAncestors = collections.namedtuple("WordAncestors",
+        "depths root_self root_other")
+
+
+class HypernymIndex(object):
+    r"""Read-only, memory-mapped view of a hypernym index (see the module
+    docstring), created by `HypernymIndex.build`.
+
+    Words that were not indexed are looked up through NLTK's morphy
+    (e.g. `sees` -> `see`), which requires the WordNet corpus.
+    """
+    def __init__(self, path):
+        with io.open(os.path.join(path, "info.txt"), encoding="utf8") as f:
+            info = dict(line.rstrip("\n").split("\t", 1) for line in f)
+        self.pos, self.version = info["pos"], info["version"]
+        self.words = profiles.StringTable(path, "words")
+        self.synsets = profiles.StringTable(path, "synsets")
+        self.word_indptr = profiles.load_array(path, "word_indptr")
+        self.word_synsets = profiles.load_array(path, "word_synsets")
+        self.ancestor_indptr = profiles.load_array(path, "ancestor_indptr")
+        self.ancestors = profiles.load_array(path, "ancestors")
+        self.ancestor_depths = profiles.load_array(path, "ancestor_depths")
+        self.max_depths = profiles.load_array(path, "max_depths")
+        self.needs_root = profiles.load_array(path, "needs_root")
+        self._word_ancestors = {}
+
+    def synset_rows(self, word):
+        r"""Return the rows of the synsets of `word` (as `wn.synsets`)."""
+        word = word.lower()
+        try:
+            return self._indexed_synset_rows(word)
+        except KeyError:
+            # (`_morphy` is what `wn.synsets` uses to find base forms)
+            rows = []
+            for form in wn._morphy(word, self.pos):
+                try:
+                    rows.extend(self._indexed_synset_rows(form).tolist())
+                except KeyError:
+                    pass
+            return numpy.unique(numpy.array(rows, dtype=numpy.int32))
+
+    def _indexed_synset_rows(self, word):
+        i = self.words.index(word)
+        return self.word_synsets[self.word_indptr[i]:self.word_indptr[i+1]]
+
+    def synset_ancestors(self, row):
+        r"""Return (ancestors, depths) arrays for synset `row`."""
+        begin, end = self.ancestor_indptr[row], self.ancestor_indptr[row+1]
+        return self.ancestors[begin:end], self.ancestor_depths[begin:end]
+
+    def word_ancestors(self, word):
+        r"""Return the WordAncestors of `word`: a dict with the shortest
+        distance from any synset of `word` to each ancestor, and the
+        shortest distance to a simulated root (None if not simulated)
+        from synsets that simulate it and from any synset."""
+        ret = self._word_ancestors.get(word)
+        if ret is None:
+            rows = self.synset_rows(word)
+            depths = {}
+            for row in rows:
+                for ancestor, depth in zip(*(a.tolist()
+                        for a in self.synset_ancestors(row))):
+                    if depth < depths.get(ancestor, depth+1):
+                        depths[ancestor] = depth
+            root_depths = self.max_depths[rows] + 1
+            root_self = root_depths[self.needs_root[rows]]
+            ret = self._word_ancestors[word] = WordAncestors(depths,
+                    int(root_self.min()) if len(root_self) else None,
+                    int(root_depths.min()) if len(root_depths) else None)
+        return ret
+
+    def path_similarity(self, word1, word2):
+        r"""Return the highest NLTK `path_similarity` between the synsets
+        of `word1` and `word2`, or 0 if there is no path (as
+        `WordPathSimilarity.calculate`)."""
+        ancestors1 = self.word_ancestors(word1)
+        ancestors2 = self.word_ancestors(word2)
+        depths1, depths2 = ancestors1.depths, ancestors2.depths
+        if len(depths1) > len(depths2):
+            depths1, depths2 = depths2, depths1
+        distance = min([d + depths2[a] for (a, d) in depths1.iteritems()
+                if a in depths2] or [float("inf")])
+        if ancestors1.root_self is not None and ancestors2.root_other is not None:
+            distance = min(distance, ancestors1.root_self + ancestors2.root_other)
+        if distance == float("inf"):
+            return 0
+        return 1.0 / (distance + 1)
+
+    @staticmethod
+    def build(path, pos, words=()):
+        r"""Write the index of all synsets of the WordNet lemmas of `pos`
+        (and of the extra `words`, e.g. inflected forms) under `path`."""
+        word_list = sorted(set(wn.all_lemma_names(pos)) | set(
+                w.lower() for w in words))
+        synset_list, synset2row = [], {}
+
+        def row(synset):
+            if synset not in synset2row:
+                synset2row[synset] = len(synset_list)
+                synset_list.append(synset)
+            return synset2row[synset]
+
+        word_synsets = [[row(s) for s in wn.synsets(w, pos)] for w in word_list]
+        word_list, word_synsets = zip(*[(w, rows) for (w, rows)
+                in zip(word_list, word_synsets) if rows]) or ((), ())
+
+        ancestors, depths = [], []
+        i = 0
+        while i < len(synset_list):  # (The list grows with new ancestors)
+            distances = _shortest_hypernym_distances(synset_list[i])
+            rows = sorted((row(s), d) for (s, d) in distances.iteritems())
+            ancestors.append([r for (r, d) in rows])
+            depths.append([d for (r, d) in rows])
+            i += 1
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        save = lambda name, array: numpy.save(
+                os.path.join(path, name + ".npy"), array)
+        profiles.StringTable.write(path, "words", word_list)
+        profiles.StringTable.write(path, "synsets",
+                [s.name() for s in synset_list])
+        for name, lists in (("word", word_synsets), ("ancestor", ancestors)):
+            indptr = numpy.zeros(len(lists)+1, dtype=numpy.int64)
+            numpy.cumsum([len(l) for l in lists], out=indptr[1:])
+            save(name + "_indptr", indptr)
+        for name, lists in (("word_synsets", word_synsets),
+                ("ancestors", ancestors), ("ancestor_depths", depths)):
+            save(name, numpy.fromiter(itertools.chain.from_iterable(lists),
+                    dtype=numpy.int32))
+        save("max_depths", numpy.array([max(d) for d in depths], dtype=numpy.int32))
+        save("needs_root", numpy.array([_needs_root(s) for s in synset_list],
+                dtype=bool))
+        with io.open(os.path.join(path, "info.txt"), "w", encoding="utf8") as f:
+            f.write("pos\t{}\nversion\t{}\n".format(pos, wn.get_version()))
+
+
+def _shortest_hypernym_distances(synset):
+    r"""Return a dict ancestor -> shortest distance from `synset`
+    (including itself), as NLTK's `Synset._shortest_hypernym_paths`."""
+    queue = collections.deque([(synset, 0)])
+    distances = {}
+    while queue:
+        s, depth = queue.popleft()
+        if s in distances:
+            continue
+        distances[s] = depth
+        queue.extend((h, depth+1) for h in s.hypernyms())
+        queue.extend((h, depth+1) for h in s.instance_hypernyms())
+    return distances
+
+
+def _needs_root(synset):
+    r"""Whether NLTK's `path_similarity` simulates a root for `synset`."""
+    if synset.pos() == "n":
+        return wn.get_version() == "1.6"
+    return synset.pos() == "v"
+
+
+def _key(word1, word2):
+    return (word1, word2) if word1 <= word2 else (word2, word1)
+
+
+def preload():
+    r"""Load the NLTK WordNet corpus now (it is loaded lazily by default),
+    e.g. before forking worker processes that will share it. Only the
+    index files are read: data files are opened on first lookup, and
+    must not be shared by forked processes (see `forget_data_files`)."""
+    wn.ensure_loaded()
+
+
+def forget_data_files():
+    r"""Make NLTK reopen the WordNet data files on next lookup (e.g. in a
+    forked worker, whose inherited handles share their offset with
+    the parent and the other workers)."""
+    wn._data_file_map = {}
+
+
+def read_cache(path, pos):
+    r"""Return a dict (word1, word2) -> score with the `pos` entries of
+    a cache file written by WordPathSimilarity."""
+    return dict(iter_cache(path, pos))
+
+
+def iter_cache(path, pos):
+    r"""Yield ((word1, word2), score) for the `pos` lines of a cache
+    file written by WordPathSimilarity, in file order."""
+    with io.open(path, encoding="utf8") as cache_file:
+        for line in cache_file:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 4 and fields[0] == pos:
+                yield (fields[1], fields[2]), float(fields[3])
+
+
+############################################################
+
+# Relations of `iter_relation`, as in `src/old/get_neighbours.py`
+RELATIONS = ("wn_syn", "wn_hyper", "wn_hypo", "wn_mero", "wn_sibling", "wn_anto")
+
+_RELATED_LEMMAS = {
+    "wn_syn": lambda s: s.lemmas(),
+    "wn_hyper": lambda s: [l for h in s.hypernyms() for l in h.lemmas()],
+    "wn_hypo": lambda s: [l for h in s.hyponyms() for l in h.lemmas()],
+    "wn_mero": lambda s: [l for h in s.member_holonyms() for l in h.lemmas()],
+    # Siblings are the hyponyms (sons) of the hypernyms (fathers)
+    "wn_sibling": lambda s: [l for h in s.hypernyms()
+            for sibling in h.hyponyms() for l in sibling.lemmas()],
+    "wn_anto": lambda s: [a for l in s.lemmas() for a in l.antonyms()],
+}
+
+
+def iter_relation(pos, relation, words=()):
+    r"""Yield (word1, word2) for every lemma `word2` in `relation` (one
+    of RELATIONS) with a synset of `word1`, for all WordNet lemmas of
+    `pos` and the extra `words`, as `get_neigh_wordnet` in
+    `src/old/get_neighbours.py` (a pair is yielded once per occurrence,
+    e.g. once per shared synset for `wn_syn`)."""
+    related_lemmas = _RELATED_LEMMAS[relation]
+    for word1 in sorted(set(wn.all_lemma_names(pos)) | set(words)):
+        for synset in wn.synsets(word1, pos):
+            for lemma in related_lemmas(synset):
+                yield word1, lemma.name()
@@ -45,7 +45,8 @@ parser = argparse.ArgumentParser(description="""
         of each proposed synonym.
         """)
 parser.add_argument("-a", "--out-all-stats", action="store_true",
-        help="""Output statistics regarding the prediction of syn0.""")
+        help="""Output statistics regarding the prediction of syn0
+        (accuracy, mean reciprocal rank and empty entries).""")
 parser.add_argument("-s", "--out-similarity", action="store_true",
         help="""Output path_similarity for each synK.""")
 parser.add_argument("-d", "--default", default="?",
@@ -62,9 +63,10 @@ class Main(object):
         self.n_lines = 0
         self.n_correct = 0
         self.n_empty = 0
+        self.syn0_positions = []  # Position of syn0 among the synK of each line
 
     def run(self):
-        self.thesaurus = csv.parse_csv(
+        self.thesaurus = csv.parse_csv_batches(
                 Thesaurus(self.args.column_name),
                 self.args.thesaurus_file)
         for line_num, line in enumerate(sys.stdin):
@@ -72,6 +74,8 @@ class Main(object):
             self.treat_line(line, line_num)
         if self.args.out_all_stats:
             print("Accuracy: {:2.2f}%".format(100 * self.n_correct/self.n_lines))
+            print("MRR: {:2.2f}%".format(100 * sum(1 / position
+                    for position in self.syn0_positions) / self.n_lines))
             print("Empty: {:2.2f}%".format(100 * self.n_empty/self.n_lines))
 
     def treat_line(self, line, line_num):
@@ -86,19 +90,23 @@ class Main(object):
 
         self.n_lines += 1
         # (We penalize sim0 for being as good as another one)
-        if all(similarities[0] > s for s in similarities[1:]):
+        position = 1 + sum(not similarities[0] > s for s in similarities[1:])
+        if position == 1:
             self.n_correct += 1  # syn0 was better
+        self.syn0_positions.append(position)
         self.n_empty += (similarities[0] is None)
 
 
 class Thesaurus(csv.CSVHandler):
     def __init__(self, column_name):
         self.column_name = column_name
+        self.columns = ["target", "neighbor", column_name]
         self.mapping = {}
 
-    def handle_data(self, line, data_namedtuple):
-        self.mapping[(data_namedtuple.target, data_namedtuple.neighbor)] \
-                = float(getattr(data_namedtuple, self.column_name))
+    def handle_batch(self, batch):
+        self.mapping.update(zip(
+                zip(batch.strings("target"), batch.strings("neighbor")),
+                batch.floats(self.column_name).tolist()))
 
     def __getitem__(self, target_and_neighbor):
         return self.mapping.get(target_and_neighbor, None)
@@ -0,0 +1,130 @@
+#! /usr/bin/env python
+
+# minimantics: minimalist tool for count-based distributional semantic models
+#
+#    Copyright (C) 2015  Carlos Ramisch, Silvio Ricardo Cordeiro
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import absolute_import
+
+import argparse
+import codecs
+import multiprocessing
+import numpy
+import os
+import sys
+
+from lib import embeddings
+
+FILE_ENC = "UTF-8"
+HERE = os.path.dirname(os.path.realpath(__file__))
+
+
+parser = argparse.ArgumentParser(description="""
+        Output the K nearest neighbors of each target in a word2vec
+        embeddings file, by cosine, as a minimantics-style CSV file with
+        columns `target neighbor w2v_cosine rank`.
+
+        Cosines are calculated for blocks of targets at a time, as a
+        matrix product against all (normalized) embeddings.""")
+parser.add_argument("-k", "--best-k", type=int, default=10,
+        help="""Output the K best neighbors of each target (default: 10).""")
+parser.add_argument("-t", "--targets", type=argparse.FileType("r"),
+        default=None,
+        help="""File with one target per line (default: all words in the
+        embeddings file). Targets without embedding are skipped.""")
+parser.add_argument("-b", "--block-size", type=int, default=None,
+        help="""Number of targets compared at once (default: adapted to
+        the number of words).""")
+parser.add_argument("-T", "--threads", type=int, default=1,
+        help="""Run this number of worker processes (default: 1).
+        Blocks of targets are processed in parallel and output in order.""")
+parser.add_argument("--binary", action="store_true", default=None,
+        help="""The embeddings file is in binary word2vec format
+        (default: only if its name ends in `.bin`).""")
+parser.add_argument("--no-cache", dest="use_cache", action="store_false",
+        help="""Do not read or write the `<embeddings_file>.npy` cache.""")
+parser.add_argument("embeddings_file",
+        help="""A file of embeddings: each line has 'word x1 x2 x2 ... xN'""")
+
+
+#####################################################
+
+_embedding_set = None  # Set in each worker process
+_best_k = None
+
+def init_worker(embedding_set, best_k):
+    global _embedding_set, _best_k
+    _embedding_set, _best_k = embedding_set, best_k
+
+
+def neighbors_block(rows):
+    r"""Return the output lines (as one unicode string) for target `rows`."""
+    words = _embedding_set.words
+    neighbors, cosines = _embedding_set.nearest_rows(rows, _best_k)
+    return "".join("{}\t{}\t{:.10f}\t{}\n".format(words[row],
+            words[neighbor], cosine, rank)
+            for (row, row_neighbors, row_cosines)
+            in zip(rows, neighbors.tolist(), cosines.tolist())
+            for (rank, (neighbor, cosine))
+            in enumerate(zip(row_neighbors, row_cosines), 1))
+
+
+def main():
+    sys.stdout = codecs.getwriter(FILE_ENC)(sys.stdout)
+    sys.stderr = codecs.getwriter(FILE_ENC)(sys.stderr)
+
+    args = parser.parse_args()
+    embedding_set = embeddings.EmbeddingSet.load(args.embeddings_file,
+            binary=args.binary, use_cache=args.use_cache)
+    if args.targets is None:
+        rows = numpy.arange(len(embedding_set))
+    else:
+        rows = embedding_set.rows(line.decode(FILE_ENC).strip()
+                for line in args.targets)
+        if (rows < 0).any():
+            print("WARNING: Skipping {} targets without embedding".format(
+                    (rows < 0).sum()), file=sys.stderr)
+        rows = rows[rows >= 0]
+
+    block_size = args.block_size or max(1, embeddings.DEFAULT_BLOCK_CELLS
+            // max(len(embedding_set), 1))
+    blocks = [rows[i:i+block_size] for i in xrange(0, len(rows), block_size)]
+    print("target", "neighbor", "w2v_cosine", "rank", sep="\t")
+    if args.threads > 1:
+        # Workers are forked: they share the (memory-mapped) embeddings
+        pool = multiprocessing.Pool(args.threads, init_worker,
+                (embedding_set, args.best_k))
+        try:
+            for output in pool.imap(neighbors_block, blocks):
+                sys.stdout.write(output)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        init_worker(embedding_set, args.best_k)
+        for block in blocks:
+            sys.stdout.write(neighbors_block(block))
+
+
+#####################################################
+
+if __name__ == "__main__":
+    main()